@@ -0,0 +1,22 @@
+import importlib.util
+import sys
+
+
+def lazy_import(name):
+    """
+    The module ``name``, executed on first attribute access instead of at
+    import time, or ``None`` when it is not installed. For heavy optional
+    dependencies (NumPy) of modules every worker imports at startup through
+    the URLconf, but only a few requests use.
+    """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        return None
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
@@ -0,0 +1,14 @@
+from rest_framework.parsers import BaseParser
+
+
+class NDJSONParser(BaseParser):
+    """
+    Newline delimited JSON. Parses to an iterator over the raw lines, so
+    that large bodies are consumed as they are read instead of all at once.
+    """
+    media_type = 'application/x-ndjson'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        if stream is None:
+            return iter(())
+        return iter(stream)
@@ -0,0 +1,58 @@
+"""
+Gunicorn configuration for the production run profile.
+
+    gunicorn -c config/gunicorn.conf.py
+
+Everything is driven by the ``SERVER_*`` settings in ``config/settings/base.py``
+(overridable through the environment), so switching between the sync,
+gthread and uvicorn worker models is a matter of setting
+``SERVER_WORKER_CLASS``.
+"""
+
+import os
+
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "config.settings.pro")
+
+from django.conf import settings  # noqa: E402
+
+from config.server import (  # noqa: E402
+    autotune_threads,
+    autotune_workers,
+    available_cpus,
+    resolve_worker_class,
+)
+
+worker_class, wsgi_app = resolve_worker_class(settings.SERVER_WORKER_CLASS)
+
+bind = settings.SERVER_BIND
+workers = autotune_workers(
+    settings.SERVER_WORKER_CLASS,
+    available_cpus(),
+    configured=settings.SERVER_WORKERS,
+    cap=settings.SERVER_WORKERS_CAP,
+)
+threads = autotune_threads(settings.SERVER_WORKER_CLASS, configured=settings.SERVER_THREADS)
+
+# Import the application once in the master so workers share its memory
+# pages copy-on-write instead of each importing Django on their own.
+preload_app = settings.SERVER_PRELOAD_APP
+
+# Recycle workers periodically to contain slow memory growth; the jitter
+# keeps them from all restarting at the same moment.
+max_requests = settings.SERVER_MAX_REQUESTS
+max_requests_jitter = settings.SERVER_MAX_REQUESTS_JITTER
+
+timeout = settings.SERVER_TIMEOUT
+graceful_timeout = settings.SERVER_TIMEOUT
+keepalive = 5
+
+accesslog = "-"
+errorlog = "-"
+
+
+def post_fork(server, worker):
+    # Connections opened in the master while preloading must not be shared
+    # between forked workers.
+    from django.db import connections
+
+    connections.close_all()
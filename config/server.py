@@ -0,0 +1,70 @@
+"""
+Sizing helpers for the production application server.
+
+Used by ``config/gunicorn.conf.py`` to turn the ``SERVER_*`` settings into
+a gunicorn configuration. A value of ``0`` for workers or threads means
+"size it from the number of CPUs available to this process".
+"""
+
+import os
+
+WORKER_CLASSES = {
+    # name: (gunicorn worker class, application entry point)
+    "sync": ("sync", "config.wsgi:application"),
+    "gthread": ("gthread", "config.wsgi:application"),
+    "uvicorn": ("uvicorn_worker.UvicornWorker", "config.asgi:application"),
+}
+
+
+def available_cpus():
+    """Number of CPUs this process may run on (respects container cpusets)."""
+    if hasattr(os, "sched_getaffinity"):
+        return max(len(os.sched_getaffinity(0)), 1)
+    return os.cpu_count() or 1
+
+
+def resolve_worker_class(name):
+    """
+    Map a ``SERVER_WORKER_CLASS`` value to the gunicorn worker class and the
+    WSGI/ASGI application it should serve.
+    """
+    try:
+        return WORKER_CLASSES[name]
+    except KeyError:
+        raise ValueError(
+            f"Unknown SERVER_WORKER_CLASS {name!r}, expected one of {sorted(WORKER_CLASSES)}"
+        )
+
+
+def autotune_workers(worker_class, cpus, configured=0, cap=0):
+    """
+    Number of worker processes for the given worker model.
+
+    - sync: the classic ``2 * cpus + 1``, since each worker blocks on I/O.
+    - gthread: ``cpus + 1``, threads cover the I/O wait instead of processes.
+    - uvicorn: one event loop per CPU.
+
+    An explicit ``configured`` value wins; ``cap`` bounds the result so the
+    total number of DB connections stays within what Postgres allows.
+    """
+    resolve_worker_class(worker_class)
+    if configured > 0:
+        workers = configured
+    elif worker_class == "sync":
+        workers = 2 * cpus + 1
+    elif worker_class == "gthread":
+        workers = cpus + 1
+    else:
+        workers = cpus
+
+    if cap > 0:
+        workers = min(workers, cap)
+    return max(workers, 1)
+
+
+def autotune_threads(worker_class, configured=0):
+    """Threads per worker; only the gthread model runs more than one."""
+    resolve_worker_class(worker_class)
+    if worker_class != "gthread":
+        return 1
+    return configured if configured > 0 else 4
@@ -48,6 +48,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "core.profiling.ProfilingMiddleware",
+    "core.compression.CompressionMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -137,6 +139,20 @@ STATIC_URL = "static/"
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+REST_FRAMEWORK = {
+    "DEFAULT_RENDERER_CLASSES": [
+        "common.renderers.ORJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    # Reverse proxies in front of the app; clients are identified (throttling) by the X-Forwarded-For
+    # entry the outermost one added. 0: REMOTE_ADDR, X-Forwarded-For is never trusted
+    "NUM_PROXIES": int(os.getenv("NUM_PROXIES", 0)),
+}
+
+# Negotiated response compression, zstd/br/gzip (see core/compression.py)
+COMPRESSION_ENABLED = os.getenv("COMPRESSION_ENABLED", "1") == "1"
+COMPRESSION_MIN_BYTES = int(os.getenv("COMPRESSION_MIN_BYTES", 1024))  # smaller bodies are sent as they are
+
 
 CACHES = {
     "default": {
@@ -146,4 +162,110 @@ CACHES = {
             "CLIENT_CLASS": "django_redis.client.DefaultClient",
         }
     }
-}
\ No newline at end of file
+}
+
+# AppUser list response cache and warming (see core/cache.py, core/warming.py)
+LIST_CACHE_TIMEOUT = int(os.getenv("LIST_CACHE_TIMEOUT", 60 * 10))
+LOCAL_CACHE_MAX_BYTES = int(os.getenv("LOCAL_CACHE_MAX_BYTES", 32 * 1024 * 1024))  # 0 disables the local tier
+LOCAL_CACHE_MAX_ENTRY_BYTES = int(os.getenv("LOCAL_CACHE_MAX_ENTRY_BYTES", 2 * 1024 * 1024))
+LOCAL_CACHE_TTL = float(os.getenv("LOCAL_CACHE_TTL", 5))
+# HTTP caching of list responses: "private" lets only the client keep pages; "public" also shared caches
+# (CDN, reverse proxy), opt in only where they may hold customer data (names, phone numbers, birthdays)
+LIST_HTTP_CACHE_SCOPE = os.getenv("LIST_HTTP_CACHE_SCOPE", "private")
+LIST_HTTP_MAX_AGE = int(os.getenv("LIST_HTTP_MAX_AGE", 0))  # seconds reused without revalidating (ETag)
+CACHE_GENERATION_CHECK_INTERVAL = float(os.getenv("CACHE_GENERATION_CHECK_INTERVAL", 1))
+CACHE_WARM_TRACK_REQUESTS = os.getenv("CACHE_WARM_TRACK_REQUESTS", "1") == "1"
+CACHE_WARM_MAX_SIGNATURES = int(os.getenv("CACHE_WARM_MAX_SIGNATURES", 1000))
+# Seconds request counts are batched per process before they are added in Redis
+CACHE_WARM_FLUSH_INTERVAL = float(os.getenv("CACHE_WARM_FLUSH_INTERVAL", 10))
+CACHE_WARM_TOP_N = int(os.getenv("CACHE_WARM_TOP_N", 50))
+CACHE_WARM_CONCURRENCY = int(os.getenv("CACHE_WARM_CONCURRENCY", 2))
+CACHE_WARM_REFRESH_BEFORE = int(os.getenv("CACHE_WARM_REFRESH_BEFORE", 120))  # seconds of TTL left
+
+
+# Cost-weighted rate limiting of the list endpoint, per client (see core/throttling.py); off by default:
+# behind a proxy or NAT, set NUM_PROXIES first, or every client shares one bucket and THROTTLE_MAX_CONCURRENT
+THROTTLE_ENABLED = os.getenv("THROTTLE_ENABLED", "0") == "1"
+THROTTLE_RATE = float(os.getenv("THROTTLE_RATE", 20))  # tokens refilled per second
+THROTTLE_BURST = float(os.getenv("THROTTLE_BURST", 200))  # bucket size
+THROTTLE_CACHE_HIT_COST = float(os.getenv("THROTTLE_CACHE_HIT_COST", 1))  # tokens kept for a cached page
+THROTTLE_MAX_CONCURRENT = int(os.getenv("THROTTLE_MAX_CONCURRENT", 4))  # requests in flight, 0 = no cap
+THROTTLE_SLOT_TTL = int(os.getenv("THROTTLE_SLOT_TTL", 60))  # seconds before a leaked slot is reclaimed
+
+
+# Maximum number of identifiers accepted by POST /api/v1/appusers/lookup/
+LOOKUP_MAX_IDS = int(os.getenv("LOOKUP_MAX_IDS", 5000))
+
+
+# Width of the points ranges reported by the analytics endpoint
+ANALYTICS_POINTS_BUCKET_SIZE = int(os.getenv("ANALYTICS_POINTS_BUCKET_SIZE", 1000))
+
+
+# Columnar snapshot for segment sizing (see core/snapshot.py, requires NumPy)
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", str(BASE_DIR.parent / "var" / "snapshot"))
+SNAPSHOT_MAX_AGE = int(os.getenv("SNAPSHOT_MAX_AGE", 60 * 15))  # seconds before falling back to the DB
+
+
+# Roaring bitmap index for the low-cardinality filters (see core/bitmaps.py, requires pyroaring);
+# off by default, and even when on only used by list requests asking for it with ?index=bitmap
+BITMAP_INDEX_ENABLED = os.getenv("BITMAP_INDEX_ENABLED", "0") == "1"
+BITMAP_POINTS_BUCKET_SIZE = int(os.getenv("BITMAP_POINTS_BUCKET_SIZE", 1000))
+
+
+# Autocomplete over names, customer ids and cities (see core/autocomplete.py)
+AUTOCOMPLETE_MIN_LENGTH = int(os.getenv("AUTOCOMPLETE_MIN_LENGTH", 2))  # shorter queries return nothing
+AUTOCOMPLETE_MAX_LIMIT = int(os.getenv("AUTOCOMPLETE_MAX_LIMIT", 50))
+AUTOCOMPLETE_MAX_TERMS = int(os.getenv("AUTOCOMPLETE_MAX_TERMS", 200000))  # distinct values held per field
+AUTOCOMPLETE_REFRESH_INTERVAL = float(os.getenv("AUTOCOMPLETE_REFRESH_INTERVAL", 30))  # seconds
+AUTOCOMPLETE_REBUILD_INTERVAL = float(os.getenv("AUTOCOMPLETE_REBUILD_INTERVAL", 60 * 60))  # seconds
+
+
+# Change feed for incremental sync (see core/changes.py)
+CHANGES_PAGE_SIZE = int(os.getenv("CHANGES_PAGE_SIZE", 500))
+CHANGES_MAX_PAGE_SIZE = int(os.getenv("CHANGES_MAX_PAGE_SIZE", 5000))
+CHANGES_SETTLE_SECONDS = int(os.getenv("CHANGES_SETTLE_SECONDS", 5))  # longer than any write transaction
+CHANGES_TOMBSTONE_RETENTION_DAYS = int(os.getenv("CHANGES_TOMBSTONE_RETENTION_DAYS", 30))
+
+
+# CustomerRelationship partitioning (PostgreSQL, see core/partitions.py)
+RELATIONSHIP_PARTITION_MONTHS_AHEAD = int(os.getenv("RELATIONSHIP_PARTITION_MONTHS_AHEAD", 3))
+# Only prefetch relationships created in the last N days, so old partitions are skipped; 0 = all
+RELATIONSHIP_PREFETCH_WINDOW_DAYS = int(os.getenv("RELATIONSHIP_PREFETCH_WINDOW_DAYS", 0))
+
+
+# Bulk NDJSON ingestion (see core/ingest.py)
+INGEST_BATCH_SIZE = int(os.getenv("INGEST_BATCH_SIZE", 1000))  # rows per transaction
+INGEST_MAX_ROWS = int(os.getenv("INGEST_MAX_ROWS", 100000))  # per request
+
+
+# Background jobs (see core/jobs.py); JOBS_BACKEND "redis", or "memory" for tests and single-process use
+JOBS_BACKEND = os.getenv("JOBS_BACKEND", "redis")
+JOBS_WORKER_CONCURRENCY = int(os.getenv("JOBS_WORKER_CONCURRENCY", 2))  # jobs run at once per run_jobs
+JOBS_RESULT_TTL = int(os.getenv("JOBS_RESULT_TTL", 7 * 24 * 60 * 60))  # seconds finished jobs are kept
+JOBS_LEASE_SECONDS = int(os.getenv("JOBS_LEASE_SECONDS", 60))  # without a heartbeat, a job's worker counts as dead
+
+
+# Sampling profiler for slow requests (see core/profiling.py); off unless enabled
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "0") == "1"
+PROFILING_SAMPLE_RATE = float(os.getenv("PROFILING_SAMPLE_RATE", 0))  # fraction of requests profiled
+PROFILING_SLOW_MS = float(os.getenv("PROFILING_SLOW_MS", 0))  # also keep watched requests slower than this, 0 = off
+PROFILING_SLOW_SAMPLE_RATE = float(os.getenv("PROFILING_SLOW_SAMPLE_RATE", 0.1))  # fraction of requests watched for PROFILING_SLOW_MS
+PROFILING_INTERVAL_MS = float(os.getenv("PROFILING_INTERVAL_MS", 5))  # stack sampling interval
+PROFILING_PATH_PREFIX = os.getenv("PROFILING_PATH_PREFIX", "/api/")
+PROFILING_STORAGE = os.getenv("PROFILING_STORAGE", "directory")  # "directory" or "redis"
+PROFILING_DIR = os.getenv("PROFILING_DIR", str(BASE_DIR.parent / "var" / "profiles"))
+PROFILING_MAX_PROFILES = int(os.getenv("PROFILING_MAX_PROFILES", 200))
+PROFILING_TTL = int(os.getenv("PROFILING_TTL", 7 * 24 * 60 * 60))  # seconds, Redis storage
+
+
+# Production application server (see config/gunicorn.conf.py)
+# SERVER_WORKER_CLASS: "sync", "gthread" or "uvicorn"
+SERVER_WORKER_CLASS = os.getenv("SERVER_WORKER_CLASS", "gthread")
+SERVER_BIND = os.getenv("SERVER_BIND", "0.0.0.0:8000")
+SERVER_WORKERS = int(os.getenv("SERVER_WORKERS", 0))  # 0 = size from CPU count
+SERVER_WORKERS_CAP = int(os.getenv("SERVER_WORKERS_CAP", 16))  # keep DB connections bounded
+SERVER_THREADS = int(os.getenv("SERVER_THREADS", 0))  # 0 = size from worker class
+SERVER_PRELOAD_APP = os.getenv("SERVER_PRELOAD_APP", "1") == "1"
+SERVER_MAX_REQUESTS = int(os.getenv("SERVER_MAX_REQUESTS", 2000))
+SERVER_MAX_REQUESTS_JITTER = int(os.getenv("SERVER_MAX_REQUESTS_JITTER", 200))
+SERVER_TIMEOUT = int(os.getenv("SERVER_TIMEOUT", 30))
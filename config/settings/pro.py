@@ -0,0 +1,13 @@
+from .base import *
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host for host in os.getenv("ALLOWED_HOSTS", "").split(",") if host]
+
+# Persistent connections pay off for the sync and gthread workers. Under the
+# uvicorn worker each request may run on a different thread, so connections
+# are closed after every request unless explicitly configured.
+DATABASES["default"]["CONN_MAX_AGE"] = int(
+    os.getenv("DB_CONN_MAX_AGE", 0 if SERVER_WORKER_CLASS == "uvicorn" else 60)
+)
+DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
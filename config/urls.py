@@ -18,8 +18,6 @@ Including another URLconf
 from django.conf import settings
 from django.contrib import admin
 from django.urls import include, path
-from drf_yasg.views import get_schema_view
-from drf_yasg import openapi
 
 api_patterns = [
     path("", include("core.urls")),
@@ -31,7 +29,11 @@ urlpatterns = [
 ]
 
 if settings.DEBUG:
+    # Development only, and slow to import
     import debug_toolbar
+    from drf_yasg import openapi
+    from drf_yasg.views import get_schema_view
+
     urlpatterns += [
         path('__debug__/', include(debug_toolbar.urls)),
     ]
@@ -0,0 +1,188 @@
+"""
+Grouped counts over AppUser for the analytics endpoint.
+
+Each dimension is counted either live, against the filtered AppUser
+queryset, or from the ``AppUserRollup`` table. Rollups hold unfiltered
+counts and are maintained incrementally: every refresh only aggregates the
+source rows with an id above the dimension's ``RollupWatermark`` and adds
+them to the stored counts, so keeping them current costs a scan of the new
+rows rather than of the whole table.
+
+Updates and deletes of existing rows cannot be folded in that way (the
+bucket a row was counted in is gone), so they mark the rollups of the
+dimensions they can move (``mark_changed``, from the signals and from bulk
+upserts). A rollup changed since its last rebuild is not served, the
+endpoint aggregates live instead, and the next refresh rebuilds it.
+
+A write marks at most once per ``CHANGES_SETTLE_SECONDS``, so busy write
+paths do not all update the same rows. A rebuild therefore counts as
+covering only the changes marked ``2 * CHANGES_SETTLE_SECONDS`` before it
+started: a write marked up to then may have committed after the rebuild
+read the rows (writes commit within ``CHANGES_SETTLE_SECONDS``), or have
+skipped marking because of a mark that much older.
+
+``points_bucket`` counts relationships (activity records) per points range,
+the other dimensions count users.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, ExpressionWrapper, F, IntegerField, Max
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from core.filters import build_appuser_filters
+from core.models import Address, AppUser, AppUserRollup, CustomerRelationship, RollupWatermark
+
+DIMENSIONS = ("country", "gender", "signup_month", "points_bucket")
+# Model -> dimensions an update or delete of one of its rows can move
+CHANGED_BY = {
+    AppUser: ("country", "gender", "signup_month"),
+    Address: ("country",),
+    CustomerRelationship: ("points_bucket",),
+}
+
+
+def _source(dimension):
+    """``(model, bucket expression, label function)`` for a dimension."""
+    if dimension == "country":
+        return AppUser, F("address__country"), str
+    if dimension == "gender":
+        return AppUser, F("gender"), str
+    if dimension == "signup_month":
+        return AppUser, TruncMonth("created"), lambda value: value.strftime("%Y-%m")
+    if dimension == "points_bucket":
+        size = settings.ANALYTICS_POINTS_BUCKET_SIZE
+        expression = ExpressionWrapper((F("points") / size) * size, output_field=IntegerField())
+        return CustomerRelationship, expression, lambda value: f"{value}-{value + size - 1}"
+    raise ValueError(f"Unknown dimension {dimension!r}, expected one of {', '.join(DIMENSIONS)}")
+
+
+def _sorted(dimension, rows):
+    # Ranges read best in their natural order, categories by size
+    if dimension == "points_bucket":
+        return sorted(rows, key=lambda row: int(row["value"].split("-")[0]))
+    if dimension == "signup_month":
+        return sorted(rows, key=lambda row: row["value"])
+    return sorted(rows, key=lambda row: (-row["count"], row["value"]))
+
+
+def _aggregate(dimension, queryset):
+    """``{bucket label: count}`` for the rows of ``queryset``."""
+    _, expression, label = _source(dimension)
+    # Relationship filters join AppUser to several rows, count each user once
+    count = Count("id", distinct=queryset.model is AppUser)
+    rows = queryset.annotate(bucket=expression).values("bucket").annotate(count=count).order_by()
+    return {
+        label(row["bucket"]): row["count"]
+        for row in rows
+        if row["bucket"] is not None
+    }
+
+
+def live_counts(dimension, params):
+    """Counts for ``dimension`` over the AppUsers matching the list filters in ``params``."""
+    model, _, _ = _source(dimension)
+    users = AppUser.objects.filter(build_appuser_filters(params))
+    if model is CustomerRelationship:
+        queryset = CustomerRelationship.objects.filter(appuser__in=users.values("id"))
+    else:
+        queryset = users
+    counts = _aggregate(dimension, queryset)
+    return _sorted(dimension, [{"value": value, "count": count} for value, count in counts.items()])
+
+
+def mark_changed(model):
+    """Record that existing rows of ``model`` were updated or deleted."""
+    now = timezone.now()
+    recently = now - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    RollupWatermark.objects.filter(dimension__in=CHANGED_BY[model]).exclude(changed_at__gte=recently).update(
+        changed_at=now
+    )
+
+
+def is_stale(watermark):
+    """Whether rows were updated or deleted since the last rebuild of ``watermark``'s rollup."""
+    if watermark.changed_at is None:
+        return False
+    if watermark.rebuilt_at is None:
+        return True
+    return watermark.changed_at >= watermark.rebuilt_at - timedelta(seconds=2 * settings.CHANGES_SETTLE_SECONDS)
+
+
+def rollup_counts(dimension):
+    """
+    Counts for ``dimension`` from the rollup table, with the time of the
+    last refresh, or ``(None, None)`` if the rollup was never built or
+    misses updates or deletes of existing rows.
+    """
+    _source(dimension)
+    watermark = RollupWatermark.objects.filter(dimension=dimension).first()
+    if watermark is None or is_stale(watermark):
+        return None, None
+    rows = [
+        {"value": rollup.bucket, "count": rollup.count}
+        for rollup in AppUserRollup.objects.filter(dimension=dimension, count__gt=0)
+    ]
+    return _sorted(dimension, rows), watermark.refreshed_at
+
+
+def refresh_rollup(dimension, full=False):
+    """
+    Fold source rows added since the last refresh into the rollup of
+    ``dimension``, or rebuild it from scratch with ``full`` or when rows were
+    updated or deleted since the last rebuild. Returns the number of new
+    source rows seen.
+    """
+    model, _, _ = _source(dimension)
+    with transaction.atomic():
+        watermark, _ = RollupWatermark.objects.select_for_update().get_or_create(dimension=dimension)
+        now = timezone.now()
+        if full or is_stale(watermark):
+            AppUserRollup.objects.filter(dimension=dimension).delete()
+            watermark.last_id, watermark.pending_id, watermark.pending_at, watermark.tail = 0, None, None, {}
+            watermark.rebuilt_at = now
+
+        horizon = now - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+        settles = watermark.pending_at is not None and watermark.pending_at <= horizon
+        settled_id = watermark.pending_id if settles else watermark.last_id
+
+        max_id = model.objects.aggregate(max_id=Max("id"))["max_id"] or 0
+        above = _aggregate(dimension, model.objects.filter(id__gt=watermark.last_id, id__lte=max_id))
+        if settled_id == watermark.last_id:
+            tail = above
+        else:
+            tail = _aggregate(dimension, model.objects.filter(id__gt=settled_id, id__lte=max_id))
+        # What is above the old watermark, less what the previous refresh already counted of it
+        counts = Counter(above)
+        counts.subtract(watermark.tail)
+        counts = {bucket: count for bucket, count in counts.items() if count}
+
+        existing = {
+            rollup.bucket: rollup
+            for rollup in AppUserRollup.objects.filter(dimension=dimension, bucket__in=counts)
+        }
+        for bucket, count in counts.items():
+            if bucket in existing:
+                existing[bucket].count += count
+        AppUserRollup.objects.bulk_update(existing.values(), ["count"])
+        AppUserRollup.objects.bulk_create([
+            AppUserRollup(dimension=dimension, bucket=bucket, count=count)
+            for bucket, count in counts.items()
+            if bucket not in existing
+        ])
+
+        # Every source row has a bucket, so the counts add up to the rows
+        seen = sum(above.values()) - sum(watermark.tail.values())
+        watermark.last_id, watermark.tail = settled_id, tail
+        if settles or watermark.pending_at is None:
+            watermark.pending_id, watermark.pending_at = max_id, now
+        watermark.refreshed_at = now
+        # changed_at is written by the write paths concurrently, never here
+        watermark.save(update_fields=[
+            "last_id", "pending_id", "pending_at", "tail", "refreshed_at", "rebuilt_at",
+        ])
+    return seen
@@ -0,0 +1,309 @@
+"""
+Typo-tolerant prefix search over AppUser names, customer ids and cities,
+for agents looking a customer up keystroke by keystroke.
+
+Each process keeps a ``TermIndex``: the distinct values of ``first_name``,
+``last_name`` and the address ``city``, casefolded into one sorted array
+that ``bisect`` cuts a prefix range out of. Only the values are held, not
+the users, so memory is bounded by ``AUTOCOMPLETE_MAX_TERMS`` per field
+(the most common values are kept). The index is built from the database on
+first use and then refreshed every ``AUTOCOMPLETE_REFRESH_INTERVAL``
+seconds from the users updated since (``last_updated``, which address and
+relationship writes bump too). Values no user has anymore are only dropped
+by the full rebuild every ``AUTOCOMPLETE_REBUILD_INTERVAL`` seconds; until
+then they just match nobody.
+
+Building and refreshing run in a background thread, one at a time, and
+publish a new immutable ``Terms`` when done; requests never wait for them
+and read whichever ``Terms`` is current. Until the first build of a
+process is done, only customer ids match.
+
+``suggest`` splits the query into tokens, every one of which a user has to
+match in some field:
+
+- names and cities starting with the token, the most common
+  ``TERMS_PER_TOKEN`` of them
+- for tokens of ``TYPO_MIN_LENGTH`` or more characters, also names and
+  cities starting with one edit of it (a letter inserted, dropped,
+  replaced or two swapped), after the first letter
+- customer ids starting with the token, upper-cased, which PostgreSQL
+  answers from the ``varchar_pattern_ops`` index Django creates for the
+  unique ``customer_id`` (and for the name columns)
+
+The users are then fetched with one indexed ``IN`` query, prefix matches
+first and typo matches only to fill up the ``limit``.
+"""
+
+import bisect
+import heapq
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.models import AppUser
+
+logger = logging.getLogger(__name__)
+
+# Indexed field -> AppUser lookup
+FIELDS = {
+    "first_name": "first_name",
+    "last_name": "last_name",
+    "city": "address__city",
+}
+TERMS_PER_TOKEN = 500
+TYPO_MIN_LENGTH = 5
+CUSTOMER_ID_MIN_LENGTH = 3
+PREFIX, TYPO = "prefix", "typo"
+
+
+def _one_edit(a, b):
+    """Whether ``a`` and ``b`` are equal or one insertion, deletion, substitution or transposition apart."""
+    if a == b:
+        return True
+    if abs(len(a) - len(b)) > 1:
+        return False
+    i = 0
+    while i < min(len(a), len(b)) and a[i] == b[i]:
+        i += 1
+    if len(a) == len(b):
+        swapped = i + 1 < len(a) and a[i] == b[i + 1] and a[i + 1] == b[i] and a[i + 2:] == b[i + 2:]
+        return a[i + 1:] == b[i + 1:] or swapped
+    if len(a) > len(b):
+        return a[i + 1:] == b[i:]
+    return a[i:] == b[i + 1:]
+
+
+def _starts_with_typo(value, token):
+    """Whether ``value`` starts with a string one edit away from ``token``, keeping its first letter."""
+    return value[:1] == token[:1] and any(
+        _one_edit(value[:len(token) + offset], token) for offset in (-1, 0, 1)
+    )
+
+
+@dataclass(frozen=True)
+class Terms:
+    """
+    One state of the index. Never changed once published: refreshes build
+    a new one and swap it in, so readers need no lock.
+    """
+
+    keys: tuple  # sorted (casefolded value, field)
+    spellings: dict  # (casefolded value, field) -> sorted values as stored
+    counts: dict  # (casefolded value, field) -> users, as of the last rebuild
+    sizes: Counter  # field -> values held
+
+
+EMPTY = Terms((), {}, {}, Counter())
+
+
+class TermIndex:
+    """This process' sorted array of the distinct names and cities."""
+
+    def __init__(self):
+        self._terms = EMPTY
+        self._watermark = None
+        self._built_at = None
+        self._refreshed_at = None  # last attempt, failed or not
+        self._lock = threading.Lock()  # held by the refresh in progress
+
+    def __len__(self):
+        return len(self._terms.keys)
+
+    def clear(self):
+        with self._lock:
+            self._terms = EMPTY
+            self._watermark = self._built_at = self._refreshed_at = None
+
+    def _build(self):
+        watermark = timezone.now()
+        spellings, counts = defaultdict(set), defaultdict(int)
+        for field, lookup in FIELDS.items():
+            rows = (
+                AppUser.objects.values_list(lookup).annotate(users=Count("id"))
+                .order_by("-users")[:settings.AUTOCOMPLETE_MAX_TERMS]
+            )
+            for value, users in rows:
+                if value:
+                    spellings[value.casefold(), field].add(value)
+                    counts[value.casefold(), field] += users
+        keys = tuple(sorted(spellings))
+        self._terms = Terms(
+            keys, {key: tuple(sorted(values)) for key, values in spellings.items()}, dict(counts),
+            Counter(field for _, field in keys),
+        )
+        self._watermark = watermark
+        self._built_at = time.monotonic()
+
+    def _update(self):
+        """Add the values of the users updated since the last build or update."""
+        watermark = timezone.now()
+        # Overlaps the previous update a little, for transactions that committed late
+        since = self._watermark - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+        rows = AppUser.objects.filter(last_updated__gte=since).values_list(*FIELDS.values())
+        terms, added, sizes = self._terms, defaultdict(set), Counter(self._terms.sizes)
+        for values in rows.iterator(chunk_size=10000):
+            for field, value in zip(FIELDS, values):
+                if not value:
+                    continue
+                key = (value.casefold(), field)
+                if value in terms.spellings.get(key, ()):
+                    continue
+                if key in terms.spellings or key in added:
+                    added[key].add(value)
+                elif sizes[field] < settings.AUTOCOMPLETE_MAX_TERMS:
+                    added[key].add(value)
+                    sizes[field] += 1
+        if added:
+            new = sorted(key for key in added if key not in terms.spellings)
+            self._terms = Terms(
+                tuple(heapq.merge(terms.keys, new)),
+                {**terms.spellings, **{
+                    key: tuple(sorted(values.union(terms.spellings.get(key, ())))) for key, values in added.items()
+                }},
+                {**terms.counts, **dict.fromkeys(new, 1)},
+                sizes,
+            )
+        self._watermark = watermark
+
+    def _refresh(self):
+        now = self._refreshed_at = time.monotonic()
+        if self._built_at is None or now - self._built_at >= settings.AUTOCOMPLETE_REBUILD_INTERVAL:
+            self._build()
+        else:
+            self._update()
+
+    def _refresh_in_background(self):
+        try:
+            self._refresh()
+        except Exception:
+            logger.exception("Could not refresh the autocomplete index")
+        finally:
+            self._lock.release()
+            connections.close_all()
+
+    def refresh(self, wait=False):
+        """
+        Build the index on first use, then keep it current; at most every
+        refresh interval. Unless ``wait``, this only starts a background
+        thread doing it, requests meanwhile use the terms they have.
+        """
+        if self._refreshed_at is not None and (
+            time.monotonic() - self._refreshed_at < settings.AUTOCOMPLETE_REFRESH_INTERVAL
+        ):
+            return
+        if not self._lock.acquire(blocking=wait):
+            return  # already being refreshed
+        if not wait:
+            threading.Thread(target=self._refresh_in_background, name="autocomplete-refresh", daemon=True).start()
+            return
+        try:
+            self._refresh()
+        finally:
+            self._lock.release()
+
+    def prefix_terms(self, token):
+        """``{field: [stored values]}`` of the most common values starting with ``token``."""
+        terms = self._terms
+        start = bisect.bisect_left(terms.keys, (token,))
+        stop = bisect.bisect_left(terms.keys, (token + "\U0010ffff",), lo=start)
+        return self._most_common(terms, terms.keys[start:stop])
+
+    def typo_terms(self, token):
+        """``{field: [stored values]}`` of the values starting with one edit of ``token``, but not with it."""
+        terms = self._terms
+        start = bisect.bisect_left(terms.keys, (token[0],))
+        stop = bisect.bisect_left(terms.keys, (token[0] + "\U0010ffff",), lo=start)
+        return self._most_common(terms, [
+            key for key in terms.keys[start:stop]
+            if not key[0].startswith(token) and _starts_with_typo(key[0], token)
+        ])
+
+    def _most_common(self, terms, keys):
+        if len(keys) > TERMS_PER_TOKEN:
+            keys = heapq.nlargest(TERMS_PER_TOKEN, keys, key=terms.counts.__getitem__)
+        found = defaultdict(list)
+        for key in keys:
+            found[key[1]].extend(terms.spellings[key])
+        return dict(found)
+
+
+index = TermIndex()
+
+
+def tokenize(query):
+    return [token for token in query.casefold().split() if token]
+
+
+def _token_filter(token, terms, customer_ids=True):
+    """Users matching ``token`` through ``terms`` (or their customer id), ``None`` if nothing can match."""
+    q = Q()
+    for field, values in terms.items():
+        q |= Q(**{f"{FIELDS[field]}__in": values})
+    if customer_ids and len(token) >= CUSTOMER_ID_MIN_LENGTH:
+        q |= Q(customer_id__startswith=token.upper())
+    return q or None
+
+
+def _fetch(filters, limit, exclude=()):
+    q = Q()
+    for token_filter in filters:
+        q &= token_filter
+    users = (
+        AppUser.objects.filter(q).exclude(id__in=exclude).order_by()
+        .values_list("id", "customer_id", "first_name", "last_name", "address__city")[:limit]
+    )
+    return [
+        {"id": user_id, "customer_id": customer_id, "first_name": first_name,
+         "last_name": last_name, "city": city}
+        for user_id, customer_id, first_name, last_name, city in users
+    ]
+
+
+def _rank(results, tokens):
+    """Sort ``results``: users with a token matching a whole value first, then by name."""
+    def key(result):
+        values = {
+            result[field].casefold() for field in ("first_name", "last_name", "city", "customer_id") if result[field]
+        }
+        exact = sum(token in values for token in tokens)
+        return (-exact, result["last_name"], result["first_name"], result["id"])
+    return sorted(results, key=key)
+
+
+def suggest(query, limit):
+    """
+    Up to ``limit`` users matching every token of ``query``, prefix matches
+    first, as ``{"id", "customer_id", "first_name", "last_name", "city",
+    "match"}`` with ``match`` either ``"prefix"`` or ``"typo"``.
+    """
+    tokens = tokenize(query)
+    if len("".join(tokens)) < settings.AUTOCOMPLETE_MIN_LENGTH or limit < 1:
+        return []
+    index.refresh()
+
+    results = []
+    prefix_filters = [_token_filter(token, index.prefix_terms(token)) for token in tokens]
+    if None not in prefix_filters:
+        results = [{**user, "match": PREFIX} for user in _rank(_fetch(prefix_filters, limit), tokens)]
+    if len(results) == limit or not any(len(token) >= TYPO_MIN_LENGTH for token in tokens):
+        return results
+
+    # Fill up with users matching some tokens only through a typo
+    typo_filters = []
+    for token, prefix_filter in zip(tokens, prefix_filters):
+        typo_filter = None
+        if len(token) >= TYPO_MIN_LENGTH:
+            typo_filter = _token_filter(token, index.typo_terms(token), customer_ids=False)
+        if prefix_filter is None and typo_filter is None:
+            return results
+        typo_filters.append(prefix_filter if typo_filter is None else typo_filter | (prefix_filter or Q()))
+    found = _fetch(typo_filters, limit - len(results), exclude=[result["id"] for result in results])
+    return results + [{**user, "match": TYPO} for user in _rank(found, tokens)]
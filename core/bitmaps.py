@@ -0,0 +1,343 @@
+"""
+Roaring bitmap index over AppUser ids for the low-cardinality list filters.
+
+One bitmap of user ids is kept per value of each indexed attribute:
+
+- ``gender``
+- ``country`` of the user's address
+- ``points`` bucket (``BITMAP_POINTS_BUCKET_SIZE`` wide) of any of the
+  user's relationships
+- ``all``, every user
+
+Bitmaps are persisted in Redis, one hash per bitmap with a field per 2**16
+id range holding that part serialized, so a write only rewrites the few KB
+of the range the user falls in. A version counter per bitmap lets every
+process keep decoded bitmaps in memory and reload only those that changed,
+checking at most every ``CACHE_GENERATION_CHECK_INTERVAL`` seconds.
+
+``build_bitmaps`` builds the index from the database; afterwards signal
+receivers (core/signals.py) apply every committed save and delete. Bulk
+writes (``bulk_create``, ``QuerySet.update``, raw SQL) send no signals and
+need another ``build_bitmaps`` run; until then the index misses their rows.
+Until it is built, and with ``BITMAP_INDEX_ENABLED`` off (the default),
+writes do no bitmap work at all.
+
+``match`` answers a combination of ``gender``, ``country`` and bucket
+aligned ``points_min``/``points_max`` filters as bitmap AND/ORs, ``None``
+for any other filter, in which case callers use the database. Since the
+index can lag behind bulk writes, the list endpoints only take counts and
+pages from it for requests that opt in with ``?index=bitmap``.
+"""
+
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from core.cache import is_django_redis, redis_connection
+from core.filters import active_filter_params
+from core.models import AppUser, CustomerRelationship
+
+try:
+    from pyroaring import BitMap64
+except ImportError:  # optional dependency, see pyproject.toml
+    BitMap64 = None
+
+BITMAP_KEY_PREFIX = "appusers:bitmap:"
+VERSIONS_KEY = "appusers:bitmap-versions"
+ALL_FIELD = "all:"
+SUPPORTED_FILTERS = {"gender", "country", "points_min", "points_max"}
+RELATIONSHIP_FILTERS = {"points_min", "points_max"}
+CHUNK_BITS = 16
+# Query parameter with which a list request accepts counts and pages from the index
+OPT_IN_PARAM, OPT_IN_VALUE = "index", "bitmap"
+
+
+def is_available():
+    return BitMap64 is not None and settings.BITMAP_INDEX_ENABLED and is_django_redis()
+
+
+def _field(attribute, value):
+    return f"{attribute}:{value}"
+
+
+def _key(field):
+    return cache.make_key(f"{BITMAP_KEY_PREFIX}{field}")
+
+
+def _bucket(points):
+    return points // settings.BITMAP_POINTS_BUCKET_SIZE
+
+
+def memberships(user_ids=None):
+    """``{user id: {bitmap field, ...}}`` from the database, for all users when ``user_ids`` is None."""
+    users = AppUser.objects.values_list("id", "gender", "address__country").order_by()
+    relationships = CustomerRelationship.objects.values_list("appuser_id", "points").order_by()
+    if user_ids is not None:
+        users = users.filter(id__in=user_ids)
+        relationships = relationships.filter(appuser_id__in=user_ids)
+
+    fields = {}
+    for user_id, gender, country in users.iterator(chunk_size=50000):
+        fields[user_id] = {ALL_FIELD, _field("gender", gender), _field("country", country)}
+    for user_id, points in relationships.iterator(chunk_size=50000):
+        if user_id in fields:
+            fields[user_id].add(_field("points", _bucket(points)))
+    return fields
+
+
+def _chunks(bitmap):
+    """``{chunk number: serialized part}`` for the non-empty id ranges of ``bitmap``."""
+    if not bitmap:
+        return {}
+    parts = {}
+    for chunk in range(bitmap.min() >> CHUNK_BITS, (bitmap.max() >> CHUNK_BITS) + 1):
+        part = bitmap & BitMap64(range(chunk << CHUNK_BITS, (chunk + 1) << CHUNK_BITS))
+        if part:
+            parts[chunk] = part.serialize()
+    return parts
+
+
+def build():
+    """Rebuild every bitmap from the database. Returns the number of users indexed."""
+    ids = defaultdict(list)
+    users = memberships()
+    for user_id, fields in users.items():
+        for field in fields:
+            ids[field].append(user_id)
+
+    client = redis_connection()
+    previous = {field.decode() for field in client.hkeys(cache.make_key(VERSIONS_KEY))}
+    pipe = client.pipeline(transaction=True)
+    for field in previous | ids.keys():
+        pipe.delete(_key(field))
+        if field in ids:
+            pipe.hset(_key(field), mapping=_chunks(BitMap64(ids[field])))
+        # Versions only ever go up, so that readers notice a rebuild
+        pipe.hincrby(cache.make_key(VERSIONS_KEY), field, 1)
+    pipe.execute()
+    index.mark_built()
+    return len(users)
+
+
+def is_built():
+    """Whether the index was built, asked of Redis at most every ``CACHE_GENERATION_CHECK_INTERVAL`` seconds."""
+    return index.is_built()
+
+
+def apply_changes(previous, current):
+    """
+    Move users between bitmaps given their fields before (``previous``) and
+    after (``current``) a write; users missing from ``current`` were deleted.
+    """
+    changes = defaultdict(lambda: (BitMap64(), BitMap64()))  # field -> (added, removed)
+    for user_id in previous.keys() | current.keys():
+        before, after = previous.get(user_id, set()), current.get(user_id, set())
+        for field in after - before:
+            changes[field][0].add(user_id)
+        for field in before - after:
+            changes[field][1].add(user_id)
+
+    client = redis_connection()
+    for field, (added, removed) in changes.items():
+        key = _key(field)
+        chunks = sorted({user_id >> CHUNK_BITS for user_id in added | removed})
+
+        def update(pipe):
+            raw_parts = pipe.hmget(key, chunks)
+            pipe.multi()
+            for chunk, raw in zip(chunks, raw_parts):
+                part = BitMap64.deserialize(raw) if raw else BitMap64()
+                part |= BitMap64(user_id for user_id in added if user_id >> CHUNK_BITS == chunk)
+                part -= BitMap64(user_id for user_id in removed if user_id >> CHUNK_BITS == chunk)
+                if part:
+                    pipe.hset(key, chunk, part.serialize())
+                else:
+                    pipe.hdel(key, chunk)
+            pipe.hincrby(cache.make_key(VERSIONS_KEY), field, 1)
+
+        # Optimistic locking: retried if another process changed the bitmap meanwhile
+        client.transaction(update, key)
+
+
+def is_maintained():
+    """Whether writes must be applied to the index: it is enabled and has been built."""
+    return is_available() and is_built()
+
+
+def capture(user_ids):
+    """Current fields of ``user_ids``, taken before a write to pass to ``schedule_sync``."""
+    if not is_maintained():
+        return {}
+    return memberships([user_id for user_id in user_ids if user_id is not None])
+
+
+def schedule_sync(user_ids, previous):
+    """Bring the bitmaps of ``user_ids`` up to date once the current transaction commits."""
+    if not is_maintained():
+        return
+    user_ids = [user_id for user_id in user_ids if user_id is not None]
+
+    def sync():
+        if is_built():
+            apply_changes(previous, memberships(user_ids))
+
+    transaction.on_commit(sync)
+
+
+class BitmapIndex:
+    """This process' decoded copy of the bitmaps, reloaded per bitmap as versions change."""
+
+    def __init__(self):
+        self._bitmaps = {}
+        self._versions = {}
+        self._checked_at = None
+        self._built = None
+        self._built_checked_at = None
+        self._lock = threading.Lock()
+
+    def is_built(self):
+        now = time.monotonic()
+        if self._built_checked_at is None or now - self._built_checked_at >= settings.CACHE_GENERATION_CHECK_INTERVAL:
+            self._built = bool(redis_connection().hexists(cache.make_key(VERSIONS_KEY), ALL_FIELD))
+            self._built_checked_at = now
+        return self._built
+
+    def mark_built(self):
+        self._built, self._built_checked_at = True, time.monotonic()
+
+    def refresh(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._checked_at is not None and now - self._checked_at < settings.CACHE_GENERATION_CHECK_INTERVAL:
+                return
+            client = redis_connection()
+            versions = {
+                field.decode(): int(version)
+                for field, version in client.hgetall(cache.make_key(VERSIONS_KEY)).items()
+            }
+            changed = [field for field, version in versions.items() if self._versions.get(field) != version]
+            pipe = client.pipeline(transaction=False)
+            for field in changed:
+                pipe.hgetall(_key(field))
+            for field, parts in zip(changed, pipe.execute()):
+                bitmap = BitMap64()
+                for raw in parts.values():
+                    bitmap |= BitMap64.deserialize(raw)
+                self._bitmaps[field] = bitmap
+            for field in self._bitmaps.keys() - versions.keys():
+                del self._bitmaps[field]
+            self._versions = versions
+            self._checked_at = now
+
+    def clear(self):
+        with self._lock:
+            self._bitmaps, self._versions, self._checked_at = {}, {}, None
+            self._built = self._built_checked_at = None
+
+    def _union(self, attribute, predicate):
+        result = BitMap64()
+        for field, bitmap in self._bitmaps.items():
+            name, _, value = field.partition(":")
+            if name == attribute and predicate(value):
+                result |= bitmap
+        return result
+
+    def match(self, params):
+        """Bitmap of the users matching ``params``, or ``None`` if a filter is not indexed."""
+        if active_filter_params(params) - SUPPORTED_FILTERS:
+            return None
+        self.refresh()
+        if ALL_FIELD not in self._bitmaps:
+            return None
+
+        result = BitMap64(self._bitmaps[ALL_FIELD])
+        if (gender := params.get("gender")) and gender.strip():
+            result &= self._bitmaps.get(_field("gender", gender.strip()), BitMap64())
+
+        if (country := params.get("country")) and country.strip():
+            needle = country.strip().casefold()
+            result &= self._union("country", lambda value: needle in value.casefold())
+
+        # Whole buckets only; like the ORM filter, min and max apply to the same relationship
+        size = settings.BITMAP_POINTS_BUCKET_SIZE
+        low, high = None, None
+        if pts_min := params.get("points_min"):
+            try:
+                low = int(pts_min)
+            except (ValueError, TypeError):
+                pass
+        if pts_max := params.get("points_max"):
+            try:
+                high = int(pts_max)
+            except (ValueError, TypeError):
+                pass
+        if low is not None or high is not None:
+            if (low is not None and low % size) or (high is not None and (high + 1) % size):
+                return None
+            first = float("-inf") if low is None else low // size
+            last = float("inf") if high is None else (high + 1) // size - 1
+            result &= self._union("points", lambda value: first <= int(value) <= last)
+        return result
+
+
+index = BitmapIndex()
+
+
+def match(params):
+    if not is_available():
+        return None
+    return index.match(params)
+
+
+class IndexedResults:
+    """
+    Stand-in for a queryset handed to Django's ``Paginator``: the count
+    comes from a bitmap, and when ordered by id so do the ids of a page,
+    leaving the database only an ``id IN (...)`` lookup of one page.
+    """
+    ordered = True
+
+    def __init__(self, queryset, bitmap, descending=None):
+        self.queryset = queryset
+        self.bitmap = bitmap
+        self.descending = descending  # None: not ordered by id, page from ``queryset``
+
+    def count(self):
+        return len(self.bitmap)
+
+    def __len__(self):
+        return len(self.bitmap)
+
+    def __getitem__(self, index):
+        if self.descending is None:
+            return self.queryset[index]
+        start, stop, _ = index.indices(len(self.bitmap))
+        if self.descending:
+            start, stop = len(self.bitmap) - stop, len(self.bitmap) - start
+        ids = list(self.bitmap[start:stop])
+        # Re-applying the filters drops users changed since the bitmap was read
+        return self.queryset.filter(id__in=ids)
+
+
+def indexed_results(queryset, params):
+    """
+    ``IndexedResults`` for ``queryset`` filtered by ``params``, or ``None``
+    when the request did not opt in or the index cannot answer it.
+    """
+    if params.get(OPT_IN_PARAM) != OPT_IN_VALUE:
+        return None
+    bitmap = match(params)
+    if bitmap is None:
+        return None
+    ordering = list(queryset.query.order_by)
+    if ordering in (["id"], ["-id"]):
+        return IndexedResults(queryset, bitmap, descending=ordering == ["-id"])
+    # Paged from the queryset, which is not made distinct for these filters;
+    # its pages would not agree with a count of distinct users
+    if active_filter_params(params) & RELATIONSHIP_FILTERS:
+        return None
+    return IndexedResults(queryset, bitmap)
@@ -0,0 +1,578 @@
+"""
+Cache helpers for the AppUser list endpoints.
+
+List pages are cached in two tiers:
+
+- a small per-process LRU (``LocalCache``) holding pages encoded as they
+  are in Redis, bounded by the total size of those bytes and with a short
+  TTL (a hit still decodes the page, but makes no round trip), and
+- Redis, shared by all processes, through ``django_redis``.
+
+Keys embed a cache *generation*, a value kept in Redis and bumped whenever
+list pages must be invalidated. Processes re-read the generation at most
+every ``CACHE_GENERATION_CHECK_INTERVAL`` seconds, so after a bump every
+tier stops serving old entries within that interval; the old entries are
+never read again and simply age out.
+
+The async views use the ``a*`` variants, which talk to Redis over
+``redis.asyncio`` so that a cache round trip does not occupy a thread, while
+reading and writing the exact same keys and encoding as ``django_redis``.
+
+List responses carry a weak ``ETag`` (``page_etag``) kept with the cached
+page, so a matching ``If-None-Match`` is answered with a bodiless 304
+without serializing anything. One cached page is sent in every negotiated
+format, so the header is the page's tag combined with the format
+(``format_etag``): a client holding the JSON body cannot revalidate it
+against a columnar request.
+
+Alongside a page, ``set_page_bodies`` keeps its body pre-compressed (see
+core/compression.py) under ``<page key>::body:<encoding>``, so hits are
+sent without rendering or compressing anything.
+
+``delete_matching`` removes pages (or any keys) by pattern with SCAN and
+UNLINK, for invalidating part of the cache without a ``FLUSHDB``.
+
+Requests are also counted per signature (path plus canonical query string)
+in a sorted set, which the cache warmer uses to find the most popular pages.
+Counts are batched per process (``RequestCounts``) and added to the set at
+most every ``CACHE_WARM_FLUSH_INTERVAL`` seconds, so a request answered from
+the local tier makes no Redis call.
+"""
+
+import asyncio
+import hashlib
+import os
+import pickle
+import threading
+import time
+import weakref
+from collections import Counter, OrderedDict
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.http import parse_etags
+
+LIST_CACHE_PREFIX = "appusers::"
+POPULAR_SIGNATURES_KEY = "appusers:popular"
+GENERATION_KEY = "appusers:generation"
+
+# One asyncio Redis client per event loop; a client cannot be shared between loops.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class LocalCache:
+    """
+    Thread-safe LRU cache of bytes with a per-entry TTL, bounded by the
+    total size of its entries rather than their number. Entries larger than
+    ``max_entry_bytes`` (or empty) are not kept at all.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes, ttl):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()  # key -> (bytes, expires_at)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        size = len(value)
+        if not 0 < size <= min(self.max_entry_bytes, self.max_bytes):
+            return
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self.size += size
+            while self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        value, _ = self._entries.pop(key)
+        self.size -= len(value)
+
+
+class TierStats:
+    """Per-process hit counters for each cache tier."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    def record(self, tier):
+        with self._lock:
+            if tier == "local":
+                self.local_hits += 1
+            elif tier == "redis":
+                self.redis_hits += 1
+            else:
+                self.misses += 1
+
+    def as_dict(self):
+        lookups = self.local_hits + self.redis_hits + self.misses
+        redis_lookups = self.redis_hits + self.misses
+        return {
+            "pid": os.getpid(),
+            "lookups": lookups,
+            "local": {
+                "hits": self.local_hits,
+                "hit_ratio": self.local_hits / lookups if lookups else 0.0,
+                "entries": len(local_cache),
+                "bytes": local_cache.size,
+            },
+            "redis": {
+                "hits": self.redis_hits,
+                # Only lookups that got past the local tier reach Redis
+                "hit_ratio": self.redis_hits / redis_lookups if redis_lookups else 0.0,
+            },
+            "misses": self.misses,
+        }
+
+
+local_cache = LocalCache(
+    max_bytes=settings.LOCAL_CACHE_MAX_BYTES,
+    max_entry_bytes=settings.LOCAL_CACHE_MAX_ENTRY_BYTES,
+    ttl=settings.LOCAL_CACHE_TTL,
+)
+tier_stats = TierStats()
+
+# (generation, monotonic time it was read)
+_generation = (None, 0.0)
+
+
+def canonical_query(params):
+    """
+    Query string with parameters in a stable order, so that ``?a=1&b=2`` and
+    ``?b=2&a=1`` share one cache entry.
+    """
+    items = [
+        (key, value)
+        for key in sorted(params.keys())
+        for value in sorted(params.getlist(key) if hasattr(params, "getlist") else [params[key]])
+    ]
+    return urlencode(items)
+
+
+def request_signature(request):
+    query = canonical_query(request.GET)
+    return f"{request.path}?{query}" if query else request.path
+
+
+def list_cache_key(request, generation=None):
+    return signature_cache_key(request_signature(request), generation)
+
+
+def signature_cache_key(signature, generation=None):
+    if generation is None:
+        generation = current_generation()
+    return f"{LIST_CACHE_PREFIX}g{generation}::{signature}"
+
+
+def is_refresh_request(request):
+    """Requests issued by the cache warmer skip the cache read and re-render."""
+    return getattr(request, "cache_refresh", False)
+
+
+def redis_connection():
+    from django_redis import get_redis_connection
+
+    return get_redis_connection("default")
+
+
+def redis_script(source):
+    """The Lua script ``source``, registered once per process (redis-py then runs it by its SHA)."""
+    script = _scripts.get(source)
+    if script is None:
+        script = _scripts[source] = redis_connection().register_script(source)
+    return script
+
+
+_scripts = {}
+
+
+def is_django_redis():
+    return hasattr(cache, "client") and hasattr(cache.client, "encode")
+
+
+def _generation_is_fresh():
+    generation, read_at = _generation
+    return generation is not None and time.monotonic() - read_at < settings.CACHE_GENERATION_CHECK_INTERVAL
+
+
+def _remember_generation(value):
+    global _generation
+    generation = value.decode() if isinstance(value, bytes) else str(value or 0)
+    _generation = (generation, time.monotonic())
+    return generation
+
+
+def current_generation():
+    """The list cache generation, re-read from Redis at most once per check interval."""
+    if _generation_is_fresh():
+        return _generation[0]
+    if is_django_redis():
+        return _remember_generation(redis_connection().get(cache.make_key(GENERATION_KEY)))
+    return _remember_generation(cache.get(GENERATION_KEY))
+
+
+async def acurrent_generation():
+    """Async counterpart of ``current_generation``."""
+    if _generation_is_fresh():
+        return _generation[0]
+    if is_django_redis():
+        return _remember_generation(await _async_client().get(cache.make_key(GENERATION_KEY)))
+    return _remember_generation(await cache.aget(GENERATION_KEY))
+
+
+def bump_generation():
+    """
+    Invalidate every cached list page in all processes and tiers. The new
+    generation is time based, so it never repeats even if Redis was flushed.
+    """
+    generation = str(time.time_ns())
+    if is_django_redis():
+        redis_connection().set(cache.make_key(GENERATION_KEY), generation)
+    else:
+        cache.set(GENERATION_KEY, generation, timeout=None)
+    _remember_generation(generation)
+    return generation
+
+
+def delete_matching(pattern, batch_size=1000, rate_limit=0, dry_run=False, progress=None):
+    """
+    Delete the Redis keys matching the glob ``pattern`` (relative to the
+    cache's key prefix and version, e.g. ``appusers::*country=Germany*``)
+    without blocking Redis: keys are found with incremental ``SCAN`` and
+    removed ``batch_size`` at a time with ``UNLINK``, which frees memory in
+    the background, at most ``rate_limit`` keys per second (0: no limit).
+
+    Returns the number of matching keys (deleted unless ``dry_run``); SCAN
+    may report a key twice while Redis rehashes, so the count is approximate.
+    ``progress(count)`` is called after every batch.
+    """
+    client = redis_connection()
+    started, matched, batch = time.monotonic(), 0, []
+
+    def flush():
+        nonlocal matched, batch
+        if not dry_run:
+            client.unlink(*batch)
+        matched += len(batch)
+        batch = []
+        if progress is not None:
+            progress(matched)
+        if rate_limit and not dry_run:
+            # Sleep off whatever this batch took less than its share of the rate
+            time.sleep(max(0.0, matched / rate_limit - (time.monotonic() - started)))
+
+    for key in client.scan_iter(match=cache.make_key(pattern), count=batch_size):
+        batch.append(key)
+        if len(batch) >= batch_size:
+            flush()
+    if batch:
+        flush()
+    return matched
+
+
+def clear_local():
+    """Drop this process' local tier and forget the remembered generation."""
+    global _generation
+    local_cache.clear()
+    _generation = (None, 0.0)
+
+
+def _encode(value):
+    """``value`` as the bytes kept in the local tier: as stored in Redis, or pickled on other backends."""
+    if is_django_redis():
+        return cache.client.encode(value)
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _decode(raw):
+    if is_django_redis():
+        return cache.client.decode(raw)
+    return pickle.loads(raw)
+
+
+def _from_local(key):
+    raw = local_cache.get(key)
+    if raw is None:
+        return None
+    tier_stats.record("local")
+    return _decode(raw)
+
+
+def _from_redis(key, raw):
+    """The page encoded as ``raw`` (``None`` on a miss), kept in the local tier as well."""
+    if raw is None:
+        tier_stats.record(None)
+        return None, None
+    local_cache.set(key, raw)
+    tier_stats.record("redis")
+    return _decode(raw), "redis"
+
+
+def get_page(key):
+    """Look ``key`` up in the local tier, then Redis. Returns ``(value, tier)``."""
+    value = _from_local(key)
+    if value is not None:
+        return value, "local"
+
+    if not is_django_redis():
+        value = cache.get(key)
+        return _from_redis(key, None if value is None else _encode(value))
+    return _from_redis(key, redis_connection().get(cache.make_key(key)))
+
+
+def set_page(key, value, timeout):
+    """Store ``value`` in Redis and the local tier."""
+    raw = _encode(value)
+    if is_django_redis():
+        redis_connection().set(cache.make_key(key), raw, ex=timeout)
+    else:
+        cache.set(key, value, timeout=timeout)
+    local_cache.set(key, raw)
+
+
+def page_body_key(key, encoding):
+    return f"{key}::body:{encoding}"
+
+
+def get_page_body(key, encoding):
+    """The body of page ``key`` pre-compressed with ``encoding``, ``None`` if not stored."""
+    body_key = page_body_key(key, encoding)
+    body = local_cache.get(body_key)
+    if body is not None:
+        return body
+    if is_django_redis():
+        body = redis_connection().get(cache.make_key(body_key))
+    else:
+        body = cache.get(body_key)
+    if body is not None:
+        local_cache.set(body_key, body)
+    return body
+
+
+def set_page_bodies(key, bodies, timeout):
+    """Store the pre-compressed bodies (``{encoding: bytes}``) of page ``key``."""
+    if not bodies:
+        return
+    if not is_django_redis():
+        cache.set_many({page_body_key(key, encoding): body for encoding, body in bodies.items()}, timeout=timeout)
+        return
+    pipe = redis_connection().pipeline(transaction=False)
+    for encoding, body in bodies.items():
+        pipe.set(cache.make_key(page_body_key(key, encoding)), body, ex=timeout)
+        local_cache.set(page_body_key(key, encoding), body)
+    pipe.execute()
+
+
+async def aget_page(key):
+    """Async counterpart of ``get_page``."""
+    value = _from_local(key)
+    if value is not None:
+        return value, "local"
+
+    if not is_django_redis():
+        value = await cache.aget(key)
+        return _from_redis(key, None if value is None else _encode(value))
+    return _from_redis(key, await _async_client().get(cache.make_key(key)))
+
+
+async def aset_page(key, value, timeout):
+    """Async counterpart of ``set_page``."""
+    raw = _encode(value)
+    if is_django_redis():
+        await _async_client().set(cache.make_key(key), raw, ex=timeout)
+    else:
+        await cache.aset(key, value, timeout=timeout)
+    local_cache.set(key, raw)
+
+
+class RequestCounts:
+    """
+    This process' request counts per signature not yet added to Redis. A
+    batch is handed out for flushing once ``CACHE_WARM_FLUSH_INTERVAL``
+    seconds have passed since the last one, or once it holds
+    ``CACHE_WARM_MAX_SIGNATURES`` signatures. Counts pending when the
+    process exits are lost, which popularity ranking can afford.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+        self._taken_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, signature):
+        """Count one request; returns the batch to flush when one is due, else ``None``."""
+        with self._lock:
+            self._counts[signature] += 1
+            due = (
+                time.monotonic() - self._taken_at >= settings.CACHE_WARM_FLUSH_INTERVAL
+                or len(self._counts) >= settings.CACHE_WARM_MAX_SIGNATURES
+            )
+            return self._take() if due else None
+
+    def take(self):
+        """The pending counts, emptied."""
+        with self._lock:
+            return self._take()
+
+    def _take(self):
+        counts, self._counts = self._counts, Counter()
+        self._taken_at = time.monotonic()
+        return counts
+
+    def clear(self):
+        self.take()
+
+
+request_counts = RequestCounts()
+
+
+def _tracks(request):
+    return settings.CACHE_WARM_TRACK_REQUESTS and not is_refresh_request(request) and is_django_redis()
+
+
+def record_request(request):
+    """Count one request for its signature, see ``RequestCounts``."""
+    if _tracks(request) and (counts := request_counts.add(request_signature(request))):
+        flush_request_counts(counts)
+
+
+def flush_request_counts(counts=None):
+    """
+    Add ``counts`` (default: everything pending) to the popularity set. The
+    set is trimmed back to ``CACHE_WARM_MAX_SIGNATURES`` once it grows to
+    twice that size, which leaves new signatures room to accumulate a score
+    before trimming.
+    """
+    counts = request_counts.take() if counts is None else counts
+    if not counts or not is_django_redis():
+        return
+    key = cache.make_key(POPULAR_SIGNATURES_KEY)
+    limit = settings.CACHE_WARM_MAX_SIGNATURES
+    pipe = redis_connection().pipeline(transaction=False)
+    for signature, count in counts.items():
+        pipe.zincrby(key, count, signature)
+    pipe.zcard(key)
+    size = pipe.execute()[-1]
+    if size > 2 * limit:
+        redis_connection().zremrangebyrank(key, 0, size - limit - 1)
+
+
+async def arecord_request(request):
+    """Async counterpart of ``record_request``."""
+    if not _tracks(request) or not (counts := request_counts.add(request_signature(request))):
+        return
+
+    key = cache.make_key(POPULAR_SIGNATURES_KEY)
+    limit = settings.CACHE_WARM_MAX_SIGNATURES
+    client = _async_client()
+    async with client.pipeline(transaction=False) as pipe:
+        for signature, count in counts.items():
+            pipe.zincrby(key, count, signature)
+        pipe.zcard(key)
+        size = (await pipe.execute())[-1]
+    if size > 2 * limit:
+        await client.zremrangebyrank(key, 0, size - limit - 1)
+
+
+def page_etag(key, data):
+    """
+    Weak ETag of a rendered list page: its cache key (path, canonical query
+    and generation) plus the count and the ``(id, last_updated)`` of its
+    rows. Relationship and address writes bump ``last_updated``, so a page
+    re-rendered after its entry expired keeps its ETag unless it changed.
+    """
+    rows = [(row.get("id"), row.get("last_updated")) for row in data.get("results", [])]
+    digest = hashlib.sha1(repr((key, data.get("count"), rows)).encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def format_etag(etag, media_format):
+    """The ``ETag`` of the page tagged ``etag`` rendered as ``media_format``."""
+    if not etag:
+        return etag
+    digest = hashlib.sha1(f"{etag}:{media_format}".encode()).hexdigest()
+    return f'W/"{digest}"'
+
+
+def etag_matches(request, etag):
+    """Whether ``If-None-Match`` of ``request`` matches ``etag`` (weak comparison)."""
+    header = request.headers.get("If-None-Match")
+    if not header or not etag:
+        return False
+    etags = parse_etags(header)
+    return "*" in etags or etag.removeprefix("W/") in {tag.removeprefix("W/") for tag in etags}
+
+
+def patch_list_cache_headers(response, etag):
+    """``ETag``, ``Cache-Control`` and ``Vary`` of list responses, 304s included."""
+    if etag:
+        response["ETag"] = etag
+    patch_cache_control(
+        response,
+        **{settings.LIST_HTTP_CACHE_SCOPE: True},
+        max_age=settings.LIST_HTTP_MAX_AGE,
+        must_revalidate=True,
+    )
+    patch_vary_headers(response, ["Accept", "Accept-Encoding"])
+    return response
+
+
+def popular_signatures(limit):
+    """The ``limit`` most requested signatures, most popular first."""
+    if not is_django_redis():
+        return []
+    signatures = redis_connection().zrevrange(cache.make_key(POPULAR_SIGNATURES_KEY), 0, limit - 1)
+    return [signature.decode() for signature in signatures]
+
+
+def decay_popularity(factor=0.5):
+    """Scale all scores down so that recent traffic outweighs old traffic."""
+    if not is_django_redis():
+        return
+    key = cache.make_key(POPULAR_SIGNATURES_KEY)
+    redis_connection().zunionstore(key, {key: factor})
+
+
+def _async_client():
+    from redis import asyncio as aioredis
+
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        location = cache._server
+        if isinstance(location, (list, tuple)):
+            location = location[0]
+        client = aioredis.from_url(location)
+        _async_clients[loop] = client
+    return client
@@ -0,0 +1,112 @@
+"""
+Change feed over AppUser for incremental sync.
+
+Consumers pass back the opaque token of the previous response and get the
+AppUsers changed since, in ``(last_updated, id)`` order, merged with the
+deletions recorded in ``AppUserTombstone`` in ``(deleted_at, id)`` order.
+Relationship and address writes bump the ``last_updated`` of the users they
+belong to (core/signals.py), so they show up as changes of those users.
+
+Rows are only handed out once they are ``CHANGES_SETTLE_SECONDS`` old: a
+transaction that stamped ``last_updated`` earlier but commits later than a
+read would otherwise be skipped by the cursor. Writes that bypass the ORM's
+``save()`` (``QuerySet.update``, ``bulk_create``) do not touch
+``last_updated`` and are not seen.
+
+A token is a pair of cursors, one per stream. Tombstones are kept for
+``CHANGES_TOMBSTONE_RETENTION_DAYS``; tokens older than that are rejected
+and the consumer has to sync from scratch.
+"""
+
+import base64
+import binascii
+import json
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from core.models import AppUser, AppUserTombstone
+
+
+class InvalidToken(ValueError):
+    pass
+
+
+class ExpiredToken(InvalidToken):
+    pass
+
+
+def encode_token(cursors):
+    payload = {
+        name: None if cursor is None else [cursor[0].isoformat(), cursor[1]]
+        for name, cursor in cursors.items()
+    }
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode().rstrip("=")
+
+
+def decode_token(token):
+    """Cursors ``{"users": (datetime, id) or None, "deleted": (datetime, id)}``."""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+        users = payload["users"]
+        cursors = {
+            "users": None if users is None else (datetime.fromisoformat(users[0]), int(users[1])),
+            "deleted": (datetime.fromisoformat(payload["deleted"][0]), int(payload["deleted"][1])),
+        }
+        if any(cursor is not None and timezone.is_naive(cursor[0]) for cursor in cursors.values()):
+            raise ValueError("naive cursor")
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError, KeyError, IndexError):
+        raise InvalidToken("Malformed token")
+
+    retention = timedelta(days=settings.CHANGES_TOMBSTONE_RETENTION_DAYS)
+    if cursors["deleted"][0] < timezone.now() - retention:
+        raise ExpiredToken("Token is older than the tombstone retention, sync from scratch")
+    return cursors
+
+
+def _after(queryset, field, cursor):
+    if cursor is None:
+        return queryset
+    moment, row_id = cursor
+    return queryset.filter(Q(**{f"{field}__gt": moment}) | Q(**{field: moment, "id__gt": row_id}))
+
+
+def changes_since(token, limit):
+    """
+    The next ``limit`` changes after ``token`` (from the start without one):
+    ``(events, next token, has more)``. Events are ``(op, changed_at,
+    appuser id, customer id)`` tuples, op being ``"upsert"`` or ``"delete"``.
+    """
+    horizon = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    # A first sync sees every current user; only later deletions concern it
+    cursors = decode_token(token) if token else {"users": None, "deleted": (horizon, 0)}
+
+    users = _after(AppUser.objects.filter(last_updated__lt=horizon), "last_updated", cursors["users"])
+    users = users.order_by("last_updated", "id").values_list("last_updated", "id", "customer_id")
+    deleted = _after(AppUserTombstone.objects.filter(deleted_at__lt=horizon), "deleted_at", cursors["deleted"])
+    deleted = deleted.order_by("deleted_at", "id").values_list("deleted_at", "id", "appuser_id", "customer_id")
+
+    # (op, changed_at, row id in its table, appuser id, customer id)
+    streams = {
+        "users": [("upsert", moment, user_id, user_id, customer_id) for moment, user_id, customer_id in users[:limit + 1]],
+        "deleted": [("delete", *row) for row in deleted[:limit + 1]],
+    }
+    merged = sorted(streams["users"] + streams["deleted"], key=lambda event: (event[1], event[0], event[2]))
+    taken = merged[:limit]
+
+    next_cursors = {}
+    for name, events in streams.items():
+        own = [event for event in taken if event[0] == events[0][0]] if events else []
+        if len(own) == len(events):
+            # Drained up to the horizon, whatever comes next is stamped later
+            previous = cursors[name]
+            next_cursors[name] = (horizon, 0) if previous is None or previous[0] < horizon else previous
+        elif own:
+            next_cursors[name] = (own[-1][1], own[-1][2])
+        else:
+            next_cursors[name] = cursors[name]
+
+    events = [(op, moment, user_id, customer_id) for op, moment, _, user_id, customer_id in taken]
+    return events, encode_token(next_cursors), len(merged) > limit
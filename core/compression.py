@@ -0,0 +1,195 @@
+"""
+Negotiated response compression: zstd, Brotli or gzip, whichever the
+client prefers in ``Accept-Encoding`` among those available (zstd and
+Brotli are optional dependencies, gzip is always there).
+
+``CompressionMiddleware`` compresses responses on the fly, like Django's
+``GZipMiddleware``. Bodies under ``COMPRESSION_MIN_BYTES`` are sent as they
+are: the framing overhead outweighs the savings and it costs CPU for
+nothing.
+
+List pages are also compressed *before* they are cached, so a cache hit
+sends stored bytes without rendering or compressing the page again. Their
+``meta`` differs per response (``cache_hit``, ``response_time``), so what
+is stored is everything up to ``"meta":`` (``page_prefix``), compressed on
+its own, and each response appends its meta as a second gzip member or
+zstd frame. Both formats define a concatenation of members/frames as the
+concatenation of their contents, and HTTP clients decode them as such.
+Brotli streams cannot be concatenated, so Brotli is only used on the fly.
+
+HTML is never compressed: browsable API pages carry the CSRF token next to
+reflected request data, which is what BREACH needs to recover the token from
+compressed sizes. Django's ``GZipMiddleware`` pads gzip output at random for
+that; the API pages are small and internal, so they simply go uncompressed.
+Responses marked ``Cache-Control: no-transform`` are left alone too.
+"""
+
+import gzip
+
+from django.conf import settings
+from django.utils.cache import cc_delim_re, patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.regex_helper import _lazy_re_compile
+
+try:
+    import zstandard
+except ImportError:  # optional dependency, see pyproject.toml
+    zstandard = None
+
+try:
+    import brotli
+except ImportError:  # optional dependency, see pyproject.toml
+    brotli = None
+
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+BROTLI_QUALITY = 5
+
+# Encodings whose compressed parts can be concatenated, see page_prefix
+CONCATENABLE = ("zstd", "gzip")
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/vnd.crm.columnar+json",
+    "application/msgpack",
+    "application/x-ndjson",
+    "text/",
+)
+
+# Never compressed, see BREACH above
+EXCLUDED_TYPES = ("text/html",)
+
+_token_re = _lazy_re_compile(r"^\s*([^\s;]+)\s*(?:;\s*q\s*=\s*([0-9.]+))?")
+
+
+def available_encodings():
+    """Encodings this process can produce, in order of preference."""
+    encodings = []
+    if zstandard is not None:
+        encodings.append("zstd")
+    if brotli is not None:
+        encodings.append("br")
+    encodings.append("gzip")
+    return encodings
+
+
+def choose_encoding(accept_encoding, candidates=None):
+    """
+    The encoding to use for a request's ``Accept-Encoding`` header, or
+    ``None`` for an uncompressed response. Among ``candidates`` (every
+    available encoding by default) the highest q-value wins, ties going to
+    the order of preference; ``*`` covers the encodings not listed.
+    """
+    if not accept_encoding:
+        return None
+    weights = {}
+    for part in accept_encoding.split(","):
+        match = _token_re.match(part)
+        if match is None:
+            continue
+        try:
+            weights[match[1].lower()] = float(match[2]) if match[2] is not None else 1.0
+        except ValueError:
+            continue
+
+    best, best_weight = None, 0.0
+    for encoding in candidates or available_encodings():
+        if encoding not in available_encodings():
+            continue
+        weight = weights.get(encoding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+
+def compress(data, encoding):
+    if encoding == "zstd":
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    if encoding == "br":
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    if encoding == "gzip":
+        # mtime=0 keeps the output stable for equal input
+        return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def decompress(data, encoding):
+    """Inverse of ``compress``; concatenated gzip members and zstd frames included."""
+    if encoding == "zstd":
+        reader = zstandard.ZstdDecompressor().stream_reader(data, read_across_frames=True)
+        return reader.read()
+    if encoding == "br":
+        return brotli.decompress(data)
+    if encoding == "gzip":
+        return gzip.decompress(data)
+    raise ValueError(f"Unsupported encoding: {encoding}")
+
+
+def page_prefix(rendered):
+    """
+    ``rendered``, the JSON object of a page without its meta, opened up to
+    take the meta as its last member: ``{"count":..,"results":[..],"meta":``.
+    """
+    if rendered == b"{}":
+        return b'{"meta":'
+    return rendered[:-1] + b',"meta":'
+
+
+def encode_prefix(rendered):
+    """
+    The compressed ``page_prefix`` of a page in every concatenable encoding
+    available; none for pages too small to be worth compressing.
+    """
+    prefix = page_prefix(rendered)
+    if not settings.COMPRESSION_ENABLED or len(prefix) < settings.COMPRESSION_MIN_BYTES:
+        return {}
+    return {encoding: compress(prefix, encoding) for encoding in CONCATENABLE if encoding in available_encodings()}
+
+
+def encode_suffix(rendered_meta, encoding):
+    """The compressed meta closing a body started with ``encode_prefix``."""
+    return compress(rendered_meta + b"}", encoding)
+
+
+def is_compressible(response):
+    if response.streaming or response.has_header("Content-Encoding"):
+        return False
+    if not 200 <= response.status_code < 300:
+        return False
+    directives = {directive.strip().lower() for directive in cc_delim_re.split(response.get("Cache-Control", ""))}
+    if "no-transform" in directives:
+        return False
+    content_type = response.get("Content-Type", "")
+    return content_type.startswith(COMPRESSIBLE_TYPES) and not content_type.startswith(EXCLUDED_TYPES)
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress responses with the encoding negotiated from ``Accept-Encoding``.
+    Responses that already have a ``Content-Encoding`` (pre-compressed list
+    pages), streaming responses, HTML, ``no-transform`` responses and bodies
+    under ``COMPRESSION_MIN_BYTES`` are left alone.
+    """
+
+    def process_response(self, request, response):
+        if not settings.COMPRESSION_ENABLED or not is_compressible(response):
+            return response
+        patch_vary_headers(response, ("Accept-Encoding",))
+        if len(response.content) < settings.COMPRESSION_MIN_BYTES:
+            return response
+
+        encoding = choose_encoding(request.headers.get("Accept-Encoding"))
+        if encoding is None:
+            return response
+        compressed = compress(response.content, encoding)
+        if len(compressed) >= len(response.content):
+            return response
+
+        # The body is no longer byte-for-byte the one a strong ETag vouched for
+        etag = response.get("ETag")
+        if etag and etag.startswith('"'):
+            response["ETag"] = "W/" + etag
+        response.content = compressed
+        response["Content-Length"] = str(len(compressed))
+        response["Content-Encoding"] = encoding
+        return response
@@ -1,6 +1,42 @@
 from django.db.models import Q
+from django.db.models.lookups import GreaterThanOrEqual, LessThanOrEqual
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
 from datetime import datetime
 
+from core.models import BIRTHDAY_MONTH_DAY
+
+# Query parameters understood by build_appuser_filters
+APPUSER_FILTER_PARAMS = (
+    "first_name",
+    "last_name",
+    "gender",
+    "customer_id",
+    "phone_number",
+    "birthday",
+    "birthday_from",
+    "birthday_to",
+    "age_min",
+    "age_max",
+    "anniversary_from",
+    "anniversary_to",
+    "city",
+    "street",
+    "country",
+    "points_min",
+    "points_max",
+    "last_activity_after",
+    "updated_after",
+)
+
+
+def active_filter_params(params):
+    """Names of the filter parameters present in ``params`` with a non-blank value."""
+    return {
+        name for name in APPUSER_FILTER_PARAMS
+        if (value := params.get(name)) is not None and str(value).strip()
+    }
+
 def build_appuser_filters(params):
     """
     Builds Django Q objects for filtering AppUser based on provided parameters.
@@ -13,12 +49,18 @@ def build_appuser_filters(params):
             - customer_id: exact match
             - phone_number: case-insensitive partial match
             - birthday: exact date match
+            - birthday_from, birthday_to: birthday on or after / on or before this date
+            - age_min, age_max: age in whole years today, inclusive
+            - anniversary_from, anniversary_to: birthday falls on or after /
+              on or before this MM-DD in the year; wraps around the end of
+              the year when anniversary_from is later than anniversary_to
             - city: case-insensitive partial match on address.city
             - street: case-insensitive partial match on address.street
             - country: case-insensitive partial match on address.country
             - points_min: relationships.points greater than or equal
             - points_max: relationships.points less than or equal
             - last_activity_after: relationships.last_activity after this date
+            - updated_after: last_updated after this date or ISO 8601 datetime
     
     Returns:
         Q: Django Q object combining all the provided filters
@@ -48,6 +90,39 @@ def build_appuser_filters(params):
         except (ValueError, TypeError):
             pass
 
+    for name, lookup in (("birthday_from", "birthday__gte"), ("birthday_to", "birthday__lte")):
+        if bday := params.get(name):
+            try:
+                if isinstance(bday, str):
+                    bday = datetime.strptime(bday, "%Y-%m-%d").date()
+                q &= Q(**{lookup: bday})
+            except (ValueError, TypeError):
+                pass
+
+    # Ages become a birthday range, which the birthday index answers
+    today = timezone.localdate()
+    if age_min := params.get("age_min"):
+        try:
+            q &= Q(birthday__lte=_years_before(today, int(age_min)))
+        except (ValueError, TypeError, OverflowError):
+            pass
+
+    if age_max := params.get("age_max"):
+        try:
+            q &= Q(birthday__gt=_years_before(today, int(age_max) + 1))
+        except (ValueError, TypeError, OverflowError):
+            pass
+
+    anniversary_from = _month_day(params.get("anniversary_from"))
+    anniversary_to = _month_day(params.get("anniversary_to"))
+    after = GreaterThanOrEqual(BIRTHDAY_MONTH_DAY, anniversary_from) if anniversary_from else None
+    before = LessThanOrEqual(BIRTHDAY_MONTH_DAY, anniversary_to) if anniversary_to else None
+    if after and before:
+        # Across the end of the year: one range at each end
+        q &= Q(after, before) if anniversary_from <= anniversary_to else Q(after) | Q(before)
+    elif after or before:
+        q &= Q(after or before)
+
     if (city := params.get("city")) and city.strip():
         q &= Q(address__city__icontains=city.strip())
     
@@ -77,4 +152,35 @@ def build_appuser_filters(params):
         except (ValueError, TypeError):
             pass
 
-    return q
\ No newline at end of file
+    if updated := params.get("updated_after"):
+        try:
+            if isinstance(updated, str):
+                updated = parse_datetime(updated) or datetime.strptime(updated, "%Y-%m-%d")
+            if timezone.is_naive(updated):
+                updated = timezone.make_aware(updated)
+            q &= Q(last_updated__gt=updated)
+        except (ValueError, TypeError):
+            pass
+
+    return q
+
+def _years_before(day, years):
+    """``day`` ``years`` years earlier; February 29th becomes the 28th in other years."""
+    try:
+        return day.replace(year=day.year - years)
+    except ValueError:
+        if day.month == 2 and day.day == 29:
+            return day.replace(year=day.year - years, day=28)
+        raise
+
+
+def _month_day(value):
+    """``MM-DD`` as a number comparable with ``BIRTHDAY_MONTH_DAY``, ``None`` if blank or invalid."""
+    if not value or not isinstance(value, str):
+        return None
+    try:
+        # A leap year, so that 02-29 is valid
+        day = datetime.strptime(f"2000-{value.strip()}", "%Y-%m-%d")
+    except ValueError:
+        return None
+    return day.month * 100 + day.day
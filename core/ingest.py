@@ -0,0 +1,156 @@
+"""
+Bulk upsert of AppUsers and their relationships from NDJSON.
+
+Every line is one customer, validated with ``AppUserIngestSerializer``::
+
+    {"customer_id": "C1", "first_name": "Ada", "last_name": "Lovelace",
+     "gender": "Female", "phone_number": null, "birthday": "1990-12-10",
+     "address": {"street": "Main Street", "street_number": "1",
+                 "city_code": "10115", "city": "Berlin", "country": "Germany"},
+     "relationships": [{"points": 120, "created": "2024-05-01T10:00:00Z",
+                        "last_activity": null}]}
+
+Valid lines are written in batches, each in its own transaction:
+
+- addresses are matched on their normalized identity
+  (``Address.objects.bulk_get_or_create``), so users living at the same
+  address share one row,
+- users are upserted by ``customer_id`` with a single
+  ``INSERT ... ON CONFLICT (customer_id) DO UPDATE``; a line replaces all
+  user fields, omitted optional ones become null,
+- relationships are appended with ``ON CONFLICT DO NOTHING``, so resending
+  a relationship with the same ``created`` (the ``(appuser, created)``
+  unique constraint) is a no-op.
+
+Invalid lines are reported with their line number and do not stop the
+rest. A batch the database rejects as a whole is retried line by line to
+find the offending rows. Within a batch the last line of a customer wins,
+with the relationships of all its lines kept.
+"""
+
+import json
+from collections import defaultdict
+from dataclasses import dataclass, field
+
+from django.db import DatabaseError, transaction
+
+from core import analytics, bitmaps
+from core.cache import bump_generation
+from core.models import Address, AppUser, CustomerRelationship
+from core.serializers import AppUserIngestSerializer
+
+USER_UPDATE_FIELDS = ["first_name", "last_name", "gender", "phone_number", "birthday", "address", "last_updated"]
+
+
+@dataclass
+class IngestResult:
+    received: int = 0
+    created: int = 0
+    updated: int = 0
+    relationships: int = 0  # submitted; resent ones are skipped by the database
+    errors: list = field(default_factory=list)
+
+    def error(self, line, errors, customer_id=None):
+        self.errors.append({"line": line, "customer_id": customer_id, "errors": errors})
+
+    def as_dict(self):
+        return {
+            "received": self.received,
+            "created": self.created,
+            "updated": self.updated,
+            "relationships": self.relationships,
+            "errors": self.errors,
+        }
+
+
+def _upsert(users, relationships):
+    """Write one batch. Returns ``(created, updated, relationships submitted)``."""
+    addresses = Address.objects.bulk_get_or_create(Address(**data["address"]) for data in users.values())
+    existing = dict(AppUser.objects.filter(customer_id__in=users).values_list("customer_id", "id"))
+    previous = bitmaps.capture(existing.values())
+
+    AppUser.objects.bulk_create(
+        [
+            AppUser(
+                address=address,
+                **{name: value for name, value in data.items() if name not in ("address", "relationships")},
+            )
+            for data, address in zip(users.values(), addresses)
+        ],
+        update_conflicts=True,
+        unique_fields=["customer_id"],
+        update_fields=USER_UPDATE_FIELDS,
+    )
+    ids = dict(AppUser.objects.filter(customer_id__in=users).values_list("customer_id", "id"))
+    new_relationships = [
+        CustomerRelationship(appuser_id=ids[customer_id], **relationship)
+        for customer_id, items in relationships.items()
+        for relationship in items
+    ]
+    CustomerRelationship.objects.bulk_create(new_relationships, ignore_conflicts=True)
+
+    # Bulk writes send no signals; keep the bitmap index and the rollups current explicitly
+    bitmaps.schedule_sync(ids.values(), previous)
+    if existing:
+        analytics.mark_changed(AppUser)
+    return len(users) - len(existing), len(existing), len(new_relationships)
+
+
+def _write_batch(rows, result):
+    users, lines, relationships = {}, {}, defaultdict(list)
+    for line, data in rows:
+        users[data["customer_id"]] = data
+        lines[data["customer_id"]] = line
+        relationships[data["customer_id"]].extend(data.get("relationships", []))
+
+    try:
+        with transaction.atomic():
+            counts = [_upsert(users, relationships)]
+    except DatabaseError:
+        counts = []
+        for customer_id, data in users.items():
+            try:
+                with transaction.atomic():
+                    counts.append(_upsert({customer_id: data}, {customer_id: relationships[customer_id]}))
+            except DatabaseError as e:
+                result.error(lines[customer_id], {"non_field_errors": [str(e)]}, customer_id)
+
+    for created, updated, relationship_count in counts:
+        result.created += created
+        result.updated += updated
+        result.relationships += relationship_count
+
+
+def ingest(lines, batch_size=1000, max_rows=None):
+    """Upsert the NDJSON ``lines`` (str or bytes). Returns an ``IngestResult``."""
+    result = IngestResult()
+    batch = []
+    for number, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        if max_rows is not None and result.received >= max_rows:
+            result.error(number, {"non_field_errors": [f"Row limit of {max_rows} reached, the rest was not read"]})
+            break
+        result.received += 1
+
+        try:
+            payload = json.loads(line)
+        except ValueError as e:
+            result.error(number, {"non_field_errors": [f"Invalid JSON: {e}"]})
+            continue
+        serializer = AppUserIngestSerializer(data=payload)
+        if not serializer.is_valid():
+            customer_id = payload.get("customer_id") if isinstance(payload, dict) else None
+            result.error(number, serializer.errors, customer_id)
+            continue
+
+        batch.append((number, serializer.validated_data))
+        if len(batch) >= batch_size:
+            _write_batch(batch, result)
+            batch = []
+    if batch:
+        _write_batch(batch, result)
+
+    if result.created or result.updated:
+        bump_generation()
+    return result
@@ -0,0 +1,537 @@
+"""
+Background jobs for heavy operations (data loading, cache maintenance, backfills).
+
+A job is a registered task name plus JSON parameters. ``enqueue`` stores it
+as ``queued`` and pushes its id on a queue; ``run_jobs`` workers pop ids and
+run the tasks in a fixed number of threads, which bounds how many heavy jobs
+(and DB connections) run at once. Jobs end ``succeeded``, ``failed`` (with
+the error) or ``cancelled``.
+
+Tasks receive the ``Job`` and report with ``job.progress(done, total,
+message)``. A cancelled queued job never starts; cancelling a running job
+sets a flag that the task's next ``progress`` call turns into
+``JobCancelled``, so cancellation takes effect between progress reports.
+
+Most tasks run a management command (``command_task``). Their params are
+turned into command line arguments and parsed by the command's own parser,
+at enqueue time to reject bad ones and again when the job runs, so they get
+the same type conversion and checks as on the command line. Commands that
+declare a ``progress`` stealth option get ``job.progress`` passed in.
+
+Two backends keep the jobs:
+
+- ``RedisBackend`` (``JOBS_BACKEND=redis``): a hash per job, a list as the
+  queue and a sorted set of job ids by enqueue time, shared by the web
+  processes and the workers. Finished jobs expire after ``JOBS_RESULT_TTL``.
+- ``InMemoryBackend`` (``JOBS_BACKEND=memory``): the same in process memory,
+  for tests and single-process development; jobs only run in the process
+  that enqueued them (``Worker(...).run(burst=True)``).
+
+With Redis, a worker moves the id it pops onto a processing list
+(``BLMOVE``) and holds a lease on the job, renewed by a heartbeat thread
+every ``JOBS_LEASE_SECONDS / 3``. Every worker also reaps the processing
+list: a job whose lease expired before it was claimed (the worker died right
+after popping it) goes back on the queue, a running one whose lease expired
+(the worker was killed mid-run) is failed, as it may have done part of its
+work already; enqueue it again to retry.
+"""
+
+import argparse
+import io
+import json
+import threading
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass, field, fields
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management import call_command, get_commands, load_command_class
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from core.cache import redis_connection
+
+QUEUED, RUNNING, SUCCEEDED, FAILED, CANCELLED = "queued", "running", "succeeded", "failed", "cancelled"
+FINISHED = {SUCCEEDED, FAILED, CANCELLED}
+
+JOB_KEY_PREFIX = "jobs:job:"
+QUEUE_KEY = "jobs:queue"
+PROCESSING_KEY = "jobs:processing"
+RECENT_KEY = "jobs:recent"
+OUTPUT_TAIL_CHARS = 4000
+
+TASKS = {}
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class InvalidJob(ValueError):
+    pass
+
+
+@dataclass
+class Job:
+    task: str
+    params: dict = field(default_factory=dict)
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = QUEUED
+    done: int = 0
+    total: int = None
+    message: str = ""
+    result: dict = None
+    error: str = ""
+    cancel_requested: bool = False
+    created_at: str = field(default_factory=lambda: timezone.now().isoformat())
+    started_at: str = None
+    finished_at: str = None
+    # Epoch seconds until which the job's worker counts as alive (Redis backend)
+    lease_until: float = None
+    backend: object = field(default=None, repr=False, compare=False)
+
+    def as_dict(self):
+        return {f.name: getattr(self, f.name) for f in fields(self) if f.name != "backend"}
+
+    def progress(self, done, total=None, message=None):
+        """Record progress; raises ``JobCancelled`` once a cancel was requested."""
+        self.done = done
+        if total is not None:
+            self.total = total
+        if message is not None:
+            self.message = message
+        if self.backend.update(self.id, done=self.done, total=self.total, message=self.message):
+            self.cancel_requested = True
+            raise JobCancelled(f"Job {self.id} was cancelled")
+
+
+def task(name):
+    """Register ``function(job, **params)`` as the task ``name``."""
+    def register(function):
+        TASKS[name] = function
+        return function
+    return register
+
+
+def _load_command(name):
+    return load_command_class(get_commands()[name], name)
+
+
+def command_args(instance, command, params):
+    """``params`` (option dests) as the command line arguments of ``command``."""
+    actions = {action.dest: action for action in instance.create_parser("", command)._actions}
+    args = []
+    for name, value in params.items():
+        action = actions[name]
+        option = action.option_strings[0] if action.option_strings else None
+        if action.nargs == 0:
+            # Switches: given when the value differs from the default
+            if value != action.default:
+                args.append(option)
+        elif value is None:
+            continue
+        elif isinstance(action, argparse._AppendAction) and isinstance(value, list):
+            for item in value:
+                args.extend([option, str(item)])
+        else:
+            args.extend([str(value)] if option is None else [option, str(value)])
+    return args
+
+
+def command_task(name, command=None, refused=()):
+    """
+    Register a task running the management command ``command`` (default:
+    ``name``). Jobs setting one of the ``refused`` options are rejected.
+    """
+    command = command or name
+
+    def run(job, **params):
+        instance = _load_command(command)
+        options = {}
+        if "progress" in instance.stealth_options:
+            options["progress"] = job.progress
+        output = io.StringIO()
+        call_command(instance, *command_args(instance, command, params), stdout=output, **options)
+        return {"output": output.getvalue()[-OUTPUT_TAIL_CHARS:]}
+
+    run.command = command
+    run.refused = set(refused)
+    return task(name)(run)
+
+
+def accepted_params(task_name):
+    """Parameter names of a command task (its option dests), ``None`` for other tasks."""
+    command = getattr(TASKS[task_name], "command", None)
+    if command is None:
+        return None
+    def dests(instance):
+        return {action.dest for action in instance.create_parser("", command)._actions}
+
+    # The command's own options, without the common ones and the job-queueing switch
+    return dests(_load_command(command)) - dests(BaseCommand()) - {"background"}
+
+
+command_task("populate_data")
+# FLUSHDB would take the job queue and records with it
+command_task("clear_cache", refused=("all",))
+command_task("warm_cache")
+command_task("refresh_rollups")
+command_task("dedupe_addresses")
+
+
+def _encode(job):
+    return {name: json.dumps(value) for name, value in job.as_dict().items()}
+
+
+def _decode(data, backend):
+    values = {name.decode(): json.loads(value) for name, value in data.items()}
+    return Job(**values, backend=backend)
+
+
+class RedisBackend:
+    # Claim a queued job for a worker; anything else (e.g. cancelled) is skipped
+    CLAIM_SCRIPT = """
+        if redis.call('HGET', KEYS[1], 'status') ~= ARGV[1] then return 0 end
+        redis.call('HSET', KEYS[1], 'status', ARGV[2], 'started_at', ARGV[3])
+        return 1
+    """
+    # Cancel a queued job outright, flag a running one for its next progress report
+    CANCEL_SCRIPT = """
+        local status = redis.call('HGET', KEYS[1], 'status')
+        if status == ARGV[1] then
+            redis.call('HSET', KEYS[1], 'status', ARGV[3], 'cancel_requested', 'true', 'finished_at', ARGV[4])
+            redis.call('LREM', KEYS[2], 0, ARGV[5])
+            redis.call('EXPIRE', KEYS[1], ARGV[6])
+        elseif status == ARGV[2] then
+            redis.call('HSET', KEYS[1], 'cancel_requested', 'true')
+        end
+        return status
+    """
+
+    # Requeue a popped job never claimed, fail a running one, once its lease
+    # expired; forget finished, cancelled and expired ones. A popped job gets
+    # a lease when first seen unclaimed, so its worker has time to claim it.
+    REAP_SCRIPT = """
+        local status = redis.call('HGET', KEYS[1], 'status')
+        if status ~= ARGV[1] and status ~= ARGV[2] then
+            redis.call('LREM', KEYS[2], 0, ARGV[5])
+            return 'forgotten'
+        end
+        local lease = tonumber(redis.call('HGET', KEYS[1], 'lease_until') or '')
+        if lease == nil then
+            redis.call('HSET', KEYS[1], 'lease_until', ARGV[4] + ARGV[6])
+            return nil
+        end
+        if lease >= tonumber(ARGV[4]) then return nil end
+        redis.call('LREM', KEYS[2], 0, ARGV[5])
+        if status == ARGV[1] then
+            redis.call('HDEL', KEYS[1], 'lease_until')
+            redis.call('RPUSH', KEYS[3], ARGV[5])
+            return 'requeued'
+        end
+        redis.call('HSET', KEYS[1], 'status', ARGV[3], 'error', ARGV[7], 'finished_at', ARGV[8])
+        redis.call('EXPIRE', KEYS[1], ARGV[9])
+        return 'failed'
+    """
+
+    def __init__(self):
+        self.client = redis_connection()
+        self.claim_script = self.client.register_script(self.CLAIM_SCRIPT)
+        self.cancel_script = self.client.register_script(self.CANCEL_SCRIPT)
+        self.reap_script = self.client.register_script(self.REAP_SCRIPT)
+
+    def _key(self, job_id):
+        return cache.make_key(f"{JOB_KEY_PREFIX}{job_id}")
+
+    def add(self, job):
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self._key(job.id), mapping=_encode(job))
+        pipe.zadd(cache.make_key(RECENT_KEY), {job.id: time.time()})
+        pipe.rpush(cache.make_key(QUEUE_KEY), job.id)
+        pipe.execute()
+
+    def get(self, job_id):
+        data = self.client.hgetall(self._key(job_id))
+        return _decode(data, self) if data else None
+
+    def recent(self, limit):
+        ids = [job_id.decode() for job_id in self.client.zrevrange(cache.make_key(RECENT_KEY), 0, limit - 1)]
+        pipe = self.client.pipeline(transaction=False)
+        for job_id in ids:
+            pipe.hgetall(self._key(job_id))
+        jobs = [_decode(data, self) for data in pipe.execute() if data]
+        # Expired jobs leave their id behind
+        expired = set(ids) - {job.id for job in jobs}
+        if expired:
+            self.client.zrem(cache.make_key(RECENT_KEY), *expired)
+        return jobs
+
+    def pop(self, timeout):
+        job_id = self.client.blmove(
+            cache.make_key(QUEUE_KEY), cache.make_key(PROCESSING_KEY), timeout, src="LEFT", dest="RIGHT"
+        )
+        return job_id.decode() if job_id else None
+
+    def claim(self, job_id, started_at):
+        claimed = bool(self.claim_script(
+            keys=[self._key(job_id)], args=[json.dumps(QUEUED), json.dumps(RUNNING), json.dumps(started_at)]
+        ))
+        if claimed:
+            self.heartbeat([job_id])
+        else:
+            self.release(job_id)
+        return claimed
+
+    def heartbeat(self, job_ids):
+        """Extend the leases of the running ``job_ids``."""
+        lease_until = time.time() + settings.JOBS_LEASE_SECONDS
+        pipe = self.client.pipeline(transaction=False)
+        for job_id in job_ids:
+            pipe.hset(self._key(job_id), "lease_until", lease_until)
+        pipe.execute()
+
+    def release(self, job_id):
+        self.client.lrem(cache.make_key(PROCESSING_KEY), 0, job_id)
+
+    def reap(self):
+        """Requeue or fail the jobs of dead workers; returns ``{job id: "requeued" or "failed"}``."""
+        now = time.time()
+        reaped = {}
+        for raw in self.client.lrange(cache.make_key(PROCESSING_KEY), 0, -1):
+            job_id = raw.decode()
+            outcome = self.reap_script(
+                keys=[self._key(job_id), cache.make_key(PROCESSING_KEY), cache.make_key(QUEUE_KEY)],
+                args=[
+                    json.dumps(QUEUED), json.dumps(RUNNING), json.dumps(FAILED), now, job_id,
+                    settings.JOBS_LEASE_SECONDS, json.dumps("Worker lost: its lease expired"),
+                    json.dumps(timezone.now().isoformat()), settings.JOBS_RESULT_TTL,
+                ],
+            )
+            if outcome in (b"requeued", b"failed"):
+                reaped[job_id] = outcome.decode()
+        return reaped
+
+    def update(self, job_id, **values):
+        """Write ``values``; returns whether a cancel was requested."""
+        pipe = self.client.pipeline(transaction=True)
+        pipe.hset(self._key(job_id), mapping={name: json.dumps(value) for name, value in values.items()})
+        pipe.hget(self._key(job_id), "cancel_requested")
+        return json.loads(pipe.execute()[1] or "false")
+
+    def finish(self, job):
+        key = self._key(job.id)
+        pipe = self.client.pipeline(transaction=True)
+        # The whole record, in case the job itself flushed Redis (clear_cache)
+        pipe.hset(key, mapping=_encode(job))
+        pipe.expire(key, settings.JOBS_RESULT_TTL)
+        pipe.zadd(cache.make_key(RECENT_KEY), {job.id: time.time()}, nx=True)
+        pipe.lrem(cache.make_key(PROCESSING_KEY), 0, job.id)
+        pipe.execute()
+
+    def cancel(self, job_id):
+        status = self.cancel_script(
+            keys=[self._key(job_id), cache.make_key(QUEUE_KEY)],
+            args=[
+                json.dumps(QUEUED), json.dumps(RUNNING), json.dumps(CANCELLED),
+                json.dumps(timezone.now().isoformat()), job_id, settings.JOBS_RESULT_TTL,
+            ],
+        )
+        return status is not None
+
+
+class InMemoryBackend:
+    def __init__(self):
+        self.jobs = {}
+        self.queue = deque()
+        self.lock = threading.Condition()
+
+    def add(self, job):
+        with self.lock:
+            self.jobs[job.id] = job.as_dict()
+            self.queue.append(job.id)
+            self.lock.notify()
+
+    def get(self, job_id):
+        with self.lock:
+            data = self.jobs.get(job_id)
+            return Job(**data, backend=self) if data else None
+
+    def recent(self, limit):
+        with self.lock:
+            return [Job(**data, backend=self) for data in list(self.jobs.values())[::-1][:limit]]
+
+    def pop(self, timeout):
+        with self.lock:
+            if not self.queue:
+                self.lock.wait(timeout)
+            return self.queue.popleft() if self.queue else None
+
+    def claim(self, job_id, started_at):
+        with self.lock:
+            data = self.jobs[job_id]
+            if data["status"] != QUEUED:
+                return False
+            data.update(status=RUNNING, started_at=started_at)
+            return True
+
+    # Jobs die with the process that runs them, nothing to lease or reap
+    def heartbeat(self, job_ids):
+        pass
+
+    def release(self, job_id):
+        pass
+
+    def reap(self):
+        return {}
+
+    def update(self, job_id, **values):
+        with self.lock:
+            self.jobs[job_id].update(values)
+            return self.jobs[job_id]["cancel_requested"]
+
+    def finish(self, job):
+        with self.lock:
+            self.jobs[job.id] = job.as_dict()
+
+    def cancel(self, job_id):
+        with self.lock:
+            data = self.jobs.get(job_id)
+            if data is None:
+                return False
+            if data["status"] == QUEUED:
+                data.update(status=CANCELLED, cancel_requested=True, finished_at=timezone.now().isoformat())
+                self.queue.remove(job_id)
+            elif data["status"] == RUNNING:
+                data["cancel_requested"] = True
+            return True
+
+
+_memory_backend = InMemoryBackend()
+
+
+def get_backend():
+    if settings.JOBS_BACKEND == "memory":
+        return _memory_backend
+    return RedisBackend()
+
+
+def validate(task_name, params):
+    if task_name not in TASKS:
+        raise InvalidJob(f"Unknown task {task_name!r}, expected one of: {', '.join(sorted(TASKS))}")
+    accepted = accepted_params(task_name)
+    if accepted is None:
+        return
+    if set(params) - accepted:
+        raise InvalidJob(f"Unknown parameters for {task_name}: {', '.join(sorted(set(params) - accepted))}")
+    if refused := sorted(name for name in TASKS[task_name].refused if params.get(name)):
+        raise InvalidJob(f"{task_name} cannot run as a job with: {', '.join(refused)}")
+    command = TASKS[task_name].command
+    instance = _load_command(command)
+    try:
+        instance.create_parser("", command).parse_args(command_args(instance, command, params))
+    except CommandError as e:
+        raise InvalidJob(f"Invalid parameters for {task_name}: {e}")
+
+
+def enqueue(task_name, **params):
+    """Queue ``task_name`` with ``params``; returns the ``Job``."""
+    validate(task_name, params)
+    backend = get_backend()
+    job = Job(task=task_name, params=params, backend=backend)
+    backend.add(job)
+    return job
+
+
+def get_job(job_id):
+    return get_backend().get(job_id)
+
+
+def recent_jobs(limit=50):
+    return get_backend().recent(limit)
+
+
+def cancel(job_id):
+    """Cancel a queued job, or ask a running one to stop. Returns the job, ``None`` if unknown."""
+    backend = get_backend()
+    return backend.get(job_id) if backend.cancel(job_id) else None
+
+
+def run_job(backend, job_id):
+    """Run the queued job ``job_id`` unless it was cancelled meanwhile. Returns the finished ``Job``."""
+    if not backend.claim(job_id, timezone.now().isoformat()):
+        return None
+    job = backend.get(job_id)
+    try:
+        job.result = TASKS[job.task](job, **job.params)
+        job.status = SUCCEEDED
+    except JobCancelled:
+        job.status = CANCELLED
+    except Exception as e:
+        job.status, job.error = FAILED, f"{type(e).__name__}: {e}"
+    job.finished_at = timezone.now().isoformat()
+    backend.finish(job)
+    return job
+
+
+class Worker:
+    """Run queued jobs in ``concurrency`` threads."""
+
+    def __init__(self, concurrency=1, poll_timeout=5, backend=None):
+        self.concurrency = concurrency
+        self.poll_timeout = poll_timeout
+        self.backend = backend or get_backend()
+        self.stopping = threading.Event()
+        self.running = set()
+        self._running_lock = threading.Lock()
+
+    def run(self, burst=False, on_finish=None):
+        """Process jobs until ``stop()``, or until the queue is empty with ``burst``."""
+        threads = [
+            threading.Thread(target=self._loop, args=(burst, on_finish), name=f"jobs-{number}", daemon=True)
+            for number in range(self.concurrency)
+        ]
+        done = threading.Event()
+        heartbeat = threading.Thread(target=self._heartbeat, args=(done,), name="jobs-heartbeat", daemon=True)
+        self.backend.reap()
+        heartbeat.start()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        done.set()
+        heartbeat.join()
+
+    def stop(self):
+        self.stopping.set()
+
+    def _heartbeat(self, done):
+        """Renew the leases of this worker's jobs and reap those of dead workers."""
+        while not done.wait(settings.JOBS_LEASE_SECONDS / 3):
+            with self._running_lock:
+                running = list(self.running)
+            if running:
+                self.backend.heartbeat(running)
+            self.backend.reap()
+
+    def _loop(self, burst, on_finish):
+        while not self.stopping.is_set():
+            job_id = self.backend.pop(0.1 if burst else self.poll_timeout)
+            if job_id is None:
+                if burst:
+                    return
+                continue
+            close_old_connections()
+            with self._running_lock:
+                self.running.add(job_id)
+            try:
+                job = run_job(self.backend, job_id)
+            finally:
+                with self._running_lock:
+                    self.running.discard(job_id)
+                # Connections are per thread; do not keep one open per idle worker thread
+                connections.close_all()
+            if job is not None and on_finish is not None:
+                on_finish(job)
@@ -0,0 +1,80 @@
+import gzip
+import json
+import statistics
+import time
+from django.core.management.base import BaseCommand, CommandError
+from rest_framework.renderers import JSONRenderer
+from common.renderers import ColumnarJSONRenderer, MessagePackRenderer, ORJSONRenderer, msgpack, orjson
+from core.models import AppUser
+from core.serializers import AppUserSerializer
+from core.views import AppUserQueryMixin
+
+
+class Command(BaseCommand):
+    help = 'Compare the size, render and parse time of a list page in each response format'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=1000,
+            help='Users in the benchmarked page (default: 1,000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=20,
+            help='Timed runs per format; the median is reported (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        if options['page_size'] < 1 or options['repeat'] < 1:
+            raise CommandError('--page-size and --repeat must be positive')
+
+        users = list(AppUserQueryMixin().get_base_queryset().order_by('-created')[:options['page_size']])
+        if not users:
+            raise CommandError('No users to benchmark; run populate_data first')
+        data = {
+            'count': AppUser.objects.count(),
+            'page': 1,
+            'pages': 1,
+            'results': AppUserSerializer(users, many=True).data,
+            'meta': {'query_time': 0.0, 'response_time': 0.0, 'cache_hit': False, 'cache_tier': None},
+        }
+
+        self.stdout.write(f"Page of {len(users):,} users, median of {options['repeat']} runs")
+        self.stdout.write(
+            f"{'format':<16}{'bytes':>12}{'gzip bytes':>12}{'render ms':>12}{'parse ms':>12}{'orjson parse ms':>18}"
+        )
+        for name, renderer, parse in self.formats():
+            body = renderer.render(data)
+            render_time = self.median_time(lambda: renderer.render(data), options['repeat'])
+            parse_time = self.median_time(lambda: parse(body), options['repeat'])
+            fast_parse = '-'
+            if parse is json.loads and orjson is not None:
+                fast_parse = f"{self.median_time(lambda: orjson.loads(body), options['repeat']) * 1000:.2f}"
+            self.stdout.write(
+                f"{name:<16}{len(body):>12,}{len(gzip.compress(body)):>12,}"
+                f"{render_time * 1000:>12.2f}{parse_time * 1000:>12.2f}{fast_parse:>18}"
+            )
+
+    def formats(self):
+        """``(name, renderer, parse)``; JSON is parsed with the standard library (and orjson when installed)."""
+        formats = [('json', JSONRenderer(), json.loads)]
+        if orjson is not None:
+            formats.append(('json (orjson)', ORJSONRenderer(), json.loads))
+        formats.append(('columnar', ColumnarJSONRenderer(), json.loads))
+        if msgpack is not None:
+            formats.append(('msgpack', MessagePackRenderer(), msgpack.unpackb))
+        else:
+            self.stderr.write('msgpack is not installed, skipping MessagePack')
+        return formats
+
+    @staticmethod
+    def median_time(function, repeat):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            function()
+            times.append(time.perf_counter() - start)
+        return statistics.median(times)
@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import startup
+
+
+class Command(BaseCommand):
+    help = 'Measure the import time of starting a web worker, a management command and the job worker'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--target',
+            action='append',
+            dest='targets',
+            help=f"Only this target ({', '.join(startup.TARGETS)}); repeat for several (default: all)"
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Starts per target; the median is reported (default: 5)'
+        )
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=10,
+            help='Slowest modules listed per target (default: 10)'
+        )
+        parser.add_argument(
+            '--settings-module',
+            default=startup.SETTINGS_MODULE,
+            help=f'Settings the targets start with (default: {startup.SETTINGS_MODULE})'
+        )
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('--repeat must be positive')
+        targets = options['targets'] or list(startup.TARGETS)
+        unknown = set(targets) - set(startup.TARGETS)
+        if unknown:
+            raise CommandError(f"Unknown targets: {', '.join(sorted(unknown))}")
+
+        failed = 0
+        for target in targets:
+            report = startup.benchmark(target, options['repeat'], options['settings_module'])
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f'{target}: {report.total / 1000:.0f} ms of imports (budget {startup.IMPORT_BUDGETS[target]} ms), '
+                f'{len(report.modules)} modules'
+            ))
+            for name, own in report.slowest(options['top']):
+                self.stdout.write(f'  {own / 1000:>8.1f} ms  {name}')
+            problems = startup.check(report, target)
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  {problem}'))
+            failed += bool(problems)
+
+        summary = f'{len(targets) - failed} of {len(targets)} targets within budget'
+        self.stdout.write(self.style.ERROR(summary) if failed else self.style.SUCCESS(summary))
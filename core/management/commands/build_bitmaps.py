@@ -0,0 +1,18 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core import bitmaps
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the roaring bitmap index of AppUser ids from the database'
+
+    def handle(self, *args, **options):
+        if not bitmaps.is_available():
+            raise CommandError(
+                'The bitmap index requires pyroaring, the django-redis cache backend and '
+                'BITMAP_INDEX_ENABLED: pip install "crm-performance-backend[bitmaps]"'
+            )
+
+        start = time.time()
+        users = bitmaps.build()
+        self.stdout.write(self.style.SUCCESS(f'Indexed {users:,} users in {time.time() - start:.1f}s'))
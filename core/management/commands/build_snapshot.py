@@ -0,0 +1,33 @@
+import time
+from django.core.management.base import BaseCommand, CommandError
+from core.snapshot import build_snapshot, is_available
+
+
+class Command(BaseCommand):
+    help = 'Export AppUser, Address and CustomerRelationship columns into a new columnar snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running, rebuilding every N seconds (default: build once)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Rows fetched per database round trip (default: 50,000)'
+        )
+
+    def handle(self, *args, **options):
+        if not is_available():
+            raise CommandError('The snapshot engine requires NumPy: pip install "crm-performance-backend[snapshot]"')
+
+        while True:
+            start = time.time()
+            path = build_snapshot(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Built snapshot {path} in {time.time() - start:.1f}s'))
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
@@ -1,9 +1,92 @@
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
 from django.core.cache import cache
+from core import jobs
+from core.cache import LIST_CACHE_PREFIX, bump_generation, delete_matching, is_django_redis
 
 class Command(BaseCommand):
-    help = 'Clear the entire cache'
+    help = 'Clear cached AppUser list pages, or only the keys matching --pattern'
+    # Called as progress(done, total, message) when run as a background job
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--pattern',
+            help='Only delete the keys matching this glob, relative to the cache key prefix '
+                 f'(e.g. "{LIST_CACHE_PREFIX}*country=Germany*"); keeps the cache generation'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Flush the whole cache database (FLUSHDB), sessions and anything else included; '
+                 'not as a background job, which would flush the job queue too'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only count the matching keys'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Keys scanned and unlinked per round trip (default: 1,000)'
+        )
+        parser.add_argument(
+            '--rate-limit',
+            type=int,
+            default=0,
+            help='Delete at most this many keys per second (default: 0, no limit)'
+        )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Queue a background job for run_jobs instead of running here'
+        )
 
     def handle(self, *args, **options):
-        cache.clear()
-        self.stdout.write(self.style.SUCCESS('Successfully cleared the cache'))
\ No newline at end of file
+        if options['all'] and (options['pattern'] or options['dry_run']):
+            raise CommandError('--all cannot be combined with --pattern or --dry-run')
+        if options['batch_size'] < 1 or options['rate_limit'] < 0:
+            raise CommandError('--batch-size must be positive and --rate-limit not negative')
+
+        if options['background']:
+            params = {name: options[name] for name in ('pattern', 'all', 'dry_run', 'batch_size', 'rate_limit')}
+            try:
+                job = jobs.enqueue('clear_cache', **params)
+            except jobs.InvalidJob as e:
+                raise CommandError(str(e))
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.id}'))
+            return
+
+        if options['all']:
+            cache.clear()
+            bump_generation()
+            self.stdout.write(self.style.SUCCESS('Successfully cleared the cache'))
+            return
+
+        if not is_django_redis():
+            if options['pattern']:
+                raise CommandError('--pattern requires the django_redis cache backend')
+            if options['dry_run']:
+                # Keys cannot be listed here; nothing is deleted, the generation would be bumped
+                self.stdout.write(self.style.SUCCESS('Would retire every cached list page'))
+                return
+            bump_generation()
+            self.stdout.write(self.style.SUCCESS('Retired every cached list page'))
+            return
+
+        progress = options.get('progress') or (lambda *args, **kwargs: None)
+        deleted = delete_matching(
+            options['pattern'] or f'{LIST_CACHE_PREFIX}*',
+            batch_size=options['batch_size'],
+            rate_limit=options['rate_limit'],
+            dry_run=options['dry_run'],
+            progress=lambda count: progress(count, message=f'{count:,} keys'),
+        )
+        if options['dry_run']:
+            self.stdout.write(self.style.SUCCESS(f'{deleted:,} keys match'))
+            return
+        if not options['pattern']:
+            # Every page is gone; a new generation also drops the local tiers of all processes
+            bump_generation()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted:,} keys'))
@@ -0,0 +1,88 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, Value, When
+from django.utils import timezone
+from core import bitmaps
+from core.cache import bump_generation
+from core.models import Address, AppUser
+
+
+class Command(BaseCommand):
+    help = 'Fill in Address.identity_hash, merging duplicate addresses and repointing their users'
+    # Called as progress(done, total, message) when run as a background job
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Addresses handled per transaction (default: 5,000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report duplicates; those spread over several batches are not counted'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        progress = options.get('progress') or (lambda *args, **kwargs: None)
+        total = Address.objects.filter(identity_hash__isnull=True).count()
+        last_id = 0
+        hashed = merged = moved = 0
+
+        # Rows are visited in id order; an address already hashed, else its oldest row, survives
+        while True:
+            batch = list(
+                Address.objects.filter(id__gt=last_id, identity_hash__isnull=True).order_by('id')[:batch_size]
+            )
+            if not batch:
+                break
+            last_id = batch[-1].id
+            with transaction.atomic():
+                counts = self.merge_batch(batch, options['dry_run'])
+            hashed, merged, moved = hashed + counts[0], merged + counts[1], moved + counts[2]
+            self.stdout.write(f'Up to address {last_id:,}: {merged:,} duplicates, {moved:,} users repointed')
+            progress(hashed + merged, total, f'Up to address {last_id:,}')
+
+        if moved and not options['dry_run']:
+            bump_generation()
+        verb = 'Would merge' if options['dry_run'] else 'Merged'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {merged:,} duplicate addresses ({moved:,} users), {hashed:,} addresses hashed'
+        ))
+
+    def merge_batch(self, batch, dry_run):
+        """Returns (addresses hashed, duplicates merged, users repointed)."""
+        for address in batch:
+            address.identity_hash = address.compute_identity_hash()
+        canonical = Address.objects.in_bulk({address.identity_hash for address in batch}, field_name='identity_hash')
+
+        keep, duplicates = [], {}  # duplicate id -> surviving id
+        for address in batch:
+            survivor = canonical.setdefault(address.identity_hash, address)
+            if survivor is address:
+                keep.append(address)
+            else:
+                duplicates[address.id] = survivor.id
+
+        if not dry_run and duplicates:
+            # Until this transaction ends, a write pointing a user at a doomed
+            # address waits on the row lock, and then fails on the foreign key
+            list(Address.objects.select_for_update().filter(id__in=duplicates).values_list('id'))
+        user_ids = list(AppUser.objects.filter(address_id__in=duplicates).values_list('id', flat=True))
+        if dry_run:
+            return len(keep), len(duplicates), len(user_ids)
+
+        if duplicates:
+            previous = bitmaps.capture(user_ids)
+            AppUser.objects.filter(address_id__in=duplicates).update(
+                address_id=Case(*[When(address_id=old, then=Value(new)) for old, new in duplicates.items()]),
+                last_updated=timezone.now(),
+            )
+            # Never cascades to a user: an address still in use is left for the next run
+            Address.objects.filter(id__in=duplicates).exclude(users__isnull=False).delete()
+            bitmaps.schedule_sync(user_ids, previous)
+        Address.objects.bulk_update(keep, ['identity_hash'])
+        return len(keep), len(duplicates), len(user_ids)
@@ -0,0 +1,50 @@
+from django.core.management.base import BaseCommand, CommandError
+from core import query_plans
+
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the list endpoint queries of the plan catalogue against the current database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--case',
+            action='append',
+            dest='cases',
+            help='Only this catalogue case; repeat for several (default: all)'
+        )
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Run the page queries (EXPLAIN ANALYZE) and report their execution time'
+        )
+
+    def handle(self, *args, **options):
+        if not query_plans.is_available():
+            raise CommandError('Query plans are only explained on PostgreSQL')
+        cases = query_plans.CATALOGUE
+        if options['cases']:
+            unknown = set(options['cases']) - {case.name for case in cases}
+            if unknown:
+                raise CommandError(f"Unknown cases: {', '.join(sorted(unknown))}")
+            cases = [case for case in cases if case.name in options['cases']]
+
+        failed = 0
+        for case in cases:
+            plan, problems = query_plans.check(case)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{case.name} {case.params}'))
+            if case.description:
+                self.stdout.write(f'  {case.description}')
+            for line in query_plans.summarize(plan):
+                self.stdout.write(f'    {line}')
+            if options['analyze']:
+                _, page = query_plans.page_queryset(case.params)
+                timing = query_plans.explain_analyze(page)
+                self.stdout.write(
+                    f"  planning {timing['Planning Time']:.2f} ms, execution {timing['Execution Time']:.2f} ms"
+                )
+            for problem in problems:
+                self.stdout.write(self.style.ERROR(f'  {problem}'))
+            failed += bool(problems)
+
+        summary = f'{len(cases) - failed} of {len(cases)} plans as expected'
+        self.stdout.write(self.style.ERROR(summary) if failed else self.style.SUCCESS(summary))
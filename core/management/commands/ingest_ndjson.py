@@ -0,0 +1,34 @@
+import sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.ingest import ingest
+
+
+class Command(BaseCommand):
+    help = 'Upsert customers and relationships from an NDJSON file (one customer per line)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            help='NDJSON file to read, or - for standard input'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=settings.INGEST_BATCH_SIZE,
+            help='Rows written per transaction (default: INGEST_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            result = ingest(sys.stdin, batch_size=options['batch_size'])
+        else:
+            with open(options['path'], encoding='utf-8') as lines:
+                result = ingest(lines, batch_size=options['batch_size'])
+
+        for error in result.errors:
+            self.stderr.write(f"line {error['line']} ({error['customer_id'] or '-'}): {error['errors']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"Read {result.received:,} rows: {result.created:,} created, {result.updated:,} updated, "
+            f"{result.relationships:,} relationships submitted, {len(result.errors):,} errors"
+        ))
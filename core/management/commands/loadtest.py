@@ -0,0 +1,105 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.error import HTTPError, URLError
+from urllib.request import Request, urlopen
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+class Command(BaseCommand):
+    help = 'Fire concurrent requests at an endpoint and report throughput and latency percentiles'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--url',
+            action='append',
+            dest='urls',
+            help='Endpoint to load; repeat to benchmark several endpoints side by side '
+                 '(default: the AppUser list endpoint)'
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=1000,
+            help='Total number of requests to send (default: 1,000)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=32,
+            help='Number of requests in flight at once (default: 32)'
+        )
+        parser.add_argument(
+            '--pages',
+            type=int,
+            default=1,
+            help='Spread requests over this many pages to mix cache hits and misses (default: 1)'
+        )
+        parser.add_argument(
+            '--label',
+            default='',
+            help='Label printed with the results, e.g. the worker class under test'
+        )
+
+    def handle(self, *args, **options):
+        throttled = sum(self.run(url, options) for url in options['urls'] or ['http://localhost:8000/api/v1/appusers/'])
+        if throttled:
+            raise CommandError(
+                f'{throttled:,} requests were rate limited (429), so the results measure the limits rather '
+                f'than the server; run the server under test with THROTTLE_ENABLED=0'
+            )
+
+    def run(self, url, options):
+        """Load ``url`` and report the results; returns the number of rate limited requests."""
+        total = options['requests']
+        pages = max(options['pages'], 1)
+        separator = '&' if '?' in url else '?'
+        urls = [
+            url if pages == 1 else f"{url}{separator}page={i % pages + 1}"
+            for i in range(total)
+        ]
+
+        self.stdout.write(
+            f"Sending {total:,} requests to {url} with concurrency {options['concurrency']}"
+        )
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = list(pool.map(self.fetch, urls))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency for status, latency in results if status == 200)
+        throttled = sum(1 for status, _ in results if status == 429)
+        errors = len(results) - len(latencies) - throttled
+        if not latencies:
+            self.stdout.write(self.style.ERROR(f"All {len(results):,} requests failed ({throttled:,} rate limited)"))
+            return throttled
+
+        label = f"[{' '.join(filter(None, [options['label'], url]))}] "
+        self.stdout.write(self.style.SUCCESS(
+            f"{label}{len(latencies) / elapsed:,.1f} req/s, "
+            f"p50 {self.percentile(latencies, 50) * 1000:.1f} ms, "
+            f"p95 {self.percentile(latencies, 95) * 1000:.1f} ms, "
+            f"p99 {self.percentile(latencies, 99) * 1000:.1f} ms, "
+            f"mean {statistics.fmean(latencies) * 1000:.1f} ms, "
+            f"errors {errors:,}, rate limited {throttled:,}"
+        ))
+        return throttled
+
+    def fetch(self, url):
+        """Fetch one URL and return (HTTP status, None if there was no response, latency in seconds)"""
+        start = time.perf_counter()
+        try:
+            with urlopen(Request(url, headers={'Accept': 'application/json'}), timeout=60) as response:
+                response.read()
+                status = response.status
+        except HTTPError as e:
+            status = e.code
+        except (URLError, TimeoutError, ConnectionError):
+            status = None
+        return status, time.perf_counter() - start
+
+    @staticmethod
+    def percentile(sorted_values, pct):
+        index = min(len(sorted_values) - 1, round(pct / 100 * (len(sorted_values) - 1)))
+        return sorted_values[index]
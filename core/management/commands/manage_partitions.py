@@ -0,0 +1,57 @@
+from datetime import datetime, timezone as dt_timezone
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from core import partitions
+
+
+class Command(BaseCommand):
+    help = 'Create upcoming monthly CustomerRelationship partitions and detach old ones (PostgreSQL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--months-ahead',
+            type=int,
+            default=settings.RELATIONSHIP_PARTITION_MONTHS_AHEAD,
+            help='Create partitions up to this many months ahead (default: RELATIONSHIP_PARTITION_MONTHS_AHEAD)'
+        )
+        parser.add_argument(
+            '--detach-before',
+            metavar='YYYY-MM',
+            help='Detach the partitions of months before this one; their tables are kept for archiving'
+        )
+        parser.add_argument(
+            '--drop',
+            action='store_true',
+            help='Drop the partitions detached with --detach-before'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Only list the attached partitions'
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.is_supported(connection) or not partitions.is_partitioned(connection):
+            raise CommandError('CustomerRelationship is only partitioned on PostgreSQL (see migration 0007)')
+
+        if options['list']:
+            for name in partitions.list_partitions(connection):
+                self.stdout.write(name)
+            return
+
+        created = partitions.ensure_partitions(
+            connection, partitions.oldest_month(connection), options['months_ahead']
+        )
+        self.stdout.write(f"Created {len(created)} partitions{': ' + ', '.join(created) if created else ''}")
+
+        if options['detach_before']:
+            try:
+                before = datetime.strptime(options['detach_before'], '%Y-%m').replace(tzinfo=dt_timezone.utc)
+            except ValueError:
+                raise CommandError('--detach-before expects YYYY-MM')
+            detached = partitions.detach_partitions(connection, before, drop=options['drop'])
+            verb = 'Dropped' if options['drop'] else 'Detached'
+            self.stdout.write(f"{verb} {len(detached)} partitions{': ' + ', '.join(detached) if detached else ''}")
+
+        self.stdout.write(self.style.SUCCESS('Partitions are up to date'))
@@ -3,12 +3,14 @@ import string
 from datetime import date, datetime, timedelta
 from django.core.management.base import BaseCommand
 from django.db import transaction
-from faker import Faker
+from core import jobs
 from core.models import Address, AppUser, CustomerRelationship
 from django.utils import timezone
 
 class Command(BaseCommand):
     help = 'Populate database with sample data'
+    # Called as progress(done, total, message) when run as a background job
+    stealth_options = ('progress',)
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -28,11 +30,30 @@ class Command(BaseCommand):
             action='store_true',
             help='Skip address creation (use existing addresses)'
         )
+        parser.add_argument(
+            '--background',
+            action='store_true',
+            help='Queue a background job for run_jobs instead of running here'
+        )
 
     def handle(self, *args, **options):
+        if options['background']:
+            job = jobs.enqueue(
+                'populate_data',
+                users=options['users'],
+                batch_size=options['batch_size'],
+                skip_addresses=options['skip_addresses'],
+            )
+            self.stdout.write(self.style.SUCCESS(f'Queued job {job.id}'))
+            return
+
+        # Imported here: loading Faker and its locales takes longer than the
+        # rest of the command, and the job queue loads this module to check options
+        from faker import Faker
         fake = Faker(['en_US', 'de_DE', 'fr_FR'])
         num_users = options['users']
         batch_size = options['batch_size']
+        self.progress = options.get('progress') or (lambda *args, **kwargs: None)
         
         self.stdout.write(f"Creating {num_users:,} users in batches of {batch_size:,}")
         
@@ -72,10 +93,11 @@ class Command(BaseCommand):
                 )
                 batch_addresses.append(address)
             
-            # Bulk create and get back the objects with IDs
-            created_addresses = Address.objects.bulk_create(batch_addresses)
+            # Get or create by address identity and get back the objects with IDs
+            created_addresses = Address.objects.bulk_get_or_create(batch_addresses, batch_size=batch_size)
             addresses.extend(created_addresses)
             total_created += len(created_addresses)
+            self.progress(0, num_addresses, f"Created {total_created:,} addresses")
             
             if batch_start % (batch_size * 10) == 0:
                 self.stdout.write(f"Created {total_created:,} addresses...")
@@ -127,6 +149,7 @@ class Command(BaseCommand):
                 CustomerRelationship.objects.bulk_create(batch_relationships)
             
             total_created += len(created_users)
+            self.progress(total_created, len(addresses), f"Created {total_created:,} users")
             
             if batch_start % (batch_size * 10) == 0:
                 self.stdout.write(f"Created {total_created:,} users and relationships...")
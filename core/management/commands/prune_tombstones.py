@@ -0,0 +1,22 @@
+from datetime import timedelta
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from core.models import AppUserTombstone
+
+
+class Command(BaseCommand):
+    help = 'Delete AppUser tombstones older than the change feed retention'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=settings.CHANGES_TOMBSTONE_RETENTION_DAYS,
+            help='Keep tombstones this many days (default: CHANGES_TOMBSTONE_RETENTION_DAYS)'
+        )
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        deleted, _ = AppUserTombstone.objects.filter(deleted_at__lt=cutoff).delete()
+        self.stdout.write(self.style.SUCCESS(f'Deleted {deleted:,} tombstones older than {options["days"]} days'))
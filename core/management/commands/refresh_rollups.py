@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+from core.analytics import DIMENSIONS, refresh_rollup
+
+
+class Command(BaseCommand):
+    help = 'Fold new rows into the analytics rollups, rebuilding those with updated or deleted rows (or all with --full)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dimension',
+            action='append',
+            choices=DIMENSIONS,
+            help='Dimension to refresh; repeat for several (default: all)'
+        )
+        parser.add_argument(
+            '--full',
+            action='store_true',
+            help='Rebuild from scratch, even rollups without updates or deletes of existing rows'
+        )
+
+    def handle(self, *args, **options):
+        for dimension in options['dimension'] or DIMENSIONS:
+            seen = refresh_rollup(dimension, full=options['full'])
+            self.stdout.write(f"{dimension}: folded in {seen:,} rows")
+        self.stdout.write(self.style.SUCCESS('Successfully refreshed the rollups'))
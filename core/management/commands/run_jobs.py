@@ -0,0 +1,39 @@
+import signal
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core import jobs
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (see core/jobs.py)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.JOBS_WORKER_CONCURRENCY,
+            help=f'Jobs run at once (default: {settings.JOBS_WORKER_CONCURRENCY})'
+        )
+        parser.add_argument(
+            '--burst',
+            action='store_true',
+            help='Exit once the queue is empty instead of waiting for more jobs'
+        )
+
+    def handle(self, *args, **options):
+        worker = jobs.Worker(concurrency=options['concurrency'])
+        # Finish the running jobs, then exit
+        signal.signal(signal.SIGTERM, lambda *args: worker.stop())
+        self.stdout.write(f"Running jobs with concurrency {options['concurrency']}")
+        try:
+            worker.run(burst=options['burst'], on_finish=self.report)
+        except KeyboardInterrupt:
+            worker.stop()
+        self.stdout.write(self.style.SUCCESS('Worker stopped'))
+
+    def report(self, job):
+        line = f'{job.task} {job.id}: {job.status}'
+        if job.error:
+            self.stdout.write(self.style.WARNING(f'{line} ({job.error})'))
+        else:
+            self.stdout.write(line)
@@ -0,0 +1,82 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from core.cache import decay_popularity
+from core.warming import warm_popular
+
+
+class Command(BaseCommand):
+    help = 'Pre-render the most requested AppUser list pages before their cache entries expire'
+    # Called after every pass when run as a background job, which also lets --interval runs be cancelled
+    stealth_options = ('progress',)
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--top',
+            type=int,
+            default=settings.CACHE_WARM_TOP_N,
+            help=f'Number of most popular request signatures to keep warm (default: {settings.CACHE_WARM_TOP_N})'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=settings.CACHE_WARM_CONCURRENCY,
+            help=f'Pages rendered in parallel, i.e. DB connections used (default: {settings.CACHE_WARM_CONCURRENCY})'
+        )
+        parser.add_argument(
+            '--refresh-before',
+            type=int,
+            default=settings.CACHE_WARM_REFRESH_BEFORE,
+            help='Re-render entries with less than this many seconds to live '
+                 f'(default: {settings.CACHE_WARM_REFRESH_BEFORE})'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Re-render every popular page regardless of its remaining TTL'
+        )
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running, warming every N seconds (default: run once)'
+        )
+        parser.add_argument(
+            '--decay',
+            type=float,
+            default=0.5,
+            help='Multiply popularity scores by this factor after each pass so recent traffic wins (default: 0.5)'
+        )
+
+    def handle(self, *args, **options):
+        progress = options.get('progress') or (lambda *args, **kwargs: None)
+        passes = 0
+        while True:
+            self.warm(options)
+            passes += 1
+            progress(passes, message=f'{passes} warming passes')
+            if options['interval'] <= 0:
+                break
+            time.sleep(options['interval'])
+
+    def warm(self, options):
+        results = warm_popular(
+            top=options['top'],
+            concurrency=options['concurrency'],
+            refresh_before=options['refresh_before'],
+            force=options['force'],
+        )
+        if results is None:
+            self.stdout.write(self.style.WARNING('Another warmer is running, skipping this pass'))
+            return
+
+        for result in results:
+            if result.status == 'failed':
+                self.stdout.write(self.style.WARNING(f"Failed to warm {result.signature}: {result.detail}"))
+
+        if options['decay'] < 1:
+            decay_popularity(options['decay'])
+
+        warmed = sum(1 for result in results if result.status == 'warmed')
+        fresh = sum(1 for result in results if result.status == 'fresh')
+        self.stdout.write(self.style.SUCCESS(f'Warmed {warmed} pages, {fresh} still fresh'))
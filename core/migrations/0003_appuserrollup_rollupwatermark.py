@@ -0,0 +1,54 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:05
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0002_alter_appuser_birthday_alter_appuser_created_and_more"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="RollupWatermark",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dimension", models.CharField(max_length=32, unique=True)),
+                ("last_id", models.BigIntegerField(default=0)),
+                (
+                    "refreshed_at",
+                    models.DateTimeField(default=django.utils.timezone.now),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="AppUserRollup",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("dimension", models.CharField(max_length=32)),
+                ("bucket", models.CharField(max_length=100)),
+                ("count", models.BigIntegerField(default=0)),
+            ],
+            options={
+                "unique_together": {("dimension", "bucket")},
+            },
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:13
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0003_appuserrollup_rollupwatermark"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AppUserTombstone",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("appuser_id", models.BigIntegerField()),
+                ("customer_id", models.CharField(max_length=50)),
+                ("deleted_at", models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="appuser",
+            index=models.Index(
+                fields=["last_updated", "id"], name="core_appuse_last_up_0aa0ff_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="appusertombstone",
+            index=models.Index(
+                fields=["deleted_at", "id"], name="core_appuse_deleted_d2d61d_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0004_appusertombstone_change_feed_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="address",
+            name="identity_hash",
+            field=models.CharField(
+                blank=True, editable=False, max_length=64, null=True, unique=True
+            ),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 06:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0005_address_identity_hash"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="customerrelationship",
+            name="core_custom_appuser_2afa1c_idx",
+        ),
+        migrations.AlterField(
+            model_name="customerrelationship",
+            name="appuser",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="relationships",
+                to="core.appuser",
+            ),
+        ),
+    ]
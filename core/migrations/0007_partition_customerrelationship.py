@@ -0,0 +1,79 @@
+from django.conf import settings
+from django.db import migrations
+from django.utils import timezone
+
+from core import partitions
+
+
+def partition_customerrelationship(apps, schema_editor):
+    """
+    Rebuild core_customerrelationship as a table range partitioned by month
+    of ``created``, keeping its rows, ids, constraints and index names.
+    PostgreSQL only; other databases keep the plain table.
+    """
+    connection = schema_editor.connection
+    if not partitions.is_supported(connection) or partitions.is_partitioned(connection):
+        return
+
+    model = apps.get_model("core", "CustomerRelationship")
+    table = model._meta.db_table
+    old_table = f"{table}_unpartitioned"
+    appuser_table = apps.get_model("core", "AppUser")._meta.db_table
+    unique_name = schema_editor._create_index_name(table, ["appuser_id", "created"], suffix="_uniq")
+    fk_name = schema_editor._create_index_name(table, ["appuser_id"], suffix=f"_fk_{appuser_table}_id")
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"ALTER TABLE {table} RENAME TO {old_table}")
+        cursor.execute(
+            f"""
+            CREATE TABLE {table} (
+                id bigint GENERATED BY DEFAULT AS IDENTITY,
+                points integer NOT NULL,
+                created timestamp with time zone NOT NULL,
+                last_activity timestamp with time zone NULL,
+                appuser_id bigint NOT NULL
+            ) PARTITION BY RANGE (created)
+            """
+        )
+        cursor.execute(f"CREATE TABLE {partitions.DEFAULT_PARTITION} PARTITION OF {table} DEFAULT")
+        cursor.execute(f"SELECT MIN(created) FROM {old_table}")
+        first = cursor.fetchone()[0]
+
+    partitions.ensure_partitions(connection, first or timezone.now(), settings.RELATIONSHIP_PARTITION_MONTHS_AHEAD)
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (id, points, created, last_activity, appuser_id)
+            SELECT id, points, created, last_activity, appuser_id FROM {old_table}
+            """
+        )
+        # Frees the constraint and index names for the new table
+        cursor.execute(f"DROP TABLE {old_table}")
+        # A partitioned table's primary key has to include the partition key
+        cursor.execute(f"ALTER TABLE {table} ADD PRIMARY KEY (id, created)")
+        cursor.execute("SELECT pg_get_serial_sequence(%s, 'id')", [table])
+        cursor.execute(f"ALTER SEQUENCE {cursor.fetchone()[0]} RENAME TO {table}_id_seq")
+        cursor.execute(f"ALTER TABLE {table} ADD CONSTRAINT {unique_name} UNIQUE (appuser_id, created)")
+        cursor.execute(
+            f"ALTER TABLE {table} ADD CONSTRAINT {fk_name} FOREIGN KEY (appuser_id) "
+            f"REFERENCES {appuser_table} (id) DEFERRABLE INITIALLY DEFERRED"
+        )
+        for index in model._meta.indexes:
+            schema_editor.execute(index.create_sql(model, schema_editor))
+        cursor.execute(
+            f"SELECT setval(pg_get_serial_sequence(%s, 'id'), COALESCE(MAX(id), 0) + 1, false) FROM {table}",
+            [table],
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0006_drop_redundant_relationship_indexes"),
+    ]
+
+    operations = [
+        # The partitioned table is compatible with the model, so reverting leaves it in place
+        migrations.RunPython(partition_customerrelationship, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:06
+
+import django.db.models.expressions
+import django.db.models.functions.datetime
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0007_partition_customerrelationship"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="appuser",
+            index=models.Index(
+                django.db.models.expressions.CombinedExpression(
+                    django.db.models.expressions.CombinedExpression(
+                        django.db.models.functions.datetime.ExtractMonth("birthday"),
+                        "*",
+                        models.Value(100),
+                    ),
+                    "+",
+                    django.db.models.functions.datetime.ExtractDay("birthday"),
+                ),
+                name="core_appuser_birthday_md_idx",
+            ),
+        ),
+    ]
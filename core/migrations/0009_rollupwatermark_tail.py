@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 07:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0008_appuser_birthday_month_day_index"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rollupwatermark",
+            name="pending_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rollupwatermark",
+            name="pending_id",
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rollupwatermark",
+            name="tail",
+            field=models.JSONField(default=dict),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 14:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("core", "0009_rollupwatermark_tail"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="rollupwatermark",
+            name="changed_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="rollupwatermark",
+            name="rebuilt_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
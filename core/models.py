@@ -1,13 +1,65 @@
+import hashlib
+import unicodedata
 from datetime import date
-from django.db import models
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, models, transaction
+from django.db.models.functions import ExtractDay, ExtractMonth
 from django.core.validators import MinValueValidator, MaxValueValidator, MinLengthValidator
 from django.utils import timezone
+ADDRESS_IDENTITY_FIELDS = ("street", "street_number", "city_code", "city", "country")
+# Month and day of the birthday as one number, 1231 for December 31st. The
+# anniversary filters compare this same expression, so that PostgreSQL
+# answers them from the index on it instead of extracting on every row.
+BIRTHDAY_MONTH_DAY = ExtractMonth("birthday") * 100 + ExtractDay("birthday")
+
+
+def normalize_address_part(value):
+    """Canonical form of one address field: Unicode NFKC, case folded, single spaces."""
+    return " ".join(unicodedata.normalize("NFKC", value or "").casefold().split())
+
+
+def address_identity_hash(street, street_number, city_code, city, country):
+    parts = (street, street_number, city_code, city, country)
+    canonical = "\x1f".join(normalize_address_part(part) for part in parts)
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+class AddressManager(models.Manager):
+    def bulk_get_or_create(self, addresses, batch_size=1000):
+        """
+        Saved Address rows for the unsaved ``addresses``, in the same order:
+        existing rows with the same identity are reused, the others are
+        inserted. Duplicates within ``addresses`` map to one row, and
+        concurrent inserts of the same address are resolved by the unique
+        ``identity_hash`` index.
+        """
+        addresses = list(addresses)
+        for address in addresses:
+            address.identity_hash = address.compute_identity_hash()
+
+        found = {}
+        for start in range(0, len(addresses), batch_size):
+            batch = {address.identity_hash: address for address in addresses[start:start + batch_size]}
+            batch = {identity: address for identity, address in batch.items() if identity not in found}
+            found.update(self.in_bulk(list(batch), field_name="identity_hash"))
+            missing = [address for identity, address in batch.items() if identity not in found]
+            if missing:
+                self.bulk_create(missing, ignore_conflicts=True)
+                # ignore_conflicts returns no ids; read back ours and any concurrent winner
+                found.update(self.in_bulk([address.identity_hash for address in missing], field_name="identity_hash"))
+        return [found[address.identity_hash] for address in addresses]
+
+
 class Address(models.Model):
     street = models.CharField(max_length=255, validators=[MinLengthValidator(2)])
     street_number = models.CharField(max_length=20)
     city_code = models.CharField(max_length=20, db_index=True)
     city = models.CharField(max_length=100, validators=[MinLengthValidator(2)])
     country = models.CharField(max_length=100, validators=[MinLengthValidator(2)])
+    # SHA-256 of the normalized fields; null only for rows predating it (see dedupe_addresses)
+    identity_hash = models.CharField(max_length=64, unique=True, null=True, blank=True, editable=False)
+
+    objects = AddressManager()
 
     class Meta:
         indexes = [
@@ -18,6 +70,34 @@ class Address(models.Model):
     def __str__(self):
         return f"{self.street} {self.street_number}, {self.city}, {self.country}"
 
+    def compute_identity_hash(self):
+        return address_identity_hash(*(getattr(self, name) for name in ADDRESS_IDENTITY_FIELDS))
+
+    def duplicate(self):
+        """Another saved address with the identity of this one, if any."""
+        return Address.objects.filter(identity_hash=self.compute_identity_hash()).exclude(pk=self.pk).first()
+
+    def reject_duplicate(self):
+        if (existing := self.duplicate()) is not None:
+            raise ValidationError(f"This is the same address as {existing.pk}", code="duplicate_address")
+
+    def clean(self):
+        super().clean()
+        self.reject_duplicate()
+
+    def save(self, *args, **kwargs):
+        self.identity_hash = self.compute_identity_hash()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) & set(ADDRESS_IDENTITY_FIELDS):
+            kwargs["update_fields"] = {*update_fields, "identity_hash"}
+        try:
+            # A savepoint, so that the caller's transaction survives a duplicate
+            with transaction.atomic():
+                super().save(*args, **kwargs)
+        except IntegrityError:
+            self.reject_duplicate()
+            raise
+
 
 class AppUser(models.Model):
     GENDER_CHOICES = [
@@ -59,6 +139,9 @@ class AppUser(models.Model):
             models.Index(fields=["created"]),
             models.Index(fields=["address"]),
             models.Index(fields=["birthday"]),
+            models.Index(BIRTHDAY_MONTH_DAY, name="core_appuser_birthday_md_idx"),
+            # Change feed order, see core/changes.py
+            models.Index(fields=["last_updated", "id"]),
         ]
         ordering = ["-created"]
 
@@ -67,14 +150,18 @@ class AppUser(models.Model):
 
 
 class CustomerRelationship(models.Model):
-    appuser = models.ForeignKey(AppUser, on_delete=models.CASCADE, related_name="relationships")
+    """
+    One activity record of an AppUser. On PostgreSQL the table is range
+    partitioned by month of ``created`` (see core/partitions.py).
+    """
+    # Lookups by appuser are served by the (appuser, created) unique index
+    appuser = models.ForeignKey(AppUser, on_delete=models.CASCADE, related_name="relationships", db_index=False)
     points = models.IntegerField()
     created = models.DateTimeField(default=timezone.now)
     last_activity = models.DateTimeField(blank=True, null=True)
 
     class Meta:
         indexes = [
-            models.Index(fields=["appuser"]),
             models.Index(fields=["created"]),
             models.Index(fields=["last_activity"]),
             models.Index(fields=["points"]),
@@ -83,3 +170,59 @@ class CustomerRelationship(models.Model):
 
     def __str__(self):
         return f"User: {self.appuser_id}, Points: {self.points}"
+
+
+class AppUserRollup(models.Model):
+    """
+    Precomputed counts per value of an analytics dimension (see core/analytics.py),
+    maintained incrementally by the refresh_rollups command.
+    """
+    dimension = models.CharField(max_length=32)
+    bucket = models.CharField(max_length=100)
+    count = models.BigIntegerField(default=0)
+
+    class Meta:
+        unique_together = [("dimension", "bucket")]
+
+    def __str__(self):
+        return f"{self.dimension}={self.bucket}: {self.count}"
+
+
+class RollupWatermark(models.Model):
+    """
+    Progress of the rollups of a dimension: rows up to ``last_id`` are
+    settled, the counts of the rows above it (the tail) are kept in ``tail``
+    and aggregated again on every refresh. ``changed_at`` is the last update
+    or delete of a source row, which only a rebuild picks up (see
+    core/analytics.py).
+    """
+    dimension = models.CharField(max_length=32, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    # Highest id seen by the refresh at pending_at, settled once that is CHANGES_SETTLE_SECONDS old
+    pending_id = models.BigIntegerField(null=True, blank=True)
+    pending_at = models.DateTimeField(null=True, blank=True)
+    tail = models.JSONField(default=dict)
+    refreshed_at = models.DateTimeField(default=timezone.now)
+    rebuilt_at = models.DateTimeField(null=True, blank=True)
+    changed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.dimension} up to id {self.last_id}"
+
+
+class AppUserTombstone(models.Model):
+    """
+    Record of a deleted AppUser, written in the deleting transaction, so the
+    change feed (core/changes.py) can report deletions.
+    """
+    appuser_id = models.BigIntegerField()
+    customer_id = models.CharField(max_length=50)
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["deleted_at", "id"]),
+        ]
+
+    def __str__(self):
+        return f"AppUser {self.appuser_id} deleted at {self.deleted_at}"
@@ -0,0 +1,143 @@
+"""
+Monthly range partitions of the CustomerRelationship table (PostgreSQL only).
+
+The table is partitioned by ``created``: one partition per calendar month
+(UTC), named ``core_customerrelationship_pYYYYMM``, plus a default partition
+catching rows outside every monthly range so that inserts never fail. Each
+partition carries its own, small copy of the indexes, and a month that is
+no longer needed is detached (and archived or dropped) as a whole instead
+of being deleted row by row.
+
+``ensure_partitions`` creates the months up to ``months_ahead`` into the
+future (run ``manage_partitions`` from cron). A month whose rows already
+ended up in the default partition is created empty, filled with those rows
+and attached in one transaction.
+
+The primary key of a partitioned table has to include the partition key,
+so it is ``(id, created)``; ids stay unique through the identity sequence.
+Queries only skip partitions when they constrain ``created``, e.g. the
+relationship prefetch with ``RELATIONSHIP_PREFETCH_WINDOW_DAYS``.
+"""
+
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import transaction
+from django.utils import timezone
+
+PARENT_TABLE = "core_customerrelationship"
+DEFAULT_PARTITION = f"{PARENT_TABLE}_default"
+
+
+def is_supported(connection):
+    return connection.vendor == "postgresql"
+
+
+def month_start(moment):
+    moment = moment.astimezone(dt_timezone.utc) if timezone.is_aware(moment) else moment
+    return datetime(moment.year, moment.month, 1, tzinfo=dt_timezone.utc)
+
+
+def add_months(month, count):
+    index = month.year * 12 + month.month - 1 + count
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def partition_name(month):
+    return f"{PARENT_TABLE}_p{month:%Y%m}"
+
+
+def partition_month(name):
+    """Month of a monthly partition name, ``None`` for the default partition."""
+    suffix = name.removeprefix(f"{PARENT_TABLE}_p")
+    if suffix == name or len(suffix) != 6 or not suffix.isdigit():
+        return None
+    return datetime(int(suffix[:4]), int(suffix[4:]), 1, tzinfo=dt_timezone.utc)
+
+
+def is_partitioned(connection):
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass(%s))",
+            [PARENT_TABLE],
+        )
+        return cursor.fetchone()[0]
+
+
+def list_partitions(connection):
+    """Names of the attached partitions, in name (and so month) order."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT child.relname
+            FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass(%s) AND child.relkind = 'r'
+            ORDER BY child.relname
+            """,
+            [PARENT_TABLE],
+        )
+        return [row[0] for row in cursor.fetchall()]
+
+
+def create_partition(connection, month):
+    """Create and attach the partition for ``month``."""
+    name, lower, upper = partition_name(month), month, add_months(month, 1)
+    bounds = f"FROM ('{lower.isoformat()}') TO ('{upper.isoformat()}')"
+    with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+        cursor.execute(
+            f"SELECT EXISTS (SELECT 1 FROM {DEFAULT_PARTITION} WHERE created >= %s AND created < %s)",
+            [lower, upper],
+        )
+        if not cursor.fetchone()[0]:
+            cursor.execute(f"CREATE TABLE {name} PARTITION OF {PARENT_TABLE} FOR VALUES {bounds}")
+            return
+        # Attaching fails while the default partition holds rows of the range
+        cursor.execute(f"CREATE TABLE {name} (LIKE {PARENT_TABLE} INCLUDING DEFAULTS)")
+        cursor.execute(
+            f"""
+            WITH moved AS (
+                DELETE FROM {DEFAULT_PARTITION} WHERE created >= %s AND created < %s RETURNING *
+            )
+            INSERT INTO {name} SELECT * FROM moved
+            """,
+            [lower, upper],
+        )
+        cursor.execute(f"ALTER TABLE {PARENT_TABLE} ATTACH PARTITION {name} FOR VALUES {bounds}")
+
+
+def ensure_partitions(connection, first_month, months_ahead):
+    """Create the missing monthly partitions from ``first_month`` to ``months_ahead`` from now."""
+    existing = set(list_partitions(connection))
+    month, last = month_start(first_month), add_months(month_start(timezone.now()), months_ahead)
+    created = []
+    while month <= last:
+        if partition_name(month) not in existing:
+            create_partition(connection, month)
+            created.append(partition_name(month))
+        month = add_months(month, 1)
+    return created
+
+
+def oldest_month(connection):
+    """Month of the oldest monthly partition, or of the current month without any."""
+    months = [month for month in map(partition_month, list_partitions(connection)) if month]
+    return min(months, default=month_start(timezone.now()))
+
+
+def detach_partitions(connection, before, drop=False):
+    """
+    Detach the monthly partitions entirely older than ``before``. Detached
+    tables keep their rows (rename or dump them to archive) unless ``drop``.
+    """
+    cutoff = month_start(before)
+    detached = []
+    for name in list_partitions(connection):
+        month = partition_month(name)
+        if month is None or month >= cutoff:
+            continue
+        with transaction.atomic(using=connection.alias), connection.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {PARENT_TABLE} DETACH PARTITION {name}")
+            if drop:
+                cursor.execute(f"DROP TABLE {name}")
+        detached.append(name)
+    return detached
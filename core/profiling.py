@@ -0,0 +1,295 @@
+"""
+Opt-in sampling profiler for slow requests.
+
+``ProfilingMiddleware`` profiles a fraction (``PROFILING_SAMPLE_RATE``) of
+the requests under ``PROFILING_PATH_PREFIX``. With ``PROFILING_SLOW_MS``
+set, another fraction (``PROFILING_SLOW_SAMPLE_RATE``) is watched and kept
+only when slower than that: slow requests are caught in proportion to
+their share of the traffic, without instrumenting every request. While a
+request is watched, one shared background thread samples its Python stack
+every ``PROFILING_INTERVAL_MS`` and every SQL statement it runs is timed.
+The result is written as a speedscope file (https://www.speedscope.app): a
+sampled profile of the Python stacks, which renders as a flame graph, and
+an evented profile with the query timeline.
+
+Profiles are kept in ``PROFILING_DIR`` or in Redis (``PROFILING_STORAGE``),
+the ``PROFILING_MAX_PROFILES`` most recent ones, and can be listed and
+downloaded through the admin-only ``/api/v1/profiles/`` endpoints.
+
+With ``PROFILING_ENABLED`` off, or with neither a sample rate nor a
+watched threshold, the middleware removes itself from the stack at startup
+(``MiddlewareNotUsed``) and costs nothing. Requests that are not watched
+cost one or two random draws. Only sync requests are sampled; async views
+run in the event loop thread, whose stack belongs to no single request.
+"""
+
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+import uuid
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils import timezone
+
+from core.cache import is_django_redis, redis_connection
+
+PROFILE_KEY_PREFIX = "profiling:profile:"
+RECENT_KEY = "profiling:recent"
+SPEEDSCOPE_SCHEMA = "https://www.speedscope.app/file-format-schema.json"
+MAX_SQL_LENGTH = 200
+
+logger = logging.getLogger(__name__)
+
+
+class Recording:
+    """Stack samples and query timings of one request."""
+
+    def __init__(self, thread_id):
+        self.thread_id = thread_id
+        self.started = self.last_sample = time.perf_counter()
+        self.frames = {}  # (name, file, line) -> index
+        self.samples = []  # [frame indexes, root first]
+        self.weights = []  # seconds since the previous sample
+        self.queries = []  # (sql, start, end), seconds since the start
+
+    def add_sample(self, frame, now):
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            key = (getattr(code, "co_qualname", code.co_name), code.co_filename, code.co_firstlineno)
+            stack.append(self.frames.setdefault(key, len(self.frames)))
+            frame = frame.f_back
+        stack.reverse()
+        self.samples.append(stack)
+        self.weights.append(now - self.last_sample)
+        self.last_sample = now
+
+    def record_query(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries.append((sql, start - self.started, time.perf_counter() - self.started))
+
+
+class Sampler:
+    """
+    One daemon thread sampling the stacks of the threads being recorded. It
+    sleeps on a condition while nothing is recorded.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self._recordings = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        recording = Recording(threading.get_ident())
+        with self._condition:
+            self._recordings[recording.thread_id] = recording
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="profiling-sampler", daemon=True)
+                self._thread.start()
+            self._condition.notify()
+        return recording
+
+    def stop(self, recording):
+        with self._condition:
+            self._recordings.pop(recording.thread_id, None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._recordings:
+                    self._condition.wait()
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            now = time.perf_counter()
+            with self._condition:
+                for thread_id, recording in self._recordings.items():
+                    frame = frames.get(thread_id)
+                    if frame is not None:
+                        recording.add_sample(frame, now)
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    global _sampler
+    with _sampler_lock:
+        if _sampler is None:
+            _sampler = Sampler(settings.PROFILING_INTERVAL_MS / 1000)
+        return _sampler
+
+
+def speedscope(recording, name, duration):
+    """The speedscope document of ``recording``, times in milliseconds."""
+    frames = [{"name": name, "file": file, "line": line} for name, file, line in recording.frames]
+    profiles = [{
+        "type": "sampled",
+        "name": f"{name} (Python)",
+        "unit": "milliseconds",
+        "startValue": 0,
+        "endValue": duration * 1000,
+        "samples": recording.samples,
+        "weights": [weight * 1000 for weight in recording.weights],
+    }]
+    if recording.queries:
+        events = []
+        for sql, start, end in recording.queries:
+            frames.append({"name": sql[:MAX_SQL_LENGTH]})
+            events.append({"type": "O", "frame": len(frames) - 1, "at": start * 1000})
+            events.append({"type": "C", "frame": len(frames) - 1, "at": end * 1000})
+        profiles.append({
+            "type": "evented",
+            "name": f"{name} (SQL)",
+            "unit": "milliseconds",
+            "startValue": 0,
+            "endValue": duration * 1000,
+            "events": events,
+        })
+    return {
+        "$schema": SPEEDSCOPE_SCHEMA,
+        "name": name,
+        "exporter": "crm-performance-backend",
+        "shared": {"frames": frames},
+        "profiles": profiles,
+        "activeProfileIndex": 0,
+    }
+
+
+class DirectoryStorage:
+    """Profiles as ``<id>.speedscope.json`` plus ``<id>.meta.json`` in ``PROFILING_DIR``."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+
+    def save(self, meta, document):
+        self.path.mkdir(parents=True, exist_ok=True)
+        (self.path / f"{meta['id']}.speedscope.json").write_text(json.dumps(document))
+        (self.path / f"{meta['id']}.meta.json").write_text(json.dumps(meta))
+        for stale in self._meta_files()[settings.PROFILING_MAX_PROFILES:]:
+            profile_id = stale.name.removesuffix(".meta.json")
+            (self.path / f"{profile_id}.speedscope.json").unlink(missing_ok=True)
+            stale.unlink(missing_ok=True)
+
+    def recent(self, limit):
+        return [json.loads(path.read_text()) for path in self._meta_files()[:limit]]
+
+    def load(self, profile_id):
+        path = self.path / f"{profile_id}.speedscope.json"
+        if not _valid_id(profile_id) or not path.exists():
+            return None
+        return path.read_bytes()
+
+    def _meta_files(self):
+        if not self.path.exists():
+            return []
+        return sorted(self.path.glob("*.meta.json"), key=os.path.getmtime, reverse=True)
+
+
+class RedisStorage:
+    """Profiles in a hash per profile and a sorted set by time, expiring with ``PROFILING_TTL``."""
+
+    def save(self, meta, document):
+        client = redis_connection()
+        key = cache.make_key(f"{PROFILE_KEY_PREFIX}{meta['id']}")
+        recent = cache.make_key(RECENT_KEY)
+        pipe = client.pipeline()
+        pipe.hset(key, mapping={"meta": json.dumps(meta), "document": json.dumps(document)})
+        pipe.expire(key, settings.PROFILING_TTL)
+        pipe.zadd(recent, {meta["id"]: time.time()})
+        pipe.zremrangebyrank(recent, 0, -settings.PROFILING_MAX_PROFILES - 1)
+        pipe.execute()
+
+    def recent(self, limit):
+        client = redis_connection()
+        ids = [profile_id.decode() for profile_id in client.zrevrange(cache.make_key(RECENT_KEY), 0, limit - 1)]
+        pipe = client.pipeline()
+        for profile_id in ids:
+            pipe.hget(cache.make_key(f"{PROFILE_KEY_PREFIX}{profile_id}"), "meta")
+        return [json.loads(meta) for meta in pipe.execute() if meta is not None]
+
+    def load(self, profile_id):
+        if not _valid_id(profile_id):
+            return None
+        return redis_connection().hget(cache.make_key(f"{PROFILE_KEY_PREFIX}{profile_id}"), "document")
+
+
+def _valid_id(profile_id):
+    return len(profile_id) == 32 and all(char in "0123456789abcdef" for char in profile_id)
+
+
+def get_storage():
+    if settings.PROFILING_STORAGE == "redis" and is_django_redis():
+        return RedisStorage()
+    return DirectoryStorage(settings.PROFILING_DIR)
+
+
+class ProfilingMiddleware:
+    """See the module docstring."""
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED or (settings.PROFILING_SAMPLE_RATE <= 0 and not self.watches_slow()):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not request.path.startswith(settings.PROFILING_PATH_PREFIX):
+            return self.get_response(request)
+        sampled = random.random() < settings.PROFILING_SAMPLE_RATE
+        watched = self.watches_slow() and random.random() < settings.PROFILING_SLOW_SAMPLE_RATE
+        if not sampled and not watched:
+            return self.get_response(request)
+
+        sampler = get_sampler()
+        recording = sampler.start()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(recording.record_query))
+                response = self.get_response(request)
+        finally:
+            sampler.stop(recording)
+        duration = time.perf_counter() - recording.started
+
+        slow = watched and duration * 1000 >= settings.PROFILING_SLOW_MS
+        if sampled or slow:
+            try:
+                self.save(request, response, recording, duration, "slow" if slow else "sampled")
+            except Exception:
+                # A profile is never worth failing the request it describes
+                logger.exception("Could not save the profile of %s %s", request.method, request.path)
+        return response
+
+    @staticmethod
+    def watches_slow():
+        return settings.PROFILING_SLOW_MS > 0 and settings.PROFILING_SLOW_SAMPLE_RATE > 0
+
+    def save(self, request, response, recording, duration, reason):
+        name = f"{request.method} {request.get_full_path()}"
+        meta = {
+            "id": uuid.uuid4().hex,
+            "name": name,
+            "status": response.status_code,
+            "duration_ms": round(duration * 1000, 3),
+            "queries": len(recording.queries),
+            "query_ms": round(sum(end - start for _, start, end in recording.queries) * 1000, 3),
+            "samples": len(recording.samples),
+            "reason": reason,
+            "created_at": timezone.now().isoformat(),
+        }
+        get_storage().save(meta, speedscope(recording, name, duration))
+        response["X-Profile-Id"] = meta["id"]
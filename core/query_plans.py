@@ -0,0 +1,185 @@
+"""
+``EXPLAIN (FORMAT JSON)`` of the list endpoint's page queries, to catch a
+change to ``get_queryset``, ``build_appuser_filters`` or the model indexes
+that silently turns an index scan into a sequential scan.
+
+``CATALOGUE`` holds representative filter, ordering and page combinations.
+Each case is built exactly as the list view builds it and states what its
+plan must look like: the index it should be answered from, the tables it
+must not scan sequentially, and how far the planner's row estimate for the
+filters may be from the actual count (stale statistics or a selectivity
+the planner cannot see).
+
+``summarize`` reduces a plan to its shape (node types, relations, indexes)
+without costs, so plans can be compared with stored baselines across runs
+(see core/tests/test_query_plans.py). ``explain_queries`` prints the
+catalogue's plans and timings against the current database. PostgreSQL
+only.
+"""
+
+import json
+import re
+from dataclasses import dataclass, field
+
+from django.db import connection
+from django.test import RequestFactory
+
+# Partitions (core_customerrelationship_p202405) and their indexes change with the calendar
+_PARTITION_RE = re.compile(r"_(p\d{6}|default)(?=_|$)")
+# core_appuser_birthday_md_idx (BIRTHDAY_MONTH_DAY) as PostgreSQL prints it
+BIRTHDAY_MONTH_DAY_KEY = "(EXTRACT(month FROM birthday) * 100::numeric + EXTRACT(day FROM birthday))"
+
+
+@dataclass(frozen=True)
+class PlanCase:
+    name: str
+    params: dict
+    # (table, columns) of an index the page query must scan
+    index: tuple = None
+    # Tables that must not be read with a sequential scan
+    no_seq_scan: tuple = ("core_appuser",)
+    # Estimated rows matching the filters within this factor of the actual count
+    estimate_tolerance: float = 10.0
+    description: str = field(default="", compare=False)
+
+
+CATALOGUE = [
+    PlanCase("default", {}, index=("core_appuser", ("created",)),
+             description="Default ordering, newest first"),
+    PlanCase("ordering_id", {"ordering": "id"}, index=("core_appuser", ("id",))),
+    PlanCase("ordering_last_name", {"ordering": "last_name"}, index=("core_appuser", ("last_name",))),
+    PlanCase("deep_page", {"page": 200}, index=("core_appuser", ("created",)),
+             description="OFFSET 1,990 still walks the created index"),
+    PlanCase("wide_page", {"page_size": 1000, "ordering": "id"}, index=("core_appuser", ("id",))),
+    PlanCase("customer_id", {"customer_id": "PLAN00001234"}, index=("core_appuser", ("customer_id",))),
+    PlanCase("birthday", {"birthday": "1980-06-15"}, index=("core_appuser", ("birthday",))),
+    PlanCase("age_range", {"age_min": 25, "age_max": 34, "ordering": "birthday"},
+             index=("core_appuser", ("birthday",)), description="Ages as a birthday range"),
+    PlanCase("anniversary", {"anniversary_from": "06-10", "anniversary_to": "06-16", "page_size": 1000},
+             index=("core_appuser", (BIRTHDAY_MONTH_DAY_KEY,)),
+             description="A campaign pulling this week's birthdays; small pages walk created instead"),
+    PlanCase("anniversary_new_year", {"anniversary_from": "12-28", "anniversary_to": "01-03", "page_size": 1000},
+             index=("core_appuser", (BIRTHDAY_MONTH_DAY_KEY,)),
+             description="A window wrapping around the end of the year, two ranges of the same index"),
+    PlanCase("updated_after", {"updated_after": "2999-01-01"}, index=("core_appuser", ("last_updated", "id")),
+             description="Change-feed style polling for recent updates"),
+    PlanCase("first_name_partial", {"first_name": "first12"}, no_seq_scan=(), estimate_tolerance=1000.0,
+             description="icontains can use no btree index and the planner guesses its selectivity; "
+                         "only the baseline pins this plan"),
+    PlanCase("country_partial", {"country": "germ"}, index=("core_appuser", ("created",)),
+             estimate_tolerance=50.0, description="Walks created and filters through the address join"),
+    PlanCase("gender_ordering_id", {"gender": "Other", "ordering": "id"}, index=("core_appuser", ("id",))),
+    PlanCase("points_min", {"points_min": 990}, estimate_tolerance=50.0,
+             description="Relationships looked up per user by each partition's (appuser, created) key"),
+]
+
+
+def is_available():
+    return connection.vendor == "postgresql"
+
+
+def page_queryset(params):
+    """The page query of the list view for the query ``params``, as the view builds it."""
+    from core.views import AppUserAsyncListView
+
+    request = RequestFactory().get("/api/v1/appusers/", params)
+    list_view = AppUserAsyncListView().get_list_view(request)
+    queryset = list_view.filter_queryset(list_view.get_queryset(prefetch=False))
+    paginator = list_view.paginator
+    page_size = paginator.get_page_size(list_view.request)
+    page = max(int(params.get("page", 1)), 1)
+    return queryset, queryset[(page - 1) * page_size:page * page_size]
+
+
+def explain(queryset):
+    """The root node of the JSON plan of ``queryset``."""
+    return json.loads(queryset.explain(format="json"))[0]["Plan"]
+
+
+def explain_analyze(queryset):
+    """Run ``queryset`` under ``EXPLAIN ANALYZE``; the plan with actual rows, planning and execution time."""
+    return json.loads(queryset.explain(format="json", analyze=True))[0]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get("Plans", []):
+        yield from plan_nodes(child)
+
+
+def _normalize(name):
+    return _PARTITION_RE.sub("_<partition>", name)
+
+
+def summarize(plan, depth=0):
+    """
+    The shape of ``plan``, one line per node: type, relation and index,
+    indented by depth. Partition names are normalized and identical
+    consecutive siblings (the partitions under an Append) collapsed, so the
+    summary does not change with the calendar.
+    """
+    line = plan["Node Type"]
+    if "Relation Name" in plan:
+        line += f" on {_normalize(plan['Relation Name'])}"
+    if "Index Name" in plan:
+        line += f" using {_normalize(plan['Index Name'])}"
+    lines = ["  " * depth + line]
+    previous = None
+    for child in plan.get("Plans", []):
+        child_lines = summarize(child, depth + 1)
+        if child_lines != previous:
+            lines.extend(child_lines)
+        previous = child_lines
+    return lines
+
+
+def index_columns(index_name):
+    """``(table, keys)`` of an index, by name; a key is a column name or, for an expression, its text."""
+    with connection.cursor() as cursor:
+        cursor.execute(
+            """
+            SELECT t.relname, array_agg(pg_get_indexdef(x.indexrelid, k.ord::int, true) ORDER BY k.ord)
+            FROM pg_class i
+            JOIN pg_index x ON x.indexrelid = i.oid
+            JOIN pg_class t ON t.oid = x.indrelid
+            CROSS JOIN LATERAL unnest(x.indkey) WITH ORDINALITY AS k(attnum, ord)
+            WHERE i.relname = %s
+            GROUP BY t.relname
+            """,
+            [index_name],
+        )
+        row = cursor.fetchone()
+    return (row[0], tuple(row[1])) if row else None
+
+
+def used_indexes(plan):
+    """``(table, columns)`` of every index the plan scans."""
+    return {index_columns(node["Index Name"]) for node in plan_nodes(plan) if "Index Name" in node}
+
+
+def seq_scanned(plan):
+    """Relations read with a sequential scan, partitions normalized."""
+    return {_normalize(node["Relation Name"]) for node in plan_nodes(plan) if node["Node Type"] == "Seq Scan"}
+
+
+def check(case):
+    """
+    Explain ``case`` and check it against its expectations. Returns
+    ``(page plan, problems)``, ``problems`` being a list of messages.
+    """
+    queryset, page = page_queryset(case.params)
+    plan = explain(page)
+    problems = []
+
+    if case.index is not None and case.index not in used_indexes(plan):
+        problems.append(f"expected an index scan on {case.index[0]}({', '.join(case.index[1])})")
+    for table in sorted(seq_scanned(plan) & set(case.no_seq_scan)):
+        problems.append(f"sequential scan on {table}")
+
+    estimated, actual = explain(queryset)["Plan Rows"], queryset.count()
+    if not (max(actual, 1) / case.estimate_tolerance <= max(estimated, 1) <= max(actual, 1) * case.estimate_tolerance):
+        problems.append(
+            f"estimated {estimated:,} matching rows, actually {actual:,} "
+            f"(tolerance {case.estimate_tolerance:g}x); run ANALYZE?"
+        )
+    return plan, problems
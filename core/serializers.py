@@ -1,4 +1,6 @@
+from django.conf import settings
 from rest_framework import serializers
+from core import jobs
 from core.models import AppUser, Address, CustomerRelationship
 
 
@@ -43,3 +45,75 @@ class AppUserSerializer(serializers.ModelSerializer):
             "address",
             "relationships"
         ]
+
+
+class AppUserLookupSerializer(serializers.Serializer):
+    """Input of the batch lookup endpoint: either ``customer_ids`` or ``ids``."""
+    customer_ids = serializers.ListField(
+        child=serializers.CharField(max_length=50),
+        required=False,
+        allow_empty=False,
+        max_length=settings.LOOKUP_MAX_IDS,
+    )
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        required=False,
+        allow_empty=False,
+        max_length=settings.LOOKUP_MAX_IDS,
+    )
+
+    def validate(self, attrs):
+        if ("customer_ids" in attrs) == ("ids" in attrs):
+            raise serializers.ValidationError("Provide exactly one of 'customer_ids' or 'ids'.")
+        return attrs
+
+    @property
+    def lookup(self):
+        """``(field name, de-duplicated values in request order)``"""
+        field = "customer_id" if "customer_ids" in self.validated_data else "id"
+        values = self.validated_data["customer_ids" if field == "customer_id" else "ids"]
+        return field, list(dict.fromkeys(values))
+
+
+class AppUserIngestSerializer(serializers.ModelSerializer):
+    """
+    One NDJSON row of the bulk ingestion endpoint. ``customer_id`` is the
+    upsert key, so it is validated without the uniqueness check.
+    """
+    customer_id = serializers.CharField(max_length=50)
+    address = AddressSerializer()
+    relationships = CustomerRelationshipSerializer(many=True, required=False)
+
+    class Meta:
+        model = AppUser
+        fields = [
+            "customer_id",
+            "first_name",
+            "last_name",
+            "gender",
+            "phone_number",
+            "birthday",
+            "address",
+            "relationships"
+        ]
+
+
+class JobCreateSerializer(serializers.Serializer):
+    """Input of the job endpoint: a registered task and its parameters."""
+    task = serializers.CharField()
+    params = serializers.DictField(required=False, default=dict)
+
+    def validate(self, attrs):
+        try:
+            jobs.validate(attrs["task"], attrs["params"])
+        except jobs.InvalidJob as e:
+            raise serializers.ValidationError(str(e))
+        return attrs
+
+
+class CacheClearSerializer(serializers.Serializer):
+    """Input of the cache clearing endpoint; ``pattern`` is relative to the cache key prefix."""
+    pattern = serializers.CharField(max_length=500)
+    dry_run = serializers.BooleanField(default=False)
+    batch_size = serializers.IntegerField(min_value=1, max_value=10000, default=1000)
+    rate_limit = serializers.IntegerField(min_value=0, default=0)
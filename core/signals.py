@@ -0,0 +1,88 @@
+"""
+Signal receivers keeping derived data in step with writes to the models.
+
+- The bitmap index (core/bitmaps.py) records the users a write affects
+  before it happens and moves them between bitmaps after the transaction
+  commits.
+- The change feed (core/changes.py) needs relationship and address writes
+  to bump ``last_updated`` of their users, and a tombstone per deleted user.
+  Both are written in the same transaction as the change itself.
+- The analytics rollups (core/analytics.py) only fold in new rows; updates
+  and deletes of existing ones mark them for a rebuild.
+"""
+
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import analytics, bitmaps
+from core.models import Address, AppUser, AppUserTombstone, CustomerRelationship
+
+
+def _affected_users(instance):
+    if isinstance(instance, AppUser):
+        return [instance.pk]
+    if isinstance(instance, CustomerRelationship):
+        return [instance.appuser_id]
+    # Country changes of an address move all of its users
+    if instance.pk is None:
+        return []
+    return list(AppUser.objects.filter(address_id=instance.pk).values_list("id", flat=True))
+
+
+@receiver(pre_save, sender=AppUser)
+@receiver(pre_save, sender=Address)
+@receiver(pre_save, sender=CustomerRelationship)
+@receiver(pre_delete, sender=AppUser)
+@receiver(pre_delete, sender=CustomerRelationship)
+def capture_bitmap_memberships(sender, instance, raw=False, **kwargs):
+    # Costs nothing while the index is disabled or was never built
+    if raw or not bitmaps.is_maintained():
+        return
+    instance._bitmap_users = _affected_users(instance)
+    instance._bitmap_previous = bitmaps.capture(instance._bitmap_users)
+
+
+@receiver(post_save, sender=AppUser)
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=CustomerRelationship)
+@receiver(post_delete, sender=AppUser)
+@receiver(post_delete, sender=CustomerRelationship)
+def sync_bitmap_memberships(sender, instance, raw=False, **kwargs):
+    if raw or not hasattr(instance, "_bitmap_users"):
+        return
+    # New users only have an id now
+    user_ids = instance._bitmap_users if instance._bitmap_users != [None] else [instance.pk]
+    bitmaps.schedule_sync(user_ids, instance._bitmap_previous)
+    del instance._bitmap_users, instance._bitmap_previous
+
+
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=CustomerRelationship)
+@receiver(post_delete, sender=CustomerRelationship)
+def touch_appusers(sender, instance, raw=False, created=False, **kwargs):
+    if raw or (sender is Address and created):
+        return
+    # update() skips the AppUser signals: nothing about the bitmaps changes
+    if sender is Address:
+        users = AppUser.objects.filter(address_id=instance.pk)
+    else:
+        users = AppUser.objects.filter(pk=instance.appuser_id)
+    users.update(last_updated=timezone.now())
+
+
+@receiver(post_delete, sender=AppUser)
+def record_tombstone(sender, instance, **kwargs):
+    AppUserTombstone.objects.create(appuser_id=instance.pk, customer_id=instance.customer_id)
+
+
+@receiver(post_save, sender=AppUser)
+@receiver(post_save, sender=Address)
+@receiver(post_save, sender=CustomerRelationship)
+@receiver(post_delete, sender=AppUser)
+@receiver(post_delete, sender=CustomerRelationship)
+def mark_rollups_changed(sender, instance, raw=False, created=False, **kwargs):
+    # New rows are folded in incrementally; AppUser deletes cascade to the relationships
+    if raw or created:
+        return
+    analytics.mark_changed(sender)
@@ -0,0 +1,260 @@
+"""
+Columnar snapshot of AppUser, Address and CustomerRelationship for segment sizing.
+
+``build_snapshot`` exports the columns the list filters work on into NumPy
+``.npy`` files: one array per column, strings dictionary-encoded to integer
+codes, dates as integers. Snapshots are written to a fresh directory under
+``SNAPSHOT_DIR`` and published by atomically repointing the ``current``
+symlink. Readers memory-map the arrays, so every worker process on a host
+shares the same pages through the OS page cache.
+
+``Snapshot.query`` evaluates the ``build_appuser_filters`` predicates as
+vectorised boolean masks. ``icontains`` filters are resolved against the
+(small) dictionary of distinct values first and then applied to the codes
+through a lookup table, so no per-row string work is done. Filters the
+snapshot cannot answer (``customer_id``, ``phone_number``), a snapshot older
+than ``SNAPSHOT_MAX_AGE`` or a missing NumPy all make ``segment`` fall back
+to the database.
+"""
+
+import json
+import os
+import shutil
+import threading
+from datetime import date, datetime
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from common.imports import lazy_import
+from core.filters import active_filter_params, build_appuser_filters
+from core.models import AppUser, CustomerRelationship
+
+# Optional dependency (see pyproject.toml), loaded on first use: it would
+# add tens of milliseconds to the startup of every process importing the views
+np = lazy_import("numpy")
+
+USER_COLUMNS = ("gender", "first_name", "last_name", "city", "street", "country")
+SUPPORTED_FILTERS = {
+    "first_name", "last_name", "gender", "birthday", "city", "street", "country",
+    "points_min", "points_max", "last_activity_after",
+}
+ICONTAINS_FILTERS = ("first_name", "last_name", "city", "street", "country")
+
+NULL_DAYS = -(2 ** 31)
+NULL_SECONDS = -(2 ** 63)
+EPOCH = date(1970, 1, 1)
+
+_lock = threading.Lock()
+_loaded = None
+
+
+def is_available():
+    return np is not None
+
+
+def _days(value):
+    return NULL_DAYS if value is None else (value - EPOCH).days
+
+
+def _seconds(value):
+    return NULL_SECONDS if value is None else int(value.timestamp())
+
+
+def build_snapshot(directory=None, chunk_size=50000):
+    """Export a new snapshot and make it the current one. Returns its path."""
+    if np is None:
+        raise RuntimeError("The snapshot engine requires NumPy")
+
+    root = Path(directory or settings.SNAPSHOT_DIR)
+    root.mkdir(parents=True, exist_ok=True)
+    built_at = timezone.now()
+    name = built_at.strftime("%Y%m%dT%H%M%S%f")
+    staging = root / f".{name}"
+    staging.mkdir()
+
+    encoders = {column: {} for column in USER_COLUMNS}
+    ids, codes, birthdays = [], {column: [] for column in USER_COLUMNS}, []
+    rows = AppUser.objects.order_by("id").values_list(
+        "id", "gender", "first_name", "last_name", "address__city", "address__street",
+        "address__country", "birthday",
+    )
+    for row in rows.iterator(chunk_size=chunk_size):
+        ids.append(row[0])
+        for column, value in zip(USER_COLUMNS, row[1:7]):
+            encoder = encoders[column]
+            codes[column].append(encoder.setdefault(value, len(encoder)))
+        birthdays.append(_days(row[7]))
+
+    user_ids = np.array(ids, dtype=np.int64)
+    np.save(staging / "user_id.npy", user_ids)
+    for column in USER_COLUMNS:
+        np.save(staging / f"{column}.npy", np.array(codes[column], dtype=np.int32))
+    np.save(staging / "birthday.npy", np.array(birthdays, dtype=np.int32))
+
+    appuser_ids, points, last_activity = [], [], []
+    relationships = CustomerRelationship.objects.order_by("id").values_list(
+        "appuser_id", "points", "last_activity"
+    )
+    for appuser_id, rel_points, rel_last_activity in relationships.iterator(chunk_size=chunk_size):
+        appuser_ids.append(appuser_id)
+        points.append(rel_points)
+        last_activity.append(_seconds(rel_last_activity))
+
+    # Relationships point at rows of the user arrays; drop those of users
+    # created after the user scan
+    appuser_ids = np.array(appuser_ids, dtype=np.int64)
+    rel_user = np.searchsorted(user_ids, appuser_ids).astype(np.int32)
+    known = rel_user < len(user_ids)
+    known[known] &= user_ids[rel_user[known]] == appuser_ids[known]
+    np.save(staging / "rel_user.npy", rel_user[known])
+    np.save(staging / "rel_points.npy", np.array(points, dtype=np.int32)[known])
+    np.save(staging / "rel_last_activity.npy", np.array(last_activity, dtype=np.int64)[known])
+
+    dictionaries = {column: list(encoders[column]) for column in USER_COLUMNS}
+    (staging / "dictionaries.json").write_text(json.dumps(dictionaries))
+    (staging / "meta.json").write_text(json.dumps({
+        "built_at": built_at.isoformat(),
+        "users": len(user_ids),
+        "relationships": int(known.sum()),
+    }))
+
+    final = root / name
+    staging.rename(final)
+    link = root / "current.tmp"
+    if link.is_symlink():
+        link.unlink()
+    link.symlink_to(name)
+    os.replace(link, root / "current")
+
+    # Keep the previous snapshot for readers that resolved it a moment ago
+    for old in sorted(path for path in root.iterdir() if path.is_dir() and not path.is_symlink())[:-2]:
+        shutil.rmtree(old, ignore_errors=True)
+    return final
+
+
+class Snapshot:
+    """A loaded, memory-mapped snapshot."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        meta = json.loads((self.path / "meta.json").read_text())
+        self.built_at = datetime.fromisoformat(meta["built_at"])
+        self.dictionaries = json.loads((self.path / "dictionaries.json").read_text())
+        self._folded = {
+            column: [value.casefold() for value in values]
+            for column, values in self.dictionaries.items()
+        }
+        self.columns = {
+            name.stem: np.load(name, mmap_mode="r")
+            for name in self.path.glob("*.npy")
+        }
+
+    @property
+    def age(self):
+        return (timezone.now() - self.built_at).total_seconds()
+
+    def _codes_mask(self, column, predicate, folded=True):
+        """Mask of the rows whose ``column`` value satisfies ``predicate``, evaluated once per distinct value."""
+        values = self._folded[column] if folded else self.dictionaries[column]
+        lookup = np.fromiter((predicate(value) for value in values), dtype=bool, count=len(values))
+        return lookup[self.columns[column]]
+
+    def mask(self, params):
+        """
+        Boolean mask over the user arrays for the filters in ``params``, or
+        ``None`` when a filter cannot be answered from the snapshot.
+        """
+        if active_filter_params(params) - SUPPORTED_FILTERS:
+            return None
+
+        mask = np.ones(len(self.columns["user_id"]), dtype=bool)
+        for column in ICONTAINS_FILTERS:
+            if (value := params.get(column)) and value.strip():
+                needle = value.strip().casefold()
+                mask &= self._codes_mask(column, lambda candidate: needle in candidate)
+
+        if (gender := params.get("gender")) and gender.strip():
+            wanted = gender.strip()
+            mask &= self._codes_mask("gender", lambda candidate: candidate == wanted, folded=False)
+
+        if bday := params.get("birthday"):
+            try:
+                if isinstance(bday, str):
+                    bday = datetime.strptime(bday, "%Y-%m-%d").date()
+                mask &= self.columns["birthday"] == _days(bday)
+            except (ValueError, TypeError):
+                pass
+
+        rel_mask = None
+        for param, compare in (("points_min", np.greater_equal), ("points_max", np.less_equal)):
+            if raw := params.get(param):
+                try:
+                    condition = compare(self.columns["rel_points"], int(raw))
+                except (ValueError, TypeError):
+                    continue
+                rel_mask = condition if rel_mask is None else rel_mask & condition
+
+        if last_activity := params.get("last_activity_after"):
+            try:
+                if isinstance(last_activity, str):
+                    last_activity = datetime.strptime(last_activity, "%Y-%m-%d")
+                if timezone.is_naive(last_activity):
+                    last_activity = timezone.make_aware(last_activity)
+                condition = self.columns["rel_last_activity"] >= _seconds(last_activity)
+                rel_mask = condition if rel_mask is None else rel_mask & condition
+            except (ValueError, TypeError):
+                pass
+
+        if rel_mask is not None:
+            # Like the ORM filter, one relationship has to meet all conditions
+            has_match = np.zeros(len(mask), dtype=bool)
+            has_match[self.columns["rel_user"][rel_mask]] = True
+            mask &= has_match
+        return mask
+
+    def query(self, params, limit):
+        """``(count, first `limit` matching ids)`` or ``None`` if unsupported."""
+        mask = self.mask(params)
+        if mask is None:
+            return None
+        ids = self.columns["user_id"][mask]
+        return int(len(ids)), [int(user_id) for user_id in ids[:limit]]
+
+
+def current_snapshot():
+    """The current snapshot, loaded once per process and reloaded when a new one is published."""
+    global _loaded
+    if np is None:
+        return None
+    link = Path(settings.SNAPSHOT_DIR) / "current"
+    if not link.exists():
+        return None
+    path = link.resolve()
+    with _lock:
+        if _loaded is None or _loaded.path != path:
+            _loaded = Snapshot(path)
+        return _loaded
+
+
+def segment(params, limit):
+    """
+    Size the segment matching ``params``: ``{"count", "ids", "source", "snapshot_built_at"}``.
+    Uses the snapshot when it is fresh enough and supports every filter,
+    the database otherwise.
+    """
+    snapshot = current_snapshot()
+    if snapshot is not None and snapshot.age <= settings.SNAPSHOT_MAX_AGE:
+        result = snapshot.query(params, limit)
+        if result is not None:
+            count, ids = result
+            return {"count": count, "ids": ids, "source": "snapshot", "snapshot_built_at": snapshot.built_at}
+
+    queryset = AppUser.objects.filter(build_appuser_filters(params)).distinct()
+    return {
+        "count": queryset.count(),
+        "ids": list(queryset.order_by("id").values_list("id", flat=True)[:limit]),
+        "source": "database",
+        "snapshot_built_at": snapshot.built_at if snapshot is not None else None,
+    }
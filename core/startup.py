@@ -0,0 +1,104 @@
+"""
+Import time of process startup, measured with ``python -X importtime``.
+
+Each target in ``TARGETS`` starts a fresh interpreter the way a process of
+that kind starts: a web worker loading the WSGI application and the
+URLconf, a short management command, the job worker. ``measure`` parses the
+``-X importtime`` report of one start; ``benchmark`` takes the median of
+several.
+
+``IMPORT_BUDGETS`` caps the total import time of each target under the
+production settings, and ``HEAVY_MODULES`` lists dependencies that only
+some commands or requests use and that must not be imported at startup
+(see ``common.imports.lazy_import``). ``benchmark_startup`` reports both.
+core/tests/test_startup.py always enforces ``HEAVY_MODULES``, which does not
+depend on the machine; the budgets are wall-clock times, which a busy
+machine (or ``pytest -n``) exceeds, so the suite checks them on request only.
+"""
+
+import os
+import re
+import subprocess
+import sys
+from dataclasses import dataclass
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+SETTINGS_MODULE = "config.settings.pro"
+
+TARGETS = {
+    "web": ["-c", "from config.wsgi import application; from django.urls import get_resolver; "
+                  "get_resolver().url_patterns"],
+    "command": ["manage.py", "clear_cache", "--help"],
+    "jobs": ["manage.py", "run_jobs", "--help"],
+}
+# Total import time per target, milliseconds; about twice a quiet machine's
+# timings, as a loaded CI machine is much noisier than HEAVY_MODULES
+IMPORT_BUDGETS = {
+    "web": 900,
+    "command": 450,
+    "jobs": 450,
+}
+HEAVY_MODULES = ("numpy", "faker", "drf_yasg", "debug_toolbar")
+
+_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)$")
+
+
+@dataclass
+class ImportReport:
+    # module -> (self, cumulative) microseconds
+    modules: dict
+    # Sum of the top level imports, microseconds
+    total: int
+
+    def imported(self, package):
+        """Whether ``package`` or one of its submodules was imported."""
+        return any(name == package or name.startswith(f"{package}.") for name in self.modules)
+
+    def slowest(self, count):
+        """The ``count`` modules with the most time spent in their own body, ``(name, self µs)``."""
+        ranked = sorted(self.modules.items(), key=lambda item: item[1][0], reverse=True)
+        return [(name, times[0]) for name, times in ranked[:count]]
+
+
+def parse(report):
+    """The ``ImportReport`` of ``-X importtime`` output."""
+    modules, total = {}, 0
+    for line in report.splitlines():
+        match = _LINE_RE.match(line)
+        if match is None:
+            continue
+        own, cumulative, indent, name = match.groups()
+        modules[name] = (int(own), int(cumulative))
+        if not indent:
+            total += int(cumulative)
+    return ImportReport(modules, total)
+
+
+def measure(target, settings_module=SETTINGS_MODULE):
+    """Start ``target`` once under ``-X importtime`` and return its ``ImportReport``."""
+    env = {**os.environ, "DJANGO_SETTINGS_MODULE": settings_module}
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", *TARGETS[target]],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"{target} failed to start:\n{result.stderr[-2000:]}")
+    return parse(result.stderr)
+
+
+def benchmark(target, repeat=5, settings_module=SETTINGS_MODULE):
+    """The report of the start with the median total import time out of ``repeat``."""
+    reports = sorted((measure(target, settings_module) for _ in range(repeat)), key=lambda report: report.total)
+    return reports[len(reports) // 2]
+
+
+def check(report, target, timed=True):
+    """
+    Problems of ``report`` against ``HEAVY_MODULES`` and, if ``timed``, the
+    budget of ``target``, as messages.
+    """
+    problems = [f"imports {package} at startup" for package in HEAVY_MODULES if report.imported(package)]
+    if timed and report.total / 1000 > IMPORT_BUDGETS[target]:
+        problems.append(f"imports take {report.total / 1000:.0f} ms, budget {IMPORT_BUDGETS[target]} ms")
+    return problems
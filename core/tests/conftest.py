@@ -1,3 +1,4 @@
+import os
 import random
 import pytest
 from datetime import date, datetime, timedelta
@@ -5,12 +6,36 @@ from django.test import Client
 from django.utils import timezone
 from django.core.cache import cache
 from rest_framework.test import APIClient
+from core.autocomplete import index as autocomplete_index
+from core.bitmaps import index as bitmap_index
+from core.cache import clear_local, delete_matching, request_counts
 from core.models import Address, AppUser, CustomerRelationship
+from core.tests import seeding
 import factory
 from factory.django import DjangoModelFactory
 from factory import fuzzy
 
 
+def pytest_configure(config):
+    """
+    Under ``pytest -n`` (pytest-xdist) each worker gets its own test database
+    from pytest-django; give each its own cache key prefix as well, so that
+    workers do not see (or clear) each other's keys in the shared Redis
+    database. Every key, raw Redis ones included, goes through ``make_key``.
+    """
+    worker = os.getenv('PYTEST_XDIST_WORKER')
+    if not worker:
+        return
+    from django.conf import settings
+    prefix = settings.CACHES['default'].get('KEY_PREFIX')
+    settings.CACHES['default']['KEY_PREFIX'] = f"{prefix}:test_{worker}" if prefix else f"test_{worker}"
+
+
+def clear_redis():
+    """Delete this run's keys: ``cache.clear()`` is a FLUSHDB, which would empty the other workers' too."""
+    delete_matching('*')
+
+
 class AddressFactory(DjangoModelFactory):
     class Meta:
         model = Address
@@ -62,6 +87,13 @@ def api_client():
     return APIClient()
 
 
+@pytest.fixture
+def admin_client(api_client, django_user_model):
+    """API client authenticated as a staff user."""
+    api_client.force_authenticate(django_user_model.objects.create_user('admin', is_staff=True))
+    return api_client
+
+
 @pytest.fixture
 def django_client():
     """Provides Django test client."""
@@ -98,9 +130,31 @@ def multiple_users():
     return users
 
 
+@pytest.fixture(scope='class')
+def shared_users(django_db_setup, django_db_blocker):
+    """Like ``multiple_users``, but bulk inserted once per test class (without save() signals) and rolled back after it."""
+    with seeding.rolled_back(django_db_blocker, seeding.seed, 5, relationships_per_user=1) as users:
+        yield users
+
+
+@pytest.fixture(scope='class')
+def seeded_users(django_db_setup, django_db_blocker):
+    """1,000 users with two relationships each, bulk inserted once per test class and rolled back after it."""
+    with seeding.rolled_back(django_db_blocker, seeding.seed, 1000) as users:
+        yield users
+
+
 @pytest.fixture(autouse=True)
 def clear_cache():
     """Clear cache before each test."""
-    cache.clear()
+    clear_redis()
+    clear_local()
+    bitmap_index.clear()
+    autocomplete_index.clear()
+    request_counts.clear()
     yield
-    cache.clear()
\ No newline at end of file
+    clear_redis()
+    clear_local()
+    bitmap_index.clear()
+    autocomplete_index.clear()
+    request_counts.clear()
\ No newline at end of file
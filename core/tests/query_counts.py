@@ -0,0 +1,138 @@
+"""
+pytest plugin counting the database queries of API requests, enabled for
+the whole suite in pytest.ini (``-p core.tests.query_counts``).
+
+- ``record_queries(function)`` runs ``function`` (usually a test client
+  request) and returns its result with a ``QueryRecord`` of the statements
+  it executed.
+- The ``query_budget`` fixture runs a request and fails when it executes
+  more queries than the budget checked in for it in
+  core/tests/query_budgets.json, or when it repeats a statement with only
+  its literals changed, the signature of an N+1.
+- ``assert_no_n_plus_one(make_request)`` runs a request for increasing
+  page sizes and fails when its query count grows with the size.
+
+``pytest --query-report`` prints the queries counted per budget after the run,
+also under ``pytest -n``: workers send their counts to the controller.
+"""
+
+import json
+import re
+from collections import Counter
+from pathlib import Path
+
+import pytest
+
+BUDGETS_PATH = Path(__file__).parent / "query_budgets.json"
+REPORT_KEY = pytest.StashKey[dict]()
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r"\b\d+(?:\.\d+)?\b")
+_IN_LIST_RE = re.compile(r"\bIN \((?:\?(?:, )?)+\)")
+_SAVEPOINT_RE = re.compile(r"^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT)\b", re.IGNORECASE)
+
+
+def normalize_sql(sql):
+    """``sql`` with its literals replaced, so that statements differing only in values compare equal."""
+    sql = _NUMBER_RE.sub("?", _STRING_RE.sub("?", sql))
+    return _IN_LIST_RE.sub("IN (...)", sql)
+
+
+class QueryRecord:
+    """The statements executed by one call, savepoints left out."""
+
+    def __init__(self, captured_queries):
+        self.queries = [query["sql"] for query in captured_queries if not _SAVEPOINT_RE.match(query["sql"])]
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    def repeated(self):
+        """``{normalized statement: times}`` for the statements executed more than once."""
+        counts = Counter(normalize_sql(sql) for sql in self.queries)
+        return {sql: times for sql, times in counts.items() if times > 1}
+
+    def __str__(self):
+        return "\n".join(f"{number}. {sql}" for number, sql in enumerate(self.queries, 1))
+
+
+def record_queries(function, *args, **kwargs):
+    """``(result, QueryRecord)`` of ``function(*args, **kwargs)`` on the default database."""
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    with CaptureQueriesContext(connection) as context:
+        result = function(*args, **kwargs)
+    return result, QueryRecord(context.captured_queries)
+
+
+def load_budgets():
+    return json.loads(BUDGETS_PATH.read_text())
+
+
+def assert_no_n_plus_one(make_request, sizes=(1, 5, 20)):
+    """
+    Fail when the queries of ``make_request(size)`` grow with ``size`` (the
+    page size, number of ids, ...). Returns the query count.
+    """
+    records = {size: record_queries(make_request, size)[1] for size in sizes}
+    counts = {size: record.count for size, record in records.items()}
+    if len(set(counts.values())) > 1:
+        largest = records[max(sizes)]
+        raise AssertionError(f"Query count grows with the size, {counts}; queries at {max(sizes)}:\n{largest}")
+    return counts[sizes[0]]
+
+
+@pytest.fixture
+def query_budget(request):
+    """
+    ``query_budget(name, function, *args, **kwargs)`` runs the function,
+    checks its queries against the budget of ``name`` and returns its result.
+    """
+    budgets = load_budgets()
+
+    def check(name, function, *args, **kwargs):
+        if name not in budgets:
+            raise AssertionError(f"No query budget for {name!r}; add it to {BUDGETS_PATH.name}")
+        result, record = record_queries(function, *args, **kwargs)
+        request.config.stash.setdefault(REPORT_KEY, {})[name] = (record.count, budgets[name])
+
+        assert record.count <= budgets[name], (
+            f"{name} ran {record.count} queries, budget {budgets[name]}:\n{record}"
+        )
+        repeated = record.repeated()
+        assert not repeated, f"{name} repeated statements (N+1?): {repeated}\n{record}"
+        return result
+
+    return check
+
+
+def pytest_addoption(parser):
+    parser.addoption(
+        "--query-report",
+        action="store_true",
+        help="Print the queries counted against each query budget",
+    )
+
+
+def pytest_sessionfinish(session):
+    workeroutput = getattr(session.config, "workeroutput", None)
+    if workeroutput is not None:  # pytest-xdist worker
+        workeroutput["query_report"] = session.config.stash.get(REPORT_KEY, {})
+
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    report = getattr(node, "workeroutput", {}).get("query_report", {})
+    node.config.stash.setdefault(REPORT_KEY, {}).update(report)
+
+
+def pytest_terminal_summary(terminalreporter, exitstatus, config):
+    report = config.stash.get(REPORT_KEY, {})
+    if not config.getoption("query_report") or not report:
+        return
+    terminalreporter.write_sep("-", "query budgets")
+    width = max(len(name) for name in report)
+    for name, (count, budget) in sorted(report.items()):
+        terminalreporter.write_line(f"{name:<{width}}  {count:>3} / {budget}")
@@ -0,0 +1,98 @@
+"""
+Bulk test data, for tests that need more than a handful of rows.
+
+The factories in conftest.py insert one row at a time and go through Faker
+for every field. ``seed`` builds deterministic rows (same values on every
+run and every xdist worker) and inserts each table with one ``bulk_create``.
+
+``rolled_back`` shares seeded rows between the tests of a class or module:
+the rows are inserted in a transaction that stays open while those tests
+run and is rolled back after the last one. Each test still runs in its own
+savepoint (``django_db``), so what a test writes is undone before the next
+one. Rolling back is also far cheaper than deleting the rows again.
+
+The rows are inserted with the constraints checked immediately. Otherwise
+PostgreSQL keeps a deferred foreign key check queued per seeded row until
+the end of the transaction, and walks that queue again at the end of every
+test (Django's TestCase checks deferred constraints before rolling back).
+"""
+
+import random
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone
+
+from django.db import connection, transaction
+from core.models import Address, AppUser, CustomerRelationship
+
+GENDERS = ["Male", "Female", "Other", "Prefer not to say"]
+COUNTRIES = ["Germany", "France", "Spain", "Italy", "Poland", "Austria"]
+FIRST_NAMES = ["Anna", "Ben", "Clara", "David", "Elena", "Felix", "Greta", "Hugo", "Ida", "Jonas"]
+LAST_NAMES = ["Meyer", "Schmidt", "Dubois", "Garcia", "Rossi", "Nowak", "Weber", "Martin"]
+# Fixed, so that seeded rows are the same on every run
+EPOCH = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+@contextmanager
+def rolled_back(django_db_blocker, populate, *args, **kwargs):
+    """
+    Run ``populate(*args, **kwargs)`` in a transaction that stays open inside
+    the block and is rolled back on exit. Yields what ``populate`` returned.
+    """
+    with django_db_blocker.unblock(), transaction.atomic():
+        deferrable = connection.vendor == "postgresql"
+        if deferrable:
+            with connection.cursor() as cursor:
+                cursor.execute("SET CONSTRAINTS ALL IMMEDIATE")
+        result = populate(*args, **kwargs)
+        if deferrable:
+            with connection.cursor() as cursor:
+                cursor.execute("SET CONSTRAINTS ALL DEFERRED")
+        yield result
+        transaction.set_rollback(True)
+
+
+def seed(users, relationships_per_user=2, prefix="SEED", random_seed=0):
+    """
+    Insert ``users`` users with an address each and ``relationships_per_user``
+    relationships, one ``bulk_create`` per table. Customer ids are
+    ``<prefix><number>``. Returns the users, in insertion order.
+    """
+    rng = random.Random(random_seed)
+    addresses = [
+        Address(
+            street=f"{prefix.title()} Street {number}",
+            street_number=str(number % 200 + 1),
+            city_code=f"{number % 1000:05d}",
+            city=f"City {number % 300}",
+            country=COUNTRIES[number % len(COUNTRIES)],
+        )
+        for number in range(users)
+    ]
+    for address in addresses:
+        # bulk_create skips save(), which sets it
+        address.identity_hash = address.compute_identity_hash()
+    Address.objects.bulk_create(addresses)
+    created = AppUser.objects.bulk_create([
+        AppUser(
+            first_name=FIRST_NAMES[rng.randrange(len(FIRST_NAMES))],
+            last_name=LAST_NAMES[rng.randrange(len(LAST_NAMES))],
+            gender=GENDERS[number % len(GENDERS)],
+            customer_id=f"{prefix}{number:08d}",
+            phone_number=f"+49{rng.randrange(10 ** 9, 10 ** 10)}",
+            address=address,
+            birthday=date(1950, 1, 1) + timedelta(days=rng.randrange(20000)),
+            created=EPOCH - timedelta(minutes=number),
+        )
+        for number, address in enumerate(addresses)
+    ])
+    CustomerRelationship.objects.bulk_create([
+        CustomerRelationship(
+            appuser=user,
+            points=rng.randrange(10000),
+            created=user.created + timedelta(hours=index),
+            last_activity=user.created + timedelta(days=index + 1),
+        )
+        for user in created
+        for index in range(relationships_per_user)
+    ])
+    return created
@@ -0,0 +1,183 @@
+import json
+import pytest
+from datetime import datetime
+from django.urls import reverse
+from django.utils import timezone
+from core.analytics import live_counts, refresh_rollup, rollup_counts
+from core.ingest import ingest
+from core.models import AppUserRollup, RollupWatermark
+from core.tests.conftest import AddressFactory, AppUserFactory, CustomerRelationshipFactory
+
+
+@pytest.fixture
+def analytics_users():
+    """Three users in two countries with known genders, signup months and points."""
+    germany = AddressFactory(country='Germany')
+    france = AddressFactory(country='France')
+    users = [
+        AppUserFactory(gender='Male', address=germany, created=timezone.make_aware(datetime(2024, 1, 5))),
+        AppUserFactory(gender='Female', address=germany, created=timezone.make_aware(datetime(2024, 1, 20))),
+        AppUserFactory(gender='Female', address=france, created=timezone.make_aware(datetime(2024, 3, 1))),
+    ]
+    for user, points in zip(users, [500, 1500, 1999]):
+        CustomerRelationshipFactory(appuser=user, points=points)
+    return users
+
+
+@pytest.mark.django_db
+class TestAnalytics:
+    """Test cases for grouped counts and rollups."""
+
+    def test_live_counts(self, analytics_users):
+        """Test live counts per dimension."""
+        assert live_counts('gender', {}) == [
+            {'value': 'Female', 'count': 2},
+            {'value': 'Male', 'count': 1},
+        ]
+        assert live_counts('signup_month', {}) == [
+            {'value': '2024-01', 'count': 2},
+            {'value': '2024-03', 'count': 1},
+        ]
+        assert live_counts('points_bucket', {}) == [
+            {'value': '0-999', 'count': 1},
+            {'value': '1000-1999', 'count': 2},
+        ]
+
+    def test_live_counts_apply_list_filters(self, analytics_users):
+        """Test the list endpoint's filters narrow the counted users."""
+        assert live_counts('gender', {'country': 'germ'}) == [
+            {'value': 'Female', 'count': 1},
+            {'value': 'Male', 'count': 1},
+        ]
+        assert live_counts('country', {'points_min': '1000'}) == [
+            {'value': 'France', 'count': 1},
+            {'value': 'Germany', 'count': 1},
+        ]
+
+    def test_rollup_matches_live_counts(self, analytics_users):
+        """Test a built rollup reports the same counts as the live query."""
+        assert rollup_counts('country') == (None, None)
+
+        assert refresh_rollup('country') == 3
+        results, refreshed_at = rollup_counts('country')
+        assert results == live_counts('country', {})
+        assert refreshed_at is not None
+
+    @pytest.mark.parametrize('settle_seconds', [0, 60])
+    def test_incremental_refresh(self, settings, analytics_users, settle_seconds):
+        """Test a refresh only folds in rows added since the previous one, settled or not."""
+        settings.CHANGES_SETTLE_SECONDS = settle_seconds
+        refresh_rollup('gender')
+        AppUserFactory(gender='Male')
+
+        assert refresh_rollup('gender') == 1
+        assert refresh_rollup('gender') == 0
+        assert AppUserRollup.objects.get(dimension='gender', bucket='Male').count == 2
+
+    def test_late_commit_below_the_highest_id(self, analytics_users):
+        """Test a row committed after a refresh with a lower id than that refresh saw is still counted."""
+        in_flight = AppUserFactory(gender='Male')
+        AppUserFactory(gender='Other')
+        in_flight_id = in_flight.id
+        in_flight.delete()
+        refresh_rollup('gender')
+
+        # The transaction that took the id commits only now
+        AppUserFactory(id=in_flight_id, gender='Male')
+
+        assert refresh_rollup('gender') == 1
+        assert AppUserRollup.objects.get(dimension='gender', bucket='Male').count == 2
+
+    def test_tail_settles(self, settings, analytics_users):
+        """Test the watermark moves up once the highest id seen is old enough."""
+        settings.CHANGES_SETTLE_SECONDS = 0
+        refresh_rollup('gender')
+        refresh_rollup('gender')
+
+        watermark = RollupWatermark.objects.get(dimension='gender')
+        assert watermark.last_id == analytics_users[-1].id
+        assert watermark.tail == {}
+        assert rollup_counts('gender')[0] == live_counts('gender', {})
+
+    def test_full_refresh_picks_up_updates(self, settings, analytics_users):
+        """Test a full rebuild reflects changes to existing rows."""
+        settings.CHANGES_SETTLE_SECONDS = 0
+        refresh_rollup('gender')
+        analytics_users[0].gender = 'Female'
+        analytics_users[0].save()
+
+        refresh_rollup('gender', full=True)
+        assert rollup_counts('gender')[0] == [{'value': 'Female', 'count': 3}]
+
+    def test_updates_are_served_live_until_rebuilt(self, api_client, settings, analytics_users):
+        """Test an update of an existing row is never hidden by the rollup and the next refresh rebuilds it."""
+        settings.CHANGES_SETTLE_SECONDS = 0
+        refresh_rollup('gender')
+        refresh_rollup('points_bucket')
+        analytics_users[0].gender = 'Female'
+        analytics_users[0].save()
+
+        assert rollup_counts('gender') == (None, None)
+        assert rollup_counts('points_bucket')[0] is not None
+        data = api_client.get(reverse('appuser-analytics'), {'group_by': 'gender'}).json()
+        assert data['meta']['source'] == 'live'
+        assert data['results'] == [{'value': 'Female', 'count': 3}]
+
+        assert refresh_rollup('gender') == 3
+        assert rollup_counts('gender')[0] == [{'value': 'Female', 'count': 3}]
+
+    def test_changes_just_before_a_rebuild(self, settings, analytics_users):
+        """Test a change marked within twice the settle time before a rebuild keeps the rollup stale."""
+        settings.CHANGES_SETTLE_SECONDS = 60
+        refresh_rollup('gender')
+        analytics_users[0].gender = 'Female'
+        analytics_users[0].save()
+
+        refresh_rollup('gender')
+        assert rollup_counts('gender') == (None, None)
+
+    def test_deletes_mark_the_rollup(self, settings, analytics_users):
+        """Test deleted users and relationships leave the counts on the next refresh."""
+        settings.CHANGES_SETTLE_SECONDS = 0
+        for dimension in ('country', 'points_bucket'):
+            refresh_rollup(dimension)
+        analytics_users[2].delete()
+
+        assert rollup_counts('points_bucket') == (None, None)
+        for dimension in ('country', 'points_bucket'):
+            refresh_rollup(dimension)
+            assert rollup_counts(dimension)[0] == live_counts(dimension, {})
+
+    def test_ingest_upserts_mark_the_rollup(self, settings, analytics_users):
+        """Test bulk upserts of existing customers, which send no signals, mark the rollups too."""
+        settings.CHANGES_SETTLE_SECONDS = 0
+        refresh_rollup('gender')
+        user = analytics_users[0]
+        line = json.dumps({
+            'customer_id': user.customer_id, 'first_name': user.first_name, 'last_name': user.last_name,
+            'gender': 'Other', 'address': {'street': 'Main Street', 'street_number': '1', 'city_code': '10115',
+                                           'city': 'Berlin', 'country': 'Germany'},
+        })
+
+        assert ingest([line]).updated == 1
+        assert rollup_counts('gender') == (None, None)
+        refresh_rollup('gender')
+        assert rollup_counts('gender')[0] == live_counts('gender', {})
+
+    def test_endpoint_sources(self, api_client, analytics_users):
+        """Test unfiltered requests use the rollup once built, filtered ones stay live."""
+        url = reverse('appuser-analytics')
+        assert api_client.get(url, {'group_by': 'gender'}).json()['meta']['source'] == 'live'
+
+        refresh_rollup('gender')
+        data = api_client.get(url, {'group_by': 'gender'}).json()
+        assert data['meta']['source'] == 'rollup'
+        assert data['total'] == 3
+
+        data = api_client.get(url, {'group_by': 'gender', 'gender': 'Male'}).json()
+        assert data['meta']['source'] == 'live'
+        assert data['results'] == [{'value': 'Male', 'count': 1}]
+
+    def test_endpoint_rejects_unknown_dimension(self, api_client):
+        """Test an unknown group_by is a validation error."""
+        assert api_client.get(reverse('appuser-analytics'), {'group_by': 'shoe_size'}).status_code == 400
@@ -0,0 +1,181 @@
+import threading
+
+import pytest
+from django.urls import reverse
+from core import autocomplete
+from core.tests.conftest import AddressFactory, AppUserFactory
+
+
+@pytest.fixture
+def support_users():
+    """Users with distinct names, cities and customer ids."""
+    berlin = AddressFactory(city='Berlin')
+    paris = AddressFactory(city='Paris')
+    users = {
+        'anna': AppUserFactory(first_name='Anna', last_name='Meyer', customer_id='CRM1001', address=berlin),
+        'annette': AppUserFactory(first_name='Annette', last_name='Schulz', customer_id='CRM1002', address=paris),
+        'bernd': AppUserFactory(first_name='Bernd', last_name='Annenberg', customer_id='CRM2001', address=paris),
+        'meike': AppUserFactory(first_name='Meike', last_name='Bergmann', customer_id='XY3001', address=berlin),
+    }
+    # In this thread: a background build would not see the test's transaction
+    autocomplete.index.refresh(wait=True)
+    return users
+
+
+def ids(results):
+    return [result['id'] for result in results]
+
+
+class TestOneEdit:
+    """Test cases for the typo distance."""
+
+    @pytest.mark.parametrize('a, b, expected', [
+        ('meyer', 'meyer', True),
+        ('meyer', 'meier', True),   # substitution
+        ('meyer', 'myer', True),    # deletion
+        ('meyer', 'meyyer', True),  # insertion
+        ('meyer', 'emyer', True),   # transposition
+        ('meyer', 'mayor', False),
+        ('meyer', 'me', False),
+    ])
+    def test_one_edit(self, a, b, expected):
+        """Test strings one insertion, deletion, substitution or transposition apart match."""
+        assert autocomplete._one_edit(a, b) is expected
+
+
+@pytest.mark.django_db
+class TestSuggest:
+    """Test cases for autocomplete suggestions."""
+
+    def test_prefix_of_any_field(self, support_users):
+        """Test a prefix matches first names, last names and cities, case-insensitively."""
+        assert set(ids(autocomplete.suggest('ann', 10))) == {
+            support_users['anna'].id, support_users['annette'].id, support_users['bernd'].id,
+        }
+        assert set(ids(autocomplete.suggest('PAR', 10))) == {support_users['annette'].id, support_users['bernd'].id}
+
+    def test_every_token_must_match(self, support_users):
+        """Test each word narrows the results, in any field."""
+        assert ids(autocomplete.suggest('ann mey', 10)) == [support_users['anna'].id]
+        assert ids(autocomplete.suggest('berg berl', 10)) == [support_users['meike'].id]
+
+    def test_exact_values_rank_first(self, support_users):
+        """Test users with a whole value equal to a word come before other prefix matches."""
+        results = autocomplete.suggest('anna', 10)
+
+        assert results[0]['id'] == support_users['anna'].id
+        assert {result['match'] for result in results} == {'prefix'}
+
+    def test_customer_id_prefix(self, support_users):
+        """Test customer ids match by prefix, whatever the case typed."""
+        assert set(ids(autocomplete.suggest('crm100', 10))) == {support_users['anna'].id, support_users['annette'].id}
+
+    def test_typos(self, support_users):
+        """Test a word one edit away still matches, after the prefix matches."""
+        results = autocomplete.suggest('bergman', 10)
+        assert ids(results) == [support_users['meike'].id]
+        assert results[0]['match'] == 'prefix'
+
+        results = autocomplete.suggest('bregmann', 10)
+        assert ids(results) == [support_users['meike'].id]
+        assert results[0]['match'] == 'typo'
+
+        assert autocomplete.suggest('anna meier', 10)[0]['id'] == support_users['anna'].id
+        assert autocomplete.suggest('zzzz', 10) == []
+
+    def test_short_queries_and_limit(self, support_users):
+        """Test queries under the minimum length return nothing and results stop at the limit."""
+        assert autocomplete.suggest('a', 10) == []
+        assert autocomplete.suggest('  ', 10) == []
+        assert len(autocomplete.suggest('ann', 2)) == 2
+
+    def test_refreshes_incrementally(self, support_users, settings):
+        """Test new users' values are picked up on the next refresh without a rebuild."""
+        built_at = autocomplete.index._built_at
+        terms = autocomplete.index._terms
+        new_user = AppUserFactory(first_name='Zoltan', last_name='Quast', address=support_users['anna'].address)
+        settings.AUTOCOMPLETE_REFRESH_INTERVAL = 0
+        autocomplete.index.refresh(wait=True)
+        settings.AUTOCOMPLETE_REFRESH_INTERVAL = 30
+
+        assert ids(autocomplete.suggest('zolt', 10)) == [new_user.id]
+        assert autocomplete.index._built_at == built_at
+        # Published terms are replaced, not changed in place
+        assert autocomplete.index._terms is not terms
+        assert ('zoltan', 'first_name') not in terms.spellings
+
+    def test_bounded_terms(self, support_users, settings):
+        """Test each field keeps at most the configured number of values."""
+        settings.AUTOCOMPLETE_MAX_TERMS = 1
+        autocomplete.index.clear()
+        autocomplete.index.refresh(wait=True)
+
+        assert len(autocomplete.index) == len(autocomplete.FIELDS)
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBackgroundRefresh:
+    """Test cases for building the index off the request path."""
+
+    def test_requests_do_not_wait_for_the_build(self, monkeypatch):
+        """Test a request starts the build in a thread and meanwhile matches customer ids only."""
+        user = AppUserFactory(first_name='Zoltan', customer_id='CRM4001')
+        building = threading.Event()
+        build = autocomplete.TermIndex._build
+
+        def slow_build(self):
+            building.wait(5)
+            build(self)
+        monkeypatch.setattr(autocomplete.TermIndex, '_build', slow_build)
+
+        assert autocomplete.suggest('zolt', 10) == []
+        assert ids(autocomplete.suggest('crm4', 10)) == [user.id]
+        building.set()
+        with autocomplete.index._lock:  # held until the build is done
+            pass
+
+        assert ids(autocomplete.suggest('zolt', 10)) == [user.id]
+
+    def test_failed_build_is_retried_later(self, monkeypatch, settings):
+        """Test a failing build is logged and not retried on every request."""
+        calls = []
+
+        def failing_build(self):
+            calls.append(1)
+            raise RuntimeError('database unavailable')
+        monkeypatch.setattr(autocomplete.TermIndex, '_build', failing_build)
+
+        for _ in range(3):
+            autocomplete.index.refresh()
+            with autocomplete.index._lock:
+                pass
+
+        assert len(calls) == 1
+        assert len(autocomplete.index) == 0
+
+
+@pytest.mark.django_db
+class TestAutocompleteEndpoint:
+    """Test cases for the autocomplete endpoint."""
+
+    def test_results(self, api_client, support_users):
+        """Test matches are returned with the fields an agent needs to pick a customer."""
+        response = api_client.get(reverse('appuser-autocomplete'), {'q': 'anna mey'})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert data['results'] == [{
+            'id': support_users['anna'].id,
+            'customer_id': 'CRM1001',
+            'first_name': 'Anna',
+            'last_name': 'Meyer',
+            'city': 'Berlin',
+            'match': 'prefix',
+        }]
+        assert data['meta']['terms'] > 0
+
+    def test_invalid_limit(self, api_client):
+        """Test a non-numeric limit is rejected."""
+        response = api_client.get(reverse('appuser-autocomplete'), {'q': 'ann', 'limit': 'x'})
+
+        assert response.status_code == 400
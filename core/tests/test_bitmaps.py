@@ -0,0 +1,164 @@
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from core import bitmaps
+from core.filters import build_appuser_filters
+from core.models import AppUser
+from core.tests.conftest import AddressFactory, AppUserFactory, CustomerRelationshipFactory
+
+pytest.importorskip('pyroaring')
+
+
+@pytest.fixture
+def bitmap_settings(settings):
+    settings.BITMAP_INDEX_ENABLED = True
+    settings.CACHE_GENERATION_CHECK_INTERVAL = 0
+    settings.BITMAP_POINTS_BUCKET_SIZE = 1000
+    return settings
+
+
+@pytest.fixture
+def bitmap_users(bitmap_settings):
+    """Users over two countries and genders with relationships in several point buckets."""
+    germany = AddressFactory(country='Germany')
+    france = AddressFactory(country='France')
+    users = [
+        AppUserFactory(gender='Female', address=germany),
+        AppUserFactory(gender='Male', address=germany),
+        AppUserFactory(gender='Female', address=france),
+        AppUserFactory(gender='Other', address=france),
+    ]
+    CustomerRelationshipFactory(appuser=users[0], points=5500)
+    CustomerRelationshipFactory(appuser=users[0], points=200)
+    CustomerRelationshipFactory(appuser=users[1], points=1999)
+    CustomerRelationshipFactory(appuser=users[2], points=7000)
+    return users
+
+
+def database_ids(params):
+    return set(AppUser.objects.filter(build_appuser_filters(params)).values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+class TestBitmapIndex:
+    """Test cases for the roaring bitmap index."""
+
+    @pytest.mark.parametrize('params', [
+        {},
+        {'gender': 'Female'},
+        {'gender': 'female'},
+        {'country': 'GERM'},
+        {'country': 'an', 'gender': 'Female'},
+        {'points_min': '5000'},
+        {'points_max': '1999'},
+        {'points_min': '1000', 'points_max': '5999'},
+        {'points_min': '5000', 'country': 'france'},
+        {'points_min': 'many'},
+    ])
+    def test_matches_database(self, bitmap_users, params):
+        """Test bitmap combinations select the same users as the ORM filters."""
+        bitmaps.build()
+        assert set(bitmaps.match(params)) == database_ids(params)
+
+    @pytest.mark.parametrize('params', [
+        {'first_name': 'Ann'},
+        {'points_min': '5500'},
+        {'points_max': '2000'},
+        {'gender': 'Male', 'last_activity_after': '2024-01-01'},
+        {'gender': 'Male', 'anniversary_from': '12-28', 'anniversary_to': '01-03'},
+        {'country': 'Germany', 'age_min': '25'},
+    ])
+    def test_unindexed_filters(self, bitmap_users, params):
+        """Test filters the bitmaps cannot answer exactly return None."""
+        bitmaps.build()
+        assert bitmaps.match(params) is None
+
+    def test_not_built(self, bitmap_users):
+        """Test nothing is answered before the index has been built."""
+        assert bitmaps.match({'gender': 'Male'}) is None
+
+    def test_writes_update_bitmaps(self, bitmap_users, django_capture_on_commit_callbacks):
+        """Test committed saves and deletes move users between bitmaps."""
+        bitmaps.build()
+        female, male, french_female, _ = bitmap_users
+
+        with django_capture_on_commit_callbacks(execute=True):
+            male.gender = 'Female'
+            male.save()
+            french_female.delete()
+            CustomerRelationshipFactory(appuser=male, points=9100)
+            new_user = AppUserFactory(gender='Male', address=AddressFactory(country='Spain'))
+            female.address.country = 'Austria'
+            female.address.save()
+
+        assert set(bitmaps.match({'gender': 'Female'})) == {female.id, male.id}
+        assert set(bitmaps.match({'gender': 'Male'})) == {new_user.id}
+        assert set(bitmaps.match({'points_min': '9000'})) == {male.id}
+        assert set(bitmaps.match({'country': 'austria'})) == {female.id, male.id}
+        assert set(bitmaps.match({'country': 'germany'})) == set()
+        assert bitmaps.match({})[-1] == new_user.id
+
+    def test_rollback_leaves_bitmaps(self, bitmap_users, django_capture_on_commit_callbacks):
+        """Test writes are only applied once their transaction commits."""
+        bitmaps.build()
+        with django_capture_on_commit_callbacks(execute=False):
+            AppUserFactory(gender='Male')
+        assert set(bitmaps.match({'gender': 'Male'})) == {bitmap_users[1].id}
+
+    def test_list_endpoint_uses_database_by_default(self, api_client, bitmap_users):
+        """Test without opting in the list endpoint sees rows the index missed."""
+        bitmaps.build()
+        # Bulk inserts send no signals, so the index does not see this user
+        bulk_user, = AppUser.objects.bulk_create([AppUser(
+            first_name='Bulk', last_name='Insert', gender='Female',
+            customer_id='BULK1', address=bitmap_users[0].address,
+        )])
+
+        data = api_client.get(reverse('appuser-list'), {'gender': 'Female', 'ordering': '-id', 'page_size': 1}).json()
+        assert data['count'] == 3
+        assert [row['id'] for row in data['results']] == [bulk_user.id]
+
+    def test_list_endpoint_opt_in(self, api_client, bitmap_users):
+        """Test with index=bitmap the count and id ordered pages come from the index."""
+        bitmaps.build()
+        url = reverse('appuser-list')
+        params = {'gender': 'Female', 'ordering': '-id', 'page_size': 1, 'index': 'bitmap'}
+
+        with CaptureQueriesContext(connection) as queries:
+            data = api_client.get(url, params).json()
+        assert data['count'] == 2
+        assert [row['id'] for row in data['results']] == [bitmap_users[2].id]
+        assert not any('COUNT(' in query['sql'] for query in queries.captured_queries)
+
+        data = api_client.get(url, {'gender': 'Female', 'first_name': 'Ann', 'index': 'bitmap'}).json()
+        assert data['count'] == AppUser.objects.filter(gender='Female', first_name__icontains='Ann').count()
+
+    def test_writes_skip_unbuilt_index(self, bitmap_settings, bitmap_users, monkeypatch,
+                                       django_capture_on_commit_callbacks):
+        """Test writes do no bitmap work while the index is disabled or not built."""
+        def fail(*args, **kwargs):
+            raise AssertionError('membership queried')
+        monkeypatch.setattr(bitmaps, 'memberships', fail)
+
+        with django_capture_on_commit_callbacks(execute=True):
+            bitmap_users[0].address.save()
+            bitmap_users[1].save()
+            CustomerRelationshipFactory(appuser=bitmap_users[1])
+
+        assert not bitmaps.is_maintained()
+        monkeypatch.undo()
+        bitmaps.build()
+        assert bitmaps.is_maintained()
+        bitmap_settings.BITMAP_INDEX_ENABLED = False
+        assert not bitmaps.is_maintained()
+
+    def test_relationship_filters_need_id_ordering(self, api_client, bitmap_users):
+        """Test points filters only use the index for id ordered pages."""
+        bitmaps.build()
+        params = {'points_min': '5000', 'index': 'bitmap'}
+        queryset = AppUser.objects.filter(build_appuser_filters(params))
+
+        assert bitmaps.indexed_results(queryset.order_by('-created'), params) is None
+        indexed = bitmaps.indexed_results(queryset.order_by('id'), params)
+        assert [user.id for user in indexed[0:10]] == [bitmap_users[0].id, bitmap_users[2].id]
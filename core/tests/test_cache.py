@@ -0,0 +1,436 @@
+import pytest
+from concurrent.futures import Future
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import call_command
+from django.http import QueryDict
+from django.test import RequestFactory
+from django.urls import reverse
+from core import cache as list_cache
+from core.cache import (
+    LocalCache,
+    bump_generation,
+    canonical_query,
+    current_generation,
+    delete_matching,
+    get_page,
+    list_cache_key,
+    local_cache,
+    flush_request_counts,
+    popular_signatures,
+    set_page,
+    signature_cache_key,
+    tier_stats,
+)
+from core import jobs
+from core import warming
+from core.warming import needs_refresh, warm_popular
+from core.tests.conftest import clear_redis
+
+
+class TestCacheKeys:
+    """Test cases for list cache key building."""
+
+    def test_canonical_query_is_order_independent(self):
+        """Test parameter order does not change the canonical query."""
+        assert canonical_query(QueryDict('b=2&a=1')) == canonical_query(QueryDict('a=1&b=2')) == 'a=1&b=2'
+
+    def test_canonical_query_keeps_repeated_params(self):
+        """Test repeated parameters are all kept, in a stable order."""
+        assert canonical_query(QueryDict('a=2&a=1')) == 'a=1&a=2'
+
+    def test_list_cache_key(self):
+        """Test equivalent requests share one cache key."""
+        factory = RequestFactory()
+        first = factory.get('/api/v1/appusers/?page=2&gender=Male')
+        second = factory.get('/api/v1/appusers/?gender=Male&page=2')
+        assert list_cache_key(first, '7') == list_cache_key(second, '7') == (
+            'appusers::g7::/api/v1/appusers/?gender=Male&page=2'
+        )
+        assert list_cache_key(factory.get('/api/v1/appusers/'), '7') == 'appusers::g7::/api/v1/appusers/'
+
+    def test_generation_is_part_of_the_key(self):
+        """Test bumping the generation moves requests to new keys."""
+        request = RequestFactory().get('/api/v1/appusers/')
+        before = list_cache_key(request)
+        bump_generation()
+        assert list_cache_key(request) != before
+
+
+class TestLocalCache:
+    """Test cases for the in-process cache tier."""
+
+    def test_get_and_set(self):
+        """Test stored values are returned until they expire."""
+        local = LocalCache(max_bytes=100, max_entry_bytes=100, ttl=60)
+        local.set('a', b'x' * 10)
+        assert local.get('a') == b'x' * 10
+        assert local.get('missing') is None
+
+    def test_ttl_expiry(self):
+        """Test expired entries are dropped."""
+        local = LocalCache(max_bytes=100, max_entry_bytes=100, ttl=0)
+        local.set('a', b'x' * 10)
+        assert local.get('a') is None
+        assert local.size == 0
+
+    def test_evicts_least_recently_used_by_size(self):
+        """Test eviction frees the least recently used entries until within budget."""
+        local = LocalCache(max_bytes=100, max_entry_bytes=100, ttl=60)
+        local.set('a', b'a' * 40)
+        local.set('b', b'b' * 40)
+        local.get('a')
+        local.set('c', b'c' * 40)
+
+        assert local.get('b') is None
+        assert local.get('a') == b'a' * 40
+        assert local.get('c') == b'c' * 40
+        assert local.size == 80
+
+    def test_oversized_entries_are_skipped(self):
+        """Test entries above the per-entry limit never enter the tier."""
+        local = LocalCache(max_bytes=100, max_entry_bytes=50, ttl=60)
+        local.set('a', b'x' * 60)
+        assert local.get('a') is None
+        assert local.size == 0
+
+    def test_empty_entries_are_skipped(self):
+        """Test entries without a size never enter the tier, so none escape eviction."""
+        local = LocalCache(max_bytes=100, max_entry_bytes=100, ttl=60)
+        local.set('a', b'')
+        assert len(local) == 0
+
+
+@pytest.mark.django_db
+class TestTwoTierCache:
+    """Test cases for list responses served through both cache tiers."""
+
+    def test_tiers(self, api_client, multiple_users):
+        """Test a miss fills both tiers and later hits come from the local tier."""
+        url = reverse('appuser-list')
+        assert api_client.get(url).json()['meta']['cache_tier'] is None
+        assert api_client.get(url).json()['meta']['cache_tier'] == 'local'
+
+        local_cache.clear()
+        assert api_client.get(url).json()['meta']['cache_tier'] == 'redis'
+        assert api_client.get(url).json()['meta']['cache_tier'] == 'local'
+
+    def test_local_hits_do_not_share_meta(self, api_client, multiple_users):
+        """Test per-response metadata does not leak into the shared local entry."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+        api_client.get(url)
+
+        page, tier = get_page(list_cache_key(RequestFactory().get(url)))
+        assert tier == 'local'
+        assert page['meta']['cache_hit'] is False
+
+    @pytest.mark.parametrize('backend', ['django_redis', 'locmem'])
+    def test_local_tier_stays_within_budget(self, backend, settings, monkeypatch):
+        """Test pages filling past the byte budget are evicted on every cache backend."""
+        if backend == 'locmem':
+            settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        assert list_cache.is_django_redis() == (backend == 'django_redis')
+        local = LocalCache(max_bytes=4096, max_entry_bytes=4096, ttl=60)
+        monkeypatch.setattr(list_cache, 'local_cache', local)
+        page = {'data': [{'id': i, 'name': f'user {i}'} for i in range(20)], 'meta': {}}
+
+        for i in range(50):
+            set_page(f'page:{i}', page, timeout=60)
+            get_page(f'page:{i}')
+
+        assert 0 < local.size <= 4096
+        assert local.size == sum(len(value) for value, _ in local._entries.values())
+        assert len(local) < 50
+
+    def test_bump_generation_invalidates_both_tiers(self, api_client, multiple_users):
+        """Test a generation bump makes the next request a miss."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+        bump_generation()
+        assert api_client.get(url).json()['meta']['cache_hit'] is False
+
+    def test_cache_stats(self, api_client, multiple_users):
+        """Test hit ratios are reported per tier."""
+        tier_stats.reset()
+        url = reverse('appuser-list')
+        api_client.get(url)
+        api_client.get(url)
+        local_cache.clear()
+        api_client.get(url)
+
+        stats = api_client.get(reverse('appuser-cache-stats')).json()
+        assert stats['lookups'] == 3
+        assert stats['misses'] == 1
+        assert stats['local']['hits'] == 1
+        assert stats['redis']['hits'] == 1
+        assert stats['redis']['hit_ratio'] == 0.5
+
+
+@pytest.mark.django_db(transaction=True)
+class TestCacheWarming:
+    """Test cases for request tracking and the cache warmer."""
+
+    @pytest.fixture(autouse=True)
+    def flush_every_request(self, settings):
+        """Add request counts to Redis right away."""
+        settings.CACHE_WARM_FLUSH_INTERVAL = 0
+
+    def test_request_counts_are_batched(self, settings, api_client, multiple_users):
+        """Test request counts stay in the process until the flush interval has passed."""
+        settings.CACHE_WARM_FLUSH_INTERVAL = 60
+        url = reverse('appuser-list')
+        flush_request_counts()
+        for _ in range(3):
+            api_client.get(url)
+        assert popular_signatures(10) == []
+
+        flush_request_counts()
+        assert cache.client.get_client().zscore(cache.make_key('appusers:popular'), url) == 3
+
+    def test_popular_signatures(self, api_client, multiple_users):
+        """Test requests are counted per signature, most popular first."""
+        url = reverse('appuser-list')
+        for _ in range(3):
+            api_client.get(url, {'gender': 'Male'})
+        api_client.get(url)
+
+        assert popular_signatures(10) == [f'{url}?gender=Male', url]
+        assert popular_signatures(1) == [f'{url}?gender=Male']
+
+    def test_needs_refresh(self, api_client, multiple_users):
+        """Test missing and expiring entries need a refresh, fresh ones do not."""
+        url = reverse('appuser-list')
+        assert needs_refresh(url, refresh_before=60)
+
+        api_client.get(url)
+        assert not needs_refresh(url, refresh_before=60)
+        assert needs_refresh(url, refresh_before=60 * 60)
+
+    def test_warm_popular_renders_missing_pages(self, api_client, multiple_users):
+        """Test the warmer re-renders popular pages whose entry is gone."""
+        url = reverse('appuser-list')
+        api_client.get(url, {'page_size': 2})
+        api_client.get(url)
+        cache.delete(signature_cache_key(f'{url}?page_size=2'))
+
+        results = warm_popular(top=10, concurrency=2, refresh_before=60)
+
+        statuses = {result.signature: result.status for result in results}
+        assert statuses == {f'{url}?page_size=2': 'warmed', url: 'fresh'}
+        assert cache.get(signature_cache_key(f'{url}?page_size=2'))['count'] == 5
+
+    def test_warm_requests_are_not_counted(self, api_client, multiple_users):
+        """Test warmer requests do not inflate popularity."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+        warm_popular(top=10, concurrency=1, refresh_before=60, force=True)
+
+        assert cache.client.get_client().zscore(cache.make_key('appusers:popular'), url) == 1
+
+    def test_failing_page_does_not_abort_the_pass(self, api_client, multiple_users, monkeypatch):
+        """Test a view raising for one page is reported as failed while the others are warmed."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+        api_client.get(url, {'page_size': 2})
+        original = warming.resolve
+
+        def resolve(path):
+            match = original(path)
+            func = match.func
+
+            def view(request, *args, **kwargs):
+                if request.GET.get('page_size') == '2':
+                    raise RuntimeError('boom')
+                return func(request, *args, **kwargs)
+            match.func = view
+            return match
+        monkeypatch.setattr(warming, 'resolve', resolve)
+
+        results = warm_popular(top=10, concurrency=1, refresh_before=60, force=True)
+
+        outcomes = {result.signature: (result.status, result.detail) for result in results}
+        assert outcomes == {url: ('warmed', ''), f'{url}?page_size=2': ('failed', 'RuntimeError: boom')}
+
+    def test_lock_is_released_by_its_holder_only(self):
+        """Test a run whose lock expired and was taken over neither renews nor releases the new lock."""
+        first, second = warming.WarmLock(), warming.WarmLock()
+        assert first.acquire()
+        assert not second.acquire()
+        assert first.renew()
+
+        cache.delete(warming.WARM_LOCK_KEY)  # as if it had expired
+        assert second.acquire()
+        assert not first.renew()
+        first.release()
+        assert not warming.WarmLock().acquire()
+
+        second.release()
+        assert warming.WarmLock().acquire()
+
+    def test_lost_lock_stops_the_pass(self, api_client, multiple_users, monkeypatch):
+        """Test pages not yet rendered when the lock is taken over are skipped, and the new lock is kept."""
+        url = reverse('appuser-list')
+        for page_size in (2, 3, 4):
+            api_client.get(url, {'page_size': page_size})
+        intruder = warming.WarmLock()
+        original = warming.render_signature
+
+        def render_signature(signature):
+            result = original(signature)
+            cache.delete(warming.WARM_LOCK_KEY)
+            intruder.acquire()
+            return result
+
+        class LazyFuture(Future):
+            def __init__(self, fn, *args):
+                super().__init__()
+                self.call = (fn, args)
+
+            def result(self, timeout=None):
+                if self.set_running_or_notify_cancel():
+                    self.set_result(self.call[0](*self.call[1]))
+                return super().result(timeout)
+
+        class LazyExecutor:
+            """Runs each page when its result is asked for, so that the pass order is deterministic."""
+
+            def __init__(self, max_workers):
+                pass
+
+            def __enter__(self):
+                return self
+
+            def __exit__(self, *exc_info):
+                return False
+
+            def submit(self, fn, *args):
+                return LazyFuture(fn, *args)
+
+        monkeypatch.setattr(warming, 'render_signature', render_signature)
+        monkeypatch.setattr(warming, 'ThreadPoolExecutor', LazyExecutor)
+
+        results = warm_popular(top=10, concurrency=1, refresh_before=60, force=True)
+
+        assert [(result.status, result.detail) for result in results] == [
+            ('warmed', ''), ('failed', 'warm lock lost'), ('failed', 'warm lock lost'),
+        ]
+        assert intruder.renew()  # the pass did not release the intruder's lock
+
+    def test_warm_cache_command(self, api_client, multiple_users):
+        """Test the management command warms the popular pages."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+        cache.delete(signature_cache_key(url))
+
+        call_command('warm_cache', '--top', '5')
+
+        assert cache.get(signature_cache_key(url)) is not None
+
+
+@pytest.mark.django_db
+class TestClearCache:
+    """Test cases for pattern-scoped cache clearing."""
+
+    def fill(self):
+        cache.set_many({
+            signature_cache_key('/api/v1/appusers/?country=Germany'): {'results': []},
+            signature_cache_key('/api/v1/appusers/?country=France'): {'results': []},
+            'unrelated': 1,
+        })
+
+    def test_delete_matching(self):
+        """Test only the matching keys are deleted, in batches."""
+        self.fill()
+        counts = []
+
+        deleted = delete_matching('appusers::*Germany*', batch_size=1, progress=counts.append)
+
+        assert deleted == 1 and counts == [1]
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=Germany')) is None
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=France')) is not None
+        assert cache.get('unrelated') == 1
+
+    def test_dry_run_keeps_keys(self):
+        """Test a dry run only counts."""
+        self.fill()
+
+        assert delete_matching('appusers::*', dry_run=True) == 2
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=France')) is not None
+
+    def test_rate_limit(self, monkeypatch):
+        """Test deletions are paced to the rate limit."""
+        self.fill()
+        sleeps = []
+        monkeypatch.setattr('core.cache.time.sleep', sleeps.append)
+
+        delete_matching('appusers::*', batch_size=1, rate_limit=10)
+
+        # Two keys at 10 keys/s take at least 0.2s in total
+        assert len(sleeps) == 2 and sum(sleeps) > 0.15
+
+    def test_command_defaults_to_list_pages(self):
+        """Test the command clears list pages only and retires the generation."""
+        self.fill()
+        generation = current_generation()
+        out = StringIO()
+
+        call_command('clear_cache', stdout=out)
+
+        assert 'Deleted 2 keys' in out.getvalue()
+        assert cache.get('unrelated') == 1
+        assert current_generation() != generation
+
+    def test_command_with_pattern(self):
+        """Test --pattern deletes matching keys and keeps the generation."""
+        self.fill()
+        generation = current_generation()
+
+        call_command('clear_cache', '--pattern', 'appusers::*France*', '--rate-limit', '1000')
+
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=France')) is None
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=Germany')) is not None
+        assert current_generation() == generation
+
+    def test_command_dry_run_without_django_redis(self, settings):
+        """Test a dry run on other cache backends reports what would happen and keeps the generation."""
+        settings.CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        generation = current_generation()
+        out = StringIO()
+
+        call_command('clear_cache', '--dry-run', stdout=out)
+
+        assert 'Would retire every cached list page' in out.getvalue()
+        assert current_generation() == generation
+
+    def test_command_all_flushes(self, monkeypatch):
+        """Test --all still flushes everything."""
+        # Scoped to this run's keys, a FLUSHDB would empty the other xdist workers' too
+        monkeypatch.setattr(cache, 'clear', clear_redis)
+        self.fill()
+
+        call_command('clear_cache', '--all')
+
+        assert cache.get('unrelated') is None
+
+    def test_endpoint(self, admin_client, settings, monkeypatch):
+        """Test the admin endpoint counts on dry runs and queues the deletion otherwise."""
+        settings.JOBS_BACKEND = 'memory'
+        monkeypatch.setattr(jobs, '_memory_backend', jobs.InMemoryBackend())
+        self.fill()
+        url = reverse('appuser-cache-clear')
+
+        response = admin_client.post(url, {'pattern': 'appusers::*', 'dry_run': True}, format='json')
+        assert response.json()['matched'] == 2
+
+        response = admin_client.post(url, {'pattern': 'appusers::*Germany*'}, format='json')
+        assert response.status_code == 202
+        job = jobs.run_job(jobs.get_backend(), response.json()['id'])
+        assert job.status == jobs.SUCCEEDED, job.error
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=Germany')) is None
+        assert cache.get(signature_cache_key('/api/v1/appusers/?country=France')) is not None
+
+    def test_endpoint_requires_admin(self, api_client):
+        """Test anonymous users cannot clear the cache."""
+        response = api_client.post(reverse('appuser-cache-clear'), {'pattern': '*'}, format='json')
+        assert response.status_code == 403
@@ -0,0 +1,120 @@
+import pytest
+from datetime import timedelta
+from django.urls import reverse
+from django.utils import timezone
+from core.changes import encode_token
+from core.models import AppUser, AppUserTombstone
+from core.tests.conftest import AppUserFactory, CustomerRelationshipFactory
+
+
+@pytest.fixture
+def feed_settings(settings):
+    settings.CHANGES_SETTLE_SECONDS = 0
+    return settings
+
+
+def sync(client, token=None, limit=100):
+    params = {'limit': limit}
+    if token:
+        params['token'] = token
+    return client.get(reverse('appuser-changes'), params)
+
+
+def drain(client, token=None, limit=100):
+    """All events until has_more is false, and the token to poll with."""
+    results = []
+    while True:
+        data = sync(client, token, limit).json()
+        results.extend(data['results'])
+        token = data['next_token']
+        if not data['has_more']:
+            return results, token
+
+
+@pytest.mark.django_db
+class TestChangeFeed:
+    """Test cases for the incremental sync endpoint."""
+
+    def test_initial_sync_returns_every_user(self, api_client, feed_settings, multiple_users):
+        """Test a sync without token pages through all users in (last_updated, id) order."""
+        results, token = drain(api_client, limit=2)
+
+        assert [row['id'] for row in results] == list(
+            AppUser.objects.order_by('last_updated', 'id').values_list('id', flat=True)
+        )
+        assert {row['op'] for row in results} == {'upsert'}
+        assert results[0]['data']['customer_id'] == results[0]['customer_id']
+        assert len(results[0]['data']['relationships']) == 1
+        assert sync(api_client, token).json()['results'] == []
+
+    def test_updates_relationships_and_deletes(self, api_client, feed_settings, multiple_users):
+        """Test saves, relationship writes and deletions after the token are reported."""
+        _, token = drain(api_client)
+        edited, with_new_relationship, deleted = multiple_users[:3]
+
+        edited.first_name = 'Edited'
+        edited.save()
+        CustomerRelationshipFactory(appuser=with_new_relationship, points=42)
+        deleted_id, customer_id = deleted.id, deleted.customer_id
+        deleted.delete()
+
+        results, token = drain(api_client, token)
+        assert [(row['op'], row['id']) for row in results] == [
+            ('upsert', edited.id),
+            ('upsert', with_new_relationship.id),
+            ('delete', deleted_id),
+        ]
+        assert results[0]['data']['first_name'] == 'Edited'
+        assert results[2]['customer_id'] == customer_id
+        assert results[2]['data'] is None
+        assert drain(api_client, token)[0] == []
+
+    def test_address_change_touches_users(self, api_client, feed_settings, sample_user):
+        """Test editing an address reports its users as changed."""
+        _, token = drain(api_client)
+        sample_user.address.city = 'Elsewhere'
+        sample_user.address.save()
+
+        results, _ = drain(api_client, token)
+        assert [row['id'] for row in results] == [sample_user.id]
+        assert results[0]['data']['address']['city'] == 'Elsewhere'
+
+    def test_recent_changes_wait_to_settle(self, api_client, feed_settings, multiple_users):
+        """Test rows younger than CHANGES_SETTLE_SECONDS are held back."""
+        feed_settings.CHANGES_SETTLE_SECONDS = 60
+        AppUser.objects.filter(pk=multiple_users[0].pk).update(
+            last_updated=timezone.now() - timedelta(minutes=5)
+        )
+
+        results, _ = drain(api_client)
+        assert [row['id'] for row in results] == [multiple_users[0].id]
+
+    def test_first_sync_skips_older_deletions(self, api_client, feed_settings, multiple_users):
+        """Test deletions from before a first sync are not replayed."""
+        multiple_users[0].delete()
+        assert AppUserTombstone.objects.count() == 1
+
+        results, _ = drain(api_client)
+        assert 'delete' not in {row['op'] for row in results}
+        assert len(results) == 4
+
+    def test_invalid_token(self, api_client, feed_settings):
+        """Test malformed tokens are rejected."""
+        response = sync(api_client, 'not-a-token')
+        assert response.status_code == 400
+        assert 'token' in response.json()
+
+    def test_expired_token(self, api_client, feed_settings):
+        """Test tokens older than the tombstone retention ask for a full resync."""
+        old = timezone.now() - timedelta(days=feed_settings.CHANGES_TOMBSTONE_RETENTION_DAYS + 1)
+        response = sync(api_client, encode_token({'users': (old, 1), 'deleted': (old, 0)}))
+        assert response.status_code == 410
+
+    def test_updated_after_filter(self, api_client, multiple_users):
+        """Test the list endpoint filters on last_updated."""
+        AppUser.objects.update(last_updated=timezone.now() - timedelta(days=10))
+        multiple_users[0].save()
+
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        response = api_client.get(reverse('appuser-list'), {'updated_after': since})
+        assert [row['id'] for row in response.json()['results']] == [multiple_users[0].id]
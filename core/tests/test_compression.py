@@ -0,0 +1,190 @@
+import datetime
+import json
+import uuid
+from decimal import Decimal
+
+import pytest
+from django.http import HttpResponse
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from common.renderers import ORJSONRenderer
+from core import cache as list_cache
+from core import compression
+from core.cache import clear_local, list_cache_key
+
+
+class TestRenderer:
+    """Test cases for the orjson renderer."""
+
+    def test_matches_json_renderer_output(self):
+        """Test dates, datetimes, UUIDs and Decimals render as DRF's JSON renderer does."""
+        data = {
+            'date': datetime.date(2024, 2, 29),
+            'at': datetime.datetime(2024, 2, 29, 12, 30, tzinfo=datetime.timezone.utc),
+            'id': uuid.UUID(int=1),
+            'amount': Decimal('1.50'),
+            1: 'non-string key',
+        }
+
+        rendered = json.loads(ORJSONRenderer().render(data))
+
+        assert rendered == json.loads(JSONRenderer().render(data))
+        assert (rendered['date'], rendered['at']) == ('2024-02-29', '2024-02-29T12:30:00Z')
+
+    def test_indent_falls_back(self):
+        """Test indented output is still available."""
+        assert ORJSONRenderer().render({'a': 1}, 'application/json; indent=2') == b'{\n  "a": 1\n}'
+
+
+class TestNegotiation:
+    """Test cases for choosing the encoding from Accept-Encoding."""
+
+    @pytest.mark.parametrize('header, encoding', [
+        ('', None),
+        ('identity', None),
+        ('gzip', 'gzip'),
+        ('gzip;q=0.5, deflate', 'gzip'),
+        ('gzip;q=0, *;q=0.1', compression.available_encodings()[0]),
+        ('*', compression.available_encodings()[0]),
+        ('GZIP;q=1.0', 'gzip'),
+    ])
+    def test_choose_encoding(self, header, encoding):
+        """Test q-values, wildcards and the order of preference."""
+        assert compression.choose_encoding(header) == encoding
+
+    def test_candidates(self):
+        """Test only the given candidates are considered."""
+        assert compression.choose_encoding('br', compression.CONCATENABLE) is None
+        assert compression.choose_encoding('br, gzip', compression.CONCATENABLE) == 'gzip'
+
+    @pytest.mark.parametrize('encoding', compression.CONCATENABLE)
+    def test_concatenated_parts(self, encoding):
+        """Test a stored prefix followed by a separately compressed meta decodes as one body."""
+        if encoding not in compression.available_encodings():
+            pytest.skip(f'{encoding} is not installed')
+        rendered = b'{"count":1,"results":[' + b'{"id":1},' * 200 + b'{"id":2}]}'
+        body = compression.encode_prefix(rendered)[encoding] + compression.encode_suffix(b'{"cache_hit":true}', encoding)
+
+        data = json.loads(compression.decompress(body, encoding))
+
+        assert data['meta'] == {'cache_hit': True}
+        assert len(data['results']) == 201
+
+
+@pytest.mark.django_db
+class TestCompressedResponses:
+    """Test cases for compressed API responses."""
+
+    def test_list_is_compressed(self, api_client, multiple_users):
+        """Test the list endpoint sends the same JSON gzip-compressed when asked."""
+        url = reverse('appuser-list')
+        plain = api_client.get(url, {'ordering': 'id'}).json()
+
+        response = api_client.get(url, {'ordering': 'id'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response['Vary']
+        data = json.loads(compression.decompress(response.content, 'gzip'))
+        assert data['results'] == plain['results']
+        assert data['meta']['cache_hit'] is True
+
+    def test_hits_are_served_pre_compressed(self, api_client, multiple_users, monkeypatch):
+        """Test a cached page is sent from its stored body without rendering the page again."""
+        url = reverse('appuser-list')
+        miss = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+        key = list_cache_key(miss.wsgi_request)
+        assert list_cache.get_page_body(key, 'gzip') is not None
+
+        rendered = []
+        original = ORJSONRenderer.render
+
+        def render(self, data, *args):
+            rendered.append(data)
+            return original(self, data, *args)
+        monkeypatch.setattr(ORJSONRenderer, 'render', render)
+        hit = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert hit['Content-Encoding'] == 'gzip'
+        assert [set(data) for data in rendered] == [{'query_time', 'response_time', 'cache_hit', 'cache_tier', 'etag'}]
+        data = json.loads(compression.decompress(hit.content, 'gzip'))
+        assert (data['count'], data['meta']['cache_hit']) == (5, True)
+        assert hit['ETag'] == miss['ETag']
+
+    def test_hits_from_redis(self, api_client, multiple_users):
+        """Test the stored bodies are shared through Redis, not only the local tier."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+        clear_local()
+
+        response = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+        data = json.loads(compression.decompress(response.content, 'gzip'))
+        assert data['meta']['cache_tier'] == 'redis'
+
+    def test_brotli_on_the_fly(self, api_client, multiple_users):
+        """Test encodings that cannot be stored in parts are applied by the middleware."""
+        if 'br' not in compression.available_encodings():
+            pytest.skip('brotli is not installed')
+        url = reverse('appuser-list')
+        api_client.get(url)
+
+        response = api_client.get(url, HTTP_ACCEPT_ENCODING='br')
+
+        assert response['Content-Encoding'] == 'br'
+        assert json.loads(compression.decompress(response.content, 'br'))['count'] == 5
+
+    def test_small_responses_are_not_compressed(self, api_client, settings, multiple_users):
+        """Test bodies under COMPRESSION_MIN_BYTES are sent as they are."""
+        settings.COMPRESSION_MIN_BYTES = 10 ** 6
+        url = reverse('appuser-list')
+        api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        response = api_client.get(url, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert not response.has_header('Content-Encoding')
+        assert response.json()['meta']['cache_hit'] is True
+
+    def test_disabled(self, api_client, settings, multiple_users):
+        """Test nothing is compressed with COMPRESSION_ENABLED off."""
+        settings.COMPRESSION_ENABLED = False
+
+        response = api_client.get(reverse('appuser-list'), HTTP_ACCEPT_ENCODING='gzip')
+
+        assert not response.has_header('Content-Encoding')
+        assert response.json()['count'] == 5
+
+    def test_browsable_api_is_not_compressed(self, api_client, multiple_users):
+        """Test HTML pages, which carry the CSRF token, are never compressed (BREACH)."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+
+        response = api_client.get(url, HTTP_ACCEPT='text/html', HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Type'].startswith('text/html')
+        assert not response.has_header('Content-Encoding')
+        assert b'<html' in response.content
+
+    def test_other_formats_compressed_on_the_fly(self, api_client, multiple_users):
+        """Test formats that are not stored pre-compressed are compressed by the middleware."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+
+        response = api_client.get(url, {'format': 'columnar'}, HTTP_ACCEPT_ENCODING='gzip')
+
+        assert response['Content-Encoding'] == 'gzip'
+        assert json.loads(compression.decompress(response.content, 'gzip'))['count'] == 5
+
+    def test_no_transform(self, rf, settings):
+        """Test responses marked Cache-Control: no-transform are sent as they are."""
+        settings.COMPRESSION_MIN_BYTES = 0
+        request = rf.get('/', HTTP_ACCEPT_ENCODING='gzip')
+        body = b'{"a":' + b'1' * 2000 + b'}'
+
+        plain = HttpResponse(body, content_type='application/json')
+        kept = HttpResponse(body, content_type='application/json', headers={'Cache-Control': 'private, No-Transform'})
+        middleware = compression.CompressionMiddleware(lambda request: None)
+
+        assert middleware.process_response(request, plain)['Content-Encoding'] == 'gzip'
+        assert not middleware.process_response(request, kept).has_header('Content-Encoding')
+        assert kept.content == body
@@ -2,6 +2,7 @@ import pytest
 from datetime import date, datetime
 from django.db.models import Q
 from core.filters import build_appuser_filters
+from core.models import AppUser
 from core.tests.conftest import AppUserFactory, CustomerRelationshipFactory
 
 
@@ -157,4 +158,71 @@ class TestBuildAppUserFilters:
             Q(first_name__icontains='John') &
             Q(last_name__icontains='Doe')
         )
-        assert filters == expected
\ No newline at end of file
+        assert filters == expected
+    def test_birthday_range_filters(self):
+        """Test birthday range filtering, ignoring invalid bounds."""
+        filters = build_appuser_filters({'birthday_from': '1990-01-01', 'birthday_to': '1999-12-31'})
+        assert filters == Q(birthday__gte=date(1990, 1, 1)) & Q(birthday__lte=date(1999, 12, 31))
+
+        assert build_appuser_filters({'birthday_from': 'invalid', 'birthday_to': '1999-13-01'}) == Q()
+
+    def test_age_filters(self, monkeypatch):
+        """Test ages become birthday bounds relative to today."""
+        monkeypatch.setattr('django.utils.timezone.localdate', lambda: date(2026, 10, 19))
+        filters = build_appuser_filters({'age_min': '25', 'age_max': '34'})
+
+        expected = Q(birthday__lte=date(2001, 10, 19)) & Q(birthday__gt=date(1991, 10, 19))
+        assert filters == expected
+
+    def test_age_filters_on_leap_day(self, monkeypatch):
+        """Test on February 29th the bounds fall on February 28th of other years."""
+        monkeypatch.setattr('django.utils.timezone.localdate', lambda: date(2028, 2, 29))
+        filters = build_appuser_filters({'age_min': '25', 'age_max': '27'})
+
+        expected = Q(birthday__lte=date(2003, 2, 28)) & Q(birthday__gt=date(2000, 2, 29))
+        assert filters == expected
+
+    def test_invalid_age_and_anniversary_filters(self):
+        """Test invalid ages and month-days are ignored."""
+        params = {'age_min': 'abc', 'age_max': '99999', 'anniversary_from': '13-01', 'anniversary_to': '02-30'}
+        assert build_appuser_filters(params) == Q()
+
+
+@pytest.mark.django_db
+class TestAnniversaryFilters:
+    """Test cases for filtering birthdays by a window of the year."""
+
+    @pytest.fixture
+    def birthdays(self):
+        """Users born around New Year, on and around a leap day, and without a birthday."""
+        days = [date(1980, 12, 30), date(1990, 1, 2), date(1985, 2, 28), date(1996, 2, 29),
+                date(1970, 6, 15), date(2000, 12, 27)]
+        for day in days:
+            AppUserFactory(birthday=day)
+        AppUserFactory(birthday=None)
+
+    def matching(self, params):
+        return sorted(AppUser.objects.filter(build_appuser_filters(params)).values_list('birthday', flat=True))
+
+    def test_window(self, birthdays):
+        """Test a window within the year matches whatever the birth year, leap days included."""
+        assert self.matching({'anniversary_from': '02-28', 'anniversary_to': '03-01'}) == [
+            date(1985, 2, 28), date(1996, 2, 29),
+        ]
+
+    def test_window_wrapping_around_new_year(self, birthdays):
+        """Test a window past December 31st continues in January."""
+        assert self.matching({'anniversary_from': '12-28', 'anniversary_to': '01-03'}) == [
+            date(1980, 12, 30), date(1990, 1, 2),
+        ]
+
+    def test_open_ended_window(self, birthdays):
+        """Test a single bound runs to the end or from the start of the year."""
+        assert self.matching({'anniversary_from': '12-28'}) == [date(1980, 12, 30)]
+        assert self.matching({'anniversary_to': '01-31'}) == [date(1990, 1, 2)]
+
+    def test_combined_with_age(self, birthdays, monkeypatch):
+        """Test anniversary and age filters combine."""
+        monkeypatch.setattr('django.utils.timezone.localdate', lambda: date(2026, 10, 19))
+        params = {'anniversary_from': '12-01', 'anniversary_to': '01-31', 'age_min': 30, 'age_max': 40}
+        assert self.matching(params) == [date(1990, 1, 2)]
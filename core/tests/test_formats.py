@@ -0,0 +1,117 @@
+import json
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from django.urls import reverse
+from common.renderers import columnize, msgpack
+
+
+COLUMNAR = 'application/vnd.crm.columnar+json'
+
+
+class TestColumnize:
+    """Test cases for the fields + rows layout."""
+
+    def test_nested_objects_and_lists(self):
+        """Test nested objects and lists of objects become arrays under a sub-field list."""
+        rows = [
+            {'id': 1, 'address': None, 'relationships': []},
+            {'id': 2, 'address': {'city': 'Berlin', 'country': 'DE'}, 'relationships': [{'points': 5}, {'points': 7}]},
+        ]
+
+        fields, values = columnize(rows)
+
+        assert fields == [
+            'id',
+            {'name': 'address', 'fields': ['city', 'country']},
+            {'name': 'relationships', 'fields': ['points'], 'many': True},
+        ]
+        assert values == [[1, None, []], [2, ['Berlin', 'DE'], [[5], [7]]]]
+
+    def test_empty(self):
+        """Test an empty list has no fields."""
+        assert columnize([]) == ([], [])
+
+
+@pytest.mark.django_db
+class TestResponseFormats:
+    """Test cases for the negotiated formats of the list and lookup endpoints."""
+
+    def rebuild(self, fields, row):
+        """Turn a columnar row back into the nested JSON object."""
+        obj = {}
+        for field, value in zip(fields, row):
+            if isinstance(field, str):
+                obj[field] = value
+            elif value is None:
+                obj[field['name']] = None
+            elif field.get('many'):
+                obj[field['name']] = [dict(zip(field['fields'], item)) for item in value]
+            else:
+                obj[field['name']] = dict(zip(field['fields'], value))
+        return obj
+
+    def test_list_columnar(self, api_client, multiple_users):
+        """Test the columnar layout holds the same rows as the nested JSON."""
+        url = reverse('appuser-list')
+        nested = api_client.get(url, {'ordering': 'id'}).json()
+
+        response = api_client.get(url, {'ordering': 'id'}, HTTP_ACCEPT=COLUMNAR)
+
+        assert response['Content-Type'] == COLUMNAR
+        data = json.loads(response.content)
+        assert data['count'] == nested['count']
+        assert list(data) == ['count', 'page', 'pages', 'fields', 'results', 'meta']
+        assert [self.rebuild(data['fields'], row) for row in data['results']] == nested['results']
+        assert len(response.content) < len(json.dumps(nested))
+
+    def test_format_parameter(self, api_client, multiple_users):
+        """Test ?format=columnar selects the layout without an Accept header."""
+        response = api_client.get(reverse('appuser-list'), {'format': 'columnar'})
+
+        assert response['Content-Type'] == COLUMNAR
+        assert 'fields' in json.loads(response.content)
+
+    def test_lookup_columnar(self, api_client, multiple_users):
+        """Test keyed lookup results keep their keys next to the rows."""
+        customer_ids = [user.customer_id for user in multiple_users[:2]]
+        response = api_client.post(
+            reverse('appuser-lookup'), {'customer_ids': customer_ids}, format='json', HTTP_ACCEPT=COLUMNAR
+        )
+
+        data = json.loads(response.content)
+        customer_id = data['fields'].index('customer_id')
+        assert sorted(data['keys']) == sorted(customer_ids)
+        assert [row[customer_id] for row in data['results']] == data['keys']
+
+    @pytest.mark.skipif(msgpack is None, reason='msgpack is not installed')
+    def test_list_msgpack(self, api_client, multiple_users):
+        """Test MessagePack carries the same nested structure as JSON."""
+        url = reverse('appuser-list')
+        nested = api_client.get(url).json()
+
+        response = api_client.get(url, HTTP_ACCEPT='application/msgpack')
+
+        assert response['Content-Type'] == 'application/msgpack'
+        assert msgpack.unpackb(response.content)['results'] == nested['results']
+
+    def test_json_stays_default(self, api_client, multiple_users):
+        """Test clients without a preference still get nested JSON."""
+        response = api_client.get(reverse('appuser-list'), HTTP_ACCEPT='*/*')
+
+        assert response['Content-Type'] == 'application/json'
+        assert isinstance(response.json()['results'][0], dict)
+
+
+@pytest.mark.django_db
+class TestBenchmarkFormats:
+    """Test cases for the benchmark_formats command."""
+
+    def test_reports_each_format(self, multiple_users):
+        """Test a row is printed per format with its size."""
+        out = StringIO()
+        call_command('benchmark_formats', '--page-size', '5', '--repeat', '2', stdout=out, stderr=StringIO())
+
+        lines = out.getvalue().splitlines()
+        assert lines[0] == 'Page of 5 users, median of 2 runs'
+        assert {line.split()[0] for line in lines[2:]} >= {'json', 'columnar'}
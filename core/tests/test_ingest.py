@@ -0,0 +1,133 @@
+import json
+import pytest
+from io import StringIO
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.urls import reverse
+from core.ingest import ingest
+from core.models import Address, AppUser, CustomerRelationship
+from core.tests.conftest import AddressFactory, AppUserFactory
+
+
+def row(customer_id, **overrides):
+    data = {
+        'customer_id': customer_id,
+        'first_name': 'Ada',
+        'last_name': 'Lovelace',
+        'gender': 'Female',
+        'phone_number': '+491234567',
+        'birthday': '1990-12-10',
+        'address': {
+            'street': 'Main Street', 'street_number': '1', 'city_code': '10115',
+            'city': 'Berlin', 'country': 'Germany',
+        },
+        'relationships': [{'points': 120, 'created': '2024-05-01T10:00:00Z', 'last_activity': None}],
+    }
+    data.update(overrides)
+    return json.dumps(data)
+
+
+@pytest.mark.django_db
+class TestIngest:
+    """Test cases for bulk NDJSON ingestion."""
+
+    def test_creates_users_with_shared_address(self):
+        """Test new customers are inserted and identical addresses stored once."""
+        result = ingest([row('C1'), row('C2', first_name='Grace')], batch_size=10)
+
+        assert (result.received, result.created, result.updated, result.errors) == (2, 2, 0, [])
+        assert Address.objects.count() == 1
+        assert AppUser.objects.get(customer_id='C2').first_name == 'Grace'
+        assert CustomerRelationship.objects.count() == 2
+
+    def test_upserts_existing_users(self):
+        """Test known customer_ids are updated in place and reuse existing addresses."""
+        address = AddressFactory(street='Main Street', street_number='1', city_code='10115',
+                                 city='Berlin', country='Germany')
+        user = AppUserFactory(customer_id='C1', first_name='Old', address=address)
+
+        result = ingest([row('C1', first_name='New')])
+
+        assert (result.created, result.updated) == (0, 1)
+        user.refresh_from_db()
+        assert user.first_name == 'New'
+        assert user.address_id == address.id
+        assert Address.objects.count() == 1
+
+    def test_resent_relationships_are_skipped(self):
+        """Test relationships are appended once per (appuser, created)."""
+        ingest([row('C1')])
+        ingest([row('C1'), row('C1', relationships=[
+            {'points': 120, 'created': '2024-05-01T10:00:00Z'},
+            {'points': 5, 'created': '2024-06-01T10:00:00Z'},
+        ])])
+
+        assert sorted(CustomerRelationship.objects.values_list('points', flat=True)) == [5, 120]
+
+    def test_invalid_rows_do_not_stop_the_batch(self):
+        """Test bad lines are reported by line number while the rest is written."""
+        lines = [
+            row('C1'),
+            '{not json',
+            row('C2', gender='Robot'),
+            '',
+            row('C3', address={'city': 'Berlin'}),
+            row('C4'),
+        ]
+        result = ingest(lines, batch_size=2)
+
+        assert result.received == 5
+        assert [(error['line'], error['customer_id']) for error in result.errors] == [
+            (2, None), (3, 'C2'), (5, 'C3'),
+        ]
+        assert 'gender' in result.errors[1]['errors']
+        assert set(AppUser.objects.values_list('customer_id', flat=True)) == {'C1', 'C4'}
+
+    def test_database_errors_are_isolated(self, monkeypatch):
+        """Test a row the database rejects only fails itself."""
+        bulk_create = CustomerRelationship.objects.bulk_create
+
+        def reject_negative_points(objs, *args, **kwargs):
+            if any(obj.points < 0 for obj in objs):
+                raise IntegrityError('points must not be negative')
+            return bulk_create(objs, *args, **kwargs)
+
+        monkeypatch.setattr(CustomerRelationship.objects, 'bulk_create', reject_negative_points)
+        result = ingest([row('C1'), row('C2', relationships=[{'points': -1}]), row('C3')])
+
+        assert result.created == 2
+        assert [error['customer_id'] for error in result.errors] == ['C2']
+        assert set(AppUser.objects.values_list('customer_id', flat=True)) == {'C1', 'C3'}
+
+    def test_row_limit(self):
+        """Test rows beyond max_rows are not read."""
+        result = ingest([row('C1'), row('C2'), row('C3')], max_rows=2)
+        assert result.created == 2
+        assert result.errors[0]['line'] == 3
+
+    def test_endpoint(self, admin_client):
+        """Test the endpoint accepts NDJSON bodies from admin users."""
+        body = '\n'.join([row('C1'), row('C2', gender='Robot')]) + '\n'
+        response = admin_client.post(reverse('appuser-ingest'), body, content_type='application/x-ndjson')
+
+        assert response.status_code == 200
+        data = response.json()
+        assert (data['received'], data['created']) == (2, 1)
+        assert data['errors'][0]['line'] == 2
+
+    def test_endpoint_requires_admin(self, api_client):
+        """Test anonymous clients cannot write."""
+        response = api_client.post(reverse('appuser-ingest'), row('C1'), content_type='application/x-ndjson')
+        assert response.status_code in (401, 403)
+        assert not AppUser.objects.exists()
+
+    def test_command(self, tmp_path):
+        """Test the management command reads a file."""
+        path = tmp_path / 'customers.ndjson'
+        path.write_text('\n'.join([row('C1'), row('C2')]))
+        out = StringIO()
+
+        call_command('ingest_ndjson', str(path), stdout=out)
+
+        assert '2 created' in out.getvalue()
+        assert AppUser.objects.count() == 2
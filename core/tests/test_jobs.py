@@ -0,0 +1,275 @@
+import threading
+import time
+import pytest
+from io import StringIO
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.urls import reverse
+from core import jobs
+from core.models import AppUser
+
+
+@pytest.fixture
+def memory_jobs(settings, monkeypatch):
+    """A fresh in-memory job backend."""
+    settings.JOBS_BACKEND = 'memory'
+    backend = jobs.InMemoryBackend()
+    monkeypatch.setattr(jobs, '_memory_backend', backend)
+    return backend
+
+
+@pytest.fixture
+def register_task(monkeypatch):
+    """Register a task for the duration of a test."""
+    def register(name, function):
+        monkeypatch.setitem(jobs.TASKS, name, function)
+    return register
+
+
+def run_next(backend):
+    return jobs.run_job(backend, backend.pop(1))
+
+
+class TestJobs:
+    """Test cases for the job queue and its workers."""
+
+    def test_runs_task_with_progress(self, memory_jobs, register_task):
+        """Test a queued job runs with its params and keeps its progress and result."""
+        def count(job, upto):
+            for number in range(1, upto + 1):
+                job.progress(number, upto, f'{number} done')
+            return {'counted': upto}
+        register_task('count', count)
+
+        job = jobs.enqueue('count', upto=3)
+        assert jobs.get_job(job.id).status == jobs.QUEUED
+        run_next(memory_jobs)
+
+        job = jobs.get_job(job.id)
+        assert (job.status, job.done, job.total, job.message) == (jobs.SUCCEEDED, 3, 3, '3 done')
+        assert job.result == {'counted': 3}
+        assert job.started_at and job.finished_at
+
+    def test_records_failure(self, memory_jobs, register_task):
+        """Test an exception fails the job with its message instead of killing the worker."""
+        def broken(job):
+            raise RuntimeError('boom')
+        register_task('broken', broken)
+
+        jobs.enqueue('broken')
+        job = run_next(memory_jobs)
+
+        assert (job.status, job.error) == (jobs.FAILED, 'RuntimeError: boom')
+
+    def test_cancelled_queued_job_never_runs(self, memory_jobs, register_task):
+        """Test cancelling a queued job removes it from the queue."""
+        calls = []
+        register_task('record', lambda job: calls.append(job.id))
+
+        job = jobs.enqueue('record')
+        assert jobs.cancel(job.id).status == jobs.CANCELLED
+
+        assert memory_jobs.pop(0) is None
+        assert jobs.run_job(memory_jobs, job.id) is None
+        assert calls == []
+
+    def test_cancel_running_job_stops_at_next_progress(self, memory_jobs, register_task):
+        """Test a running job is stopped by its first progress report after the cancel."""
+        def cancelled_midway(job):
+            job.progress(1, 3)
+            jobs.cancel(job.id)
+            job.progress(2, 3)
+            raise AssertionError('not reached')
+        register_task('midway', cancelled_midway)
+
+        job = jobs.enqueue('midway')
+        run_next(memory_jobs)
+
+        job = jobs.get_job(job.id)
+        assert (job.status, job.done, job.error) == (jobs.CANCELLED, 2, '')
+
+    def test_rejects_unknown_task_and_params(self, memory_jobs):
+        """Test only registered tasks and their command options are accepted."""
+        with pytest.raises(jobs.InvalidJob):
+            jobs.enqueue('nope')
+        with pytest.raises(jobs.InvalidJob):
+            jobs.enqueue('populate_data', users=1, verbosity=3)
+        with pytest.raises(jobs.InvalidJob):
+            jobs.enqueue('populate_data', background=True)
+
+    def test_worker_bounds_concurrency(self, memory_jobs, register_task):
+        """Test a worker never runs more jobs at once than its concurrency."""
+        lock, running, peak = threading.Lock(), [0], [0]
+
+        def sleepy(job):
+            with lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.05)
+            with lock:
+                running[0] -= 1
+        register_task('sleepy', sleepy)
+        queued = [jobs.enqueue('sleepy') for _ in range(6)]
+
+        finished = []
+        jobs.Worker(concurrency=2, backend=memory_jobs).run(burst=True, on_finish=finished.append)
+
+        assert peak[0] == 2
+        assert sorted(job.id for job in finished) == sorted(job.id for job in queued)
+        assert {job.status for job in finished} == {jobs.SUCCEEDED}
+
+    def test_redis_backend(self, settings, register_task):
+        """Test the Redis backend queues, runs and cancels jobs like the in-memory one."""
+        settings.JOBS_BACKEND = 'redis'
+        register_task('count', lambda job, upto: job.progress(upto, upto))
+        backend = jobs.get_backend()
+
+        done = jobs.enqueue('count', upto=2)
+        cancelled = jobs.enqueue('count', upto=5)
+        jobs.cancel(cancelled.id)
+        run_next(backend)
+
+        assert (jobs.get_job(done.id).status, jobs.get_job(done.id).done) == (jobs.SUCCEEDED, 2)
+        assert jobs.get_job(cancelled.id).status == jobs.CANCELLED
+        assert backend.pop(0.1) is None
+        assert [job.id for job in jobs.recent_jobs()] == [cancelled.id, done.id]
+        assert backend.client.llen(cache.make_key(jobs.PROCESSING_KEY)) == 0
+
+    def test_redis_requeues_job_popped_by_dead_worker(self, settings, register_task):
+        """Test a job popped but never claimed goes back on the queue once its lease expires."""
+        settings.JOBS_BACKEND = 'redis'
+        settings.JOBS_LEASE_SECONDS = 0
+        register_task('count', lambda job, upto: job.progress(upto, upto))
+        backend = jobs.get_backend()
+        job = jobs.enqueue('count', upto=1)
+
+        assert backend.pop(0.1) == job.id  # and the worker dies
+        assert backend.reap() == {}  # first seen unclaimed: given a lease
+        time.sleep(0.01)
+        assert backend.reap() == {job.id: 'requeued'}
+
+        run_next(backend)
+        assert jobs.get_job(job.id).status == jobs.SUCCEEDED
+
+    def test_redis_fails_job_of_killed_worker(self, settings, register_task):
+        """Test a running job whose lease is not renewed is failed by the reaper."""
+        settings.JOBS_BACKEND = 'redis'
+        register_task('count', lambda job, upto: job.progress(upto, upto))
+        backend = jobs.get_backend()
+        job = jobs.enqueue('count', upto=1)
+        assert backend.claim(backend.pop(0.1), '2024-01-01T00:00:00')  # and the worker is killed
+
+        assert backend.reap() == {}
+        settings.JOBS_LEASE_SECONDS = 0
+        backend.heartbeat([job.id])
+        time.sleep(0.01)
+        assert backend.reap() == {job.id: 'failed'}
+
+        job = jobs.get_job(job.id)
+        assert (job.status, job.error) == (jobs.FAILED, 'Worker lost: its lease expired')
+        assert backend.client.llen(cache.make_key(jobs.PROCESSING_KEY)) == 0
+
+
+@pytest.mark.django_db
+class TestCommandJobs:
+    """Test cases for management commands run as jobs."""
+
+    def test_populate_data_job_reports_progress(self, memory_jobs):
+        """Test populate_data runs as a job and reports the users it created."""
+        job = jobs.enqueue('populate_data', users=3, batch_size=2)
+        run_next(memory_jobs)
+
+        job = jobs.get_job(job.id)
+        assert job.status == jobs.SUCCEEDED, job.error
+        assert (job.done, job.total) == (3, 3)
+        assert 'Successfully created 3 users' in job.result['output']
+        assert AppUser.objects.count() == 3
+
+    def test_params_are_parsed_by_the_command(self, memory_jobs):
+        """Test job params get the command's type conversion, and bad ones are rejected when queued."""
+        job = jobs.enqueue('populate_data', users='2', batch_size='2')
+        run_next(memory_jobs)
+        assert jobs.get_job(job.id).status == jobs.SUCCEEDED, jobs.get_job(job.id).error
+        assert AppUser.objects.count() == 2
+
+        job = jobs.enqueue('refresh_rollups', dimension=['gender', 'country'], full=True)
+        run_next(memory_jobs)
+        assert 'gender: folded in 2 rows' in jobs.get_job(job.id).result['output']
+
+        with pytest.raises(jobs.InvalidJob):
+            jobs.enqueue('populate_data', users='many')
+        with pytest.raises(jobs.InvalidJob):
+            jobs.enqueue('refresh_rollups', dimension=['shoe_size'])
+
+    def test_clear_cache_all_is_refused(self, memory_jobs):
+        """Test clear_cache --all, which would flush the job queue, cannot run as a job."""
+        with pytest.raises(jobs.InvalidJob):
+            jobs.enqueue('clear_cache', all=True)
+        with pytest.raises(CommandError):
+            call_command('clear_cache', '--all', '--background', stdout=StringIO())
+
+    def test_background_flag_queues_job(self, memory_jobs):
+        """Test --background queues the command instead of running it."""
+        out = StringIO()
+        call_command('populate_data', '--users', '5', '--background', stdout=out)
+
+        job = jobs.recent_jobs()[0]
+        assert (job.task, job.params['users'], job.status) == ('populate_data', 5, jobs.QUEUED)
+        assert job.id in out.getvalue()
+        assert AppUser.objects.count() == 0
+
+    def test_run_jobs_command(self, memory_jobs):
+        """Test run_jobs --burst runs the queue and exits."""
+        job = jobs.enqueue('clear_cache')
+        out = StringIO()
+
+        call_command('run_jobs', '--burst', '--concurrency', '1', stdout=out)
+
+        assert jobs.get_job(job.id).status == jobs.SUCCEEDED
+        assert f'clear_cache {job.id}: succeeded' in out.getvalue()
+
+
+@pytest.mark.django_db
+class TestJobEndpoints:
+    """Test cases for the job status endpoints."""
+
+    def test_requires_admin(self, api_client, memory_jobs):
+        """Test anonymous users cannot list or queue jobs."""
+        assert api_client.get(reverse('job-list')).status_code == 403
+        assert api_client.post(reverse('job-list'), {'task': 'clear_cache'}, format='json').status_code == 403
+
+    def test_queue_and_inspect_job(self, admin_client, memory_jobs):
+        """Test a job is queued with 202 and can be read back and listed."""
+        response = admin_client.post(
+            reverse('job-list'), {'task': 'populate_data', 'params': {'users': 10}}, format='json'
+        )
+
+        assert response.status_code == 202
+        job_id = response.json()['id']
+        detail = admin_client.get(reverse('job-detail', args=[job_id])).json()
+        assert (detail['task'], detail['status'], detail['params']) == ('populate_data', 'queued', {'users': 10})
+        listing = admin_client.get(reverse('job-list')).json()
+        assert [job['id'] for job in listing['results']] == [job_id]
+        assert 'populate_data' in listing['tasks']
+
+    def test_rejects_invalid_job(self, admin_client, memory_jobs):
+        """Test unknown tasks and parameters are a 400."""
+        assert admin_client.post(reverse('job-list'), {'task': 'nope'}, format='json').status_code == 400
+        response = admin_client.post(
+            reverse('job-list'), {'task': 'clear_cache', 'params': {'users': 10}}, format='json'
+        )
+        assert response.status_code == 400
+
+    def test_cancel_job(self, admin_client, memory_jobs):
+        """Test cancelling a queued job through the API."""
+        job = jobs.enqueue('clear_cache')
+
+        response = admin_client.post(reverse('job-cancel', args=[job.id]))
+
+        assert response.status_code == 200
+        assert response.json()['status'] == 'cancelled'
+
+    def test_unknown_job(self, admin_client, memory_jobs):
+        """Test unknown job ids are a 404."""
+        assert admin_client.get(reverse('job-detail', args=['missing'])).status_code == 404
+        assert admin_client.post(reverse('job-cancel', args=['missing'])).status_code == 404
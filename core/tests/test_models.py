@@ -1,6 +1,8 @@
 import pytest
+from io import StringIO
 from datetime import date, timedelta
 from django.core.exceptions import ValidationError
+from django.core.management import call_command
 from django.db import IntegrityError
 from django.utils import timezone
 from core.models import Address, AppUser, CustomerRelationship
@@ -51,6 +53,95 @@ class TestAddressModel:
         assert ['city', 'country'] in index_fields
 
 
+@pytest.mark.django_db
+class TestAddressIdentity:
+    """Test cases for address normalization and deduplication."""
+
+    def make(self, **overrides):
+        fields = dict(street="Main Street", street_number="1", city_code="10115", city="Berlin", country="Germany")
+        fields.update(overrides)
+        return Address(**fields)
+
+    def test_identity_ignores_case_and_spacing(self):
+        """Test spelling variants of one address share an identity."""
+        assert self.make().compute_identity_hash() == self.make(
+            street="  MAIN   street ", city="berlin", country="GERMANY"
+        ).compute_identity_hash()
+        assert self.make().compute_identity_hash() != self.make(street_number="2").compute_identity_hash()
+
+    def test_identity_is_unique(self):
+        """Test saving a second copy of an address is rejected."""
+        self.make().save()
+        with pytest.raises(ValidationError):
+            self.make(city="BERLIN").save()
+
+    def test_edit_into_existing_identity(self):
+        """Test editing an address into another one's identity is a validation error, not a broken transaction."""
+        existing = self.make()
+        existing.save()
+        other = self.make(street_number="2")
+        other.save()
+
+        other.street_number = " 1"
+        with pytest.raises(ValidationError, match=str(existing.pk)):
+            other.full_clean()
+        with pytest.raises(ValidationError):
+            other.save()
+        # The savepoint was rolled back, the surrounding transaction is usable
+        assert Address.objects.get(pk=other.pk).street_number == "2"
+
+    def test_dedupe_keeps_addresses_still_in_use(self, monkeypatch):
+        """Test a duplicate that still has users after repointing is kept rather than cascading."""
+        first, second = Address.objects.bulk_create([self.make(), self.make(city="BERLIN")])
+        user = AppUserFactory(address=second)
+        # As if the user had been pointed at the duplicate after the repointing UPDATE
+        monkeypatch.setattr(AppUser.objects, 'filter', lambda **kwargs: AppUser.objects.none())
+
+        call_command("dedupe_addresses", stdout=StringIO())
+        monkeypatch.undo()
+
+        assert AppUser.objects.get(pk=user.pk).address_id == second.id
+        assert Address.objects.filter(pk=second.pk).exists()
+
+    def test_bulk_get_or_create(self):
+        """Test existing addresses are reused and duplicates in the input share a row."""
+        existing = self.make()
+        existing.save()
+
+        addresses = Address.objects.bulk_get_or_create(
+            [self.make(city="berlin"), self.make(street_number="2"), self.make(street_number=" 2 ")],
+            batch_size=2,
+        )
+
+        assert addresses[0].id == existing.id
+        assert addresses[1].id == addresses[2].id != existing.id
+        assert Address.objects.count() == 2
+
+    def test_dedupe_command_merges_duplicates(self):
+        """Test the command keeps one row per address and repoints its users."""
+        # bulk_create skips save(), like rows written before identity_hash existed
+        first, second, other = Address.objects.bulk_create(
+            [self.make(), self.make(city="BERLIN"), self.make(street_number="2")]
+        )
+        users = [AppUserFactory(address=first), AppUserFactory(address=second), AppUserFactory(address=other)]
+
+        call_command("dedupe_addresses", batch_size=2, stdout=StringIO())
+
+        assert set(Address.objects.values_list("id", flat=True)) == {first.id, other.id}
+        assert not Address.objects.filter(identity_hash__isnull=True).exists()
+        assert [AppUser.objects.get(pk=user.pk).address_id for user in users] == [first.id, first.id, other.id]
+
+    def test_dedupe_dry_run(self):
+        """Test a dry run reports without changing anything."""
+        Address.objects.bulk_create([self.make(), self.make(city="berlin")])
+        out = StringIO()
+
+        call_command("dedupe_addresses", dry_run=True, stdout=out)
+
+        assert "Would merge 1 duplicate" in out.getvalue()
+        assert Address.objects.filter(identity_hash__isnull=True).count() == 2
+
+
 @pytest.mark.django_db
 class TestAppUserModel:
     """Test cases for AppUser model."""
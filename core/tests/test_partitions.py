@@ -0,0 +1,119 @@
+import pytest
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+from core import partitions
+from core.models import CustomerRelationship
+from core.tests.conftest import CustomerRelationshipFactory
+
+postgresql_only = pytest.mark.skipif(
+    connection.vendor != 'postgresql', reason='CustomerRelationship is only partitioned on PostgreSQL'
+)
+
+
+def month(year, number):
+    return datetime(year, number, 1, tzinfo=dt_timezone.utc)
+
+
+class TestPartitionNames:
+    """Test cases for the month arithmetic behind partition names."""
+
+    def test_add_months_crosses_years(self):
+        """Test months are added and subtracted across year boundaries."""
+        assert partitions.add_months(month(2024, 11), 3) == month(2025, 2)
+        assert partitions.add_months(month(2024, 1), -1) == month(2023, 12)
+
+    def test_month_start_uses_utc(self):
+        """Test an aware moment is truncated to its UTC month."""
+        moment = datetime(2024, 3, 1, 0, 30, tzinfo=dt_timezone(timedelta(hours=2)))
+        assert partitions.month_start(moment) == month(2024, 2)
+
+    def test_partition_name_round_trip(self):
+        """Test the month is recovered from a monthly partition name only."""
+        name = partitions.partition_name(month(2024, 7))
+        assert name == 'core_customerrelationship_p202407'
+        assert partitions.partition_month(name) == month(2024, 7)
+        assert partitions.partition_month(partitions.DEFAULT_PARTITION) is None
+
+
+@pytest.mark.django_db
+class TestRelationshipPrefetchWindow:
+    """Test cases for RELATIONSHIP_PREFETCH_WINDOW_DAYS."""
+
+    def test_window_limits_listed_relationships(self, api_client, sample_user, settings):
+        """Test only relationships created inside the window are listed."""
+        CustomerRelationshipFactory(appuser=sample_user, points=1, created=timezone.now() - timedelta(days=2))
+        CustomerRelationshipFactory(appuser=sample_user, points=2, created=timezone.now() - timedelta(days=400))
+        settings.RELATIONSHIP_PREFETCH_WINDOW_DAYS = 30
+
+        response = api_client.get(reverse('appuser-list'))
+
+        relationships = response.json()['results'][0]['relationships']
+        assert [item['points'] for item in relationships] == [1]
+
+    def test_no_window_lists_all_relationships(self, api_client, sample_user):
+        """Test every relationship is listed by default."""
+        CustomerRelationshipFactory(appuser=sample_user, created=timezone.now() - timedelta(days=2))
+        CustomerRelationshipFactory(appuser=sample_user, created=timezone.now() - timedelta(days=400))
+
+        response = api_client.get(reverse('appuser-list'))
+
+        assert len(response.json()['results'][0]['relationships']) == 2
+
+
+@pytest.mark.django_db
+class TestManagePartitionsCommand:
+    """Test cases for the manage_partitions command."""
+
+    @pytest.mark.skipif(connection.vendor == 'postgresql', reason='Checks the non-PostgreSQL error')
+    def test_requires_postgresql(self):
+        """Test the command refuses to run on an unpartitioned database."""
+        with pytest.raises(CommandError):
+            call_command('manage_partitions')
+
+    @postgresql_only
+    def test_creates_partitions_ahead(self):
+        """Test partitions are created up to --months-ahead months from now."""
+        call_command('manage_partitions', '--months-ahead', '6')
+
+        expected = partitions.add_months(partitions.month_start(timezone.now()), 6)
+        assert partitions.partition_name(expected) in partitions.list_partitions(connection)
+
+
+@pytest.mark.django_db
+@postgresql_only
+class TestPartitions:
+    """Test cases for the partitioned CustomerRelationship table."""
+
+    def test_table_is_partitioned(self):
+        """Test the migration partitioned the table with a default partition."""
+        assert partitions.is_partitioned(connection)
+        assert partitions.DEFAULT_PARTITION in partitions.list_partitions(connection)
+
+    def test_create_partition_moves_rows_from_default(self, sample_user):
+        """Test creating a month picks up its rows from the default partition."""
+        relationship = CustomerRelationshipFactory(appuser=sample_user, created=datetime(2001, 1, 15, tzinfo=dt_timezone.utc))
+
+        partitions.create_partition(connection, month(2001, 1))
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT id FROM {partitions.partition_name(month(2001, 1))}')
+            assert cursor.fetchall() == [(relationship.id,)]
+            cursor.execute(f'SELECT count(*) FROM {partitions.DEFAULT_PARTITION}')
+            assert cursor.fetchone()[0] == 0
+        assert CustomerRelationship.objects.get(pk=relationship.pk).appuser_id == sample_user.id
+
+    def test_detach_partitions_before_cutoff(self, sample_user):
+        """Test detaching removes old months' rows from the table but keeps newer ones."""
+        old = CustomerRelationshipFactory(appuser=sample_user, created=datetime(2001, 1, 15, tzinfo=dt_timezone.utc))
+        recent = CustomerRelationshipFactory(appuser=sample_user)
+        partitions.create_partition(connection, month(2001, 1))
+
+        detached = partitions.detach_partitions(connection, month(2001, 2), drop=True)
+
+        assert detached == [partitions.partition_name(month(2001, 1))]
+        assert list(CustomerRelationship.objects.values_list('id', flat=True)) == [recent.id]
+        assert not CustomerRelationship.objects.filter(pk=old.pk).exists()
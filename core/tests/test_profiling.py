@@ -0,0 +1,150 @@
+import json
+import time
+
+import pytest
+from django.core.exceptions import MiddlewareNotUsed
+from django.urls import reverse
+from core import profiling
+
+
+@pytest.fixture
+def profiling_on(settings, tmp_path):
+    """Profile every API request into a temporary directory."""
+    settings.PROFILING_ENABLED = True
+    settings.PROFILING_SAMPLE_RATE = 1.0
+    settings.PROFILING_SLOW_MS = 0
+    settings.PROFILING_SLOW_SAMPLE_RATE = 1.0
+    settings.PROFILING_INTERVAL_MS = 1
+    settings.PROFILING_STORAGE = 'directory'
+    settings.PROFILING_DIR = str(tmp_path)
+    return settings
+
+
+class TestMiddleware:
+    """Test cases for turning the profiling middleware on and off."""
+
+    def test_unused_when_disabled(self, settings):
+        """Test the middleware leaves the stack when disabled or without a rate and threshold."""
+        settings.PROFILING_ENABLED = False
+        with pytest.raises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+
+        settings.PROFILING_ENABLED = True
+        settings.PROFILING_SAMPLE_RATE = 0
+        settings.PROFILING_SLOW_MS = 0
+        with pytest.raises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+
+        settings.PROFILING_SLOW_MS = 500
+        settings.PROFILING_SLOW_SAMPLE_RATE = 0
+        with pytest.raises(MiddlewareNotUsed):
+            profiling.ProfilingMiddleware(lambda request: None)
+
+
+@pytest.mark.django_db
+class TestProfiling:
+    """Test cases for profiling requests."""
+
+    def test_sampled_request_is_saved(self, profiling_on, api_client, multiple_users):
+        """Test a sampled request is saved as a speedscope file with its stacks and queries."""
+        response = api_client.get(reverse('appuser-list'))
+
+        profile_id = response['X-Profile-Id']
+        document = json.loads(profiling.get_storage().load(profile_id))
+        meta = profiling.get_storage().recent(1)[0]
+        assert document['$schema'] == profiling.SPEEDSCOPE_SCHEMA
+        assert [profile['type'] for profile in document['profiles']] == ['sampled', 'evented']
+        assert len(document['profiles'][1]['events']) == 2 * meta['queries']
+        assert (meta['id'], meta['status'], meta['reason']) == (profile_id, 200, 'sampled')
+        assert meta['queries'] > 0
+
+    def test_stacks_are_sampled(self, profiling_on):
+        """Test the sampler records the stack of the recorded thread."""
+        sampler = profiling.get_sampler()
+        recording = sampler.start()
+        time.sleep(0.05)
+        sampler.stop(recording)
+
+        assert recording.samples
+        names = {name for name, _, _ in recording.frames}
+        assert any('test_stacks_are_sampled' in name for name in names)
+
+    def test_slow_threshold(self, profiling_on, api_client, sample_user):
+        """Test with a threshold only slow requests are kept."""
+        profiling_on.PROFILING_SAMPLE_RATE = 0
+        profiling_on.PROFILING_SLOW_MS = 60_000
+        assert 'X-Profile-Id' not in api_client.get(reverse('appuser-list'))
+
+        profiling_on.PROFILING_SLOW_MS = 0.001
+        response = api_client.get(reverse('appuser-list'))
+        assert profiling.get_storage().recent(10)[0]['reason'] == 'slow'
+        assert response['X-Profile-Id']
+
+    def test_slow_threshold_watches_a_fraction(self, profiling_on, api_client, sample_user, monkeypatch):
+        """Test requests outside the watched fraction are not instrumented, however slow."""
+        profiling_on.PROFILING_SAMPLE_RATE = 0
+        profiling_on.PROFILING_SLOW_MS = 0.001
+        profiling_on.PROFILING_SLOW_SAMPLE_RATE = 0.5
+        started = []
+        original = profiling.Sampler.start
+        monkeypatch.setattr(profiling.Sampler, 'start', lambda self: started.append(1) or original(self))
+
+        monkeypatch.setattr(profiling.random, 'random', lambda: 0.75)
+        assert 'X-Profile-Id' not in api_client.get(reverse('appuser-list'))
+        assert started == []
+
+        monkeypatch.setattr(profiling.random, 'random', lambda: 0.25)
+        assert api_client.get(reverse('appuser-list'))['X-Profile-Id']
+        assert started == [1]
+
+    def test_other_paths_are_not_profiled(self, profiling_on, client):
+        """Test requests outside the path prefix are passed through."""
+        response = client.get('/not-api/')
+
+        assert 'X-Profile-Id' not in response
+        assert profiling.get_storage().recent(10) == []
+
+    def test_directory_keeps_most_recent(self, profiling_on, api_client):
+        """Test the directory storage trims to the configured number of profiles."""
+        profiling_on.PROFILING_MAX_PROFILES = 2
+        ids = [api_client.get(reverse('appuser-list'))['X-Profile-Id'] for _ in range(3)]
+
+        storage = profiling.get_storage()
+        assert len(storage.recent(10)) == 2
+        assert storage.load(ids[0]) is None
+        assert storage.load(ids[-1]) is not None
+
+    def test_redis_storage(self, profiling_on, api_client, sample_user):
+        """Test profiles are stored in and listed from Redis."""
+        profiling_on.PROFILING_STORAGE = 'redis'
+        profile_id = api_client.get(reverse('appuser-list'))['X-Profile-Id']
+
+        storage = profiling.get_storage()
+        assert isinstance(storage, profiling.RedisStorage)
+        assert [meta['id'] for meta in storage.recent(10)] == [profile_id]
+        assert json.loads(storage.load(profile_id))['name'].startswith('GET /api/v1/appusers/')
+
+
+@pytest.mark.django_db
+class TestProfileEndpoints:
+    """Test cases for the profile list and download endpoints."""
+
+    def test_list_and_download(self, profiling_on, admin_client, sample_user):
+        """Test admins list recent profiles and download them as speedscope files."""
+        profile_id = admin_client.get(reverse('appuser-list'))['X-Profile-Id']
+
+        listed = admin_client.get(reverse('profile-list')).json()['results']
+        response = admin_client.get(reverse('profile-download', args=[profile_id]))
+        assert profile_id in [meta['id'] for meta in listed]
+        assert response.status_code == 200
+        assert 'attachment' in response['Content-Disposition']
+        assert json.loads(response.content)['$schema'] == profiling.SPEEDSCOPE_SCHEMA
+
+    def test_unknown_profile(self, profiling_on, admin_client):
+        """Test unknown and malformed profile ids are not found."""
+        assert admin_client.get(reverse('profile-download', args=['0' * 32])).status_code == 404
+        assert admin_client.get(reverse('profile-download', args=['..'])).status_code == 404
+
+    def test_admin_only(self, api_client):
+        """Test the endpoints require a staff user."""
+        assert api_client.get(reverse('profile-list')).status_code in (401, 403)
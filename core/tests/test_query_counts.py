@@ -0,0 +1,107 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+from core import autocomplete
+from core.tests.query_counts import assert_no_n_plus_one, normalize_sql, record_queries
+from core.tests.seeding import rolled_back, seed
+from core.views import AppUserQueryMixin
+
+
+@pytest.fixture(scope='class')
+def users_with_relationships(django_db_setup, django_db_blocker):
+    """20 users with two relationships each, shared by the tests of a class."""
+    with rolled_back(django_db_blocker, seed, 20) as users:
+        yield users
+
+
+@pytest.fixture
+def feed_settings(settings):
+    settings.CHANGES_SETTLE_SECONDS = 0
+    return settings
+
+
+class TestQueryRecord:
+    """Test cases for the query recording helpers."""
+
+    def test_normalize_sql(self):
+        """Test statements differing only in literals normalize to the same text."""
+        first = normalize_sql("SELECT * FROM t WHERE id IN (1, 2, 3) AND name = 'a''b' LIMIT 10")
+        second = normalize_sql("SELECT * FROM t WHERE id IN (7) AND name = 'c' LIMIT 20")
+
+        assert first == second == "SELECT * FROM t WHERE id IN (...) AND name = ? LIMIT ?"
+
+    @pytest.mark.django_db
+    def test_detects_prefetch_removal(self, api_client, users_with_relationships, monkeypatch):
+        """Test dropping the relationship Prefetch is caught as an N+1."""
+        original = AppUserQueryMixin.get_base_queryset
+        monkeypatch.setattr(
+            AppUserQueryMixin, 'get_base_queryset', lambda self, prefetch=True: original(self, prefetch=False)
+        )
+
+        with pytest.raises(AssertionError, match='grows with the size'):
+            assert_no_n_plus_one(lambda size: api_client.get(reverse('appuser-list'), {'page_size': size}))
+        _, record = record_queries(api_client.get, reverse('appuser-list'), {'page_size': 20, 'ordering': 'id'})
+        assert record.repeated()
+
+
+@pytest.mark.django_db
+class TestQueryBudgets:
+    """Test cases for the number of queries per endpoint."""
+
+    def test_list(self, api_client, query_budget, users_with_relationships):
+        """Test a list page costs a COUNT, the page and one prefetch, whatever its size."""
+        url = reverse('appuser-list')
+        query_budget('appuser-list', api_client.get, url)
+        assert_no_n_plus_one(lambda size: api_client.get(url, {'page_size': size}))
+
+    def test_list_filtered(self, api_client, query_budget, users_with_relationships):
+        """Test filters through the address and relationships add no queries."""
+        url = reverse('appuser-list')
+        params = {'country': 'a', 'points_min': 1, 'ordering': 'id'}
+        query_budget('appuser-list-filtered', api_client.get, url, params)
+        assert_no_n_plus_one(lambda size: api_client.get(url, {**params, 'page_size': size}))
+
+    def test_list_cache_hit(self, api_client, users_with_relationships):
+        """Test a cached page runs no query at all."""
+        url = reverse('appuser-list')
+        api_client.get(url)
+
+        _, record = record_queries(api_client.get, url)
+
+        assert record.count == 0, str(record)
+
+    def test_list_async(self, query_budget, users_with_relationships):
+        """Test the async list view issues the same queries as the sync one."""
+        client = AsyncClient()
+        url = reverse('appuser-list-async')
+        query_budget('appuser-list-async', async_to_sync(client.get), url)
+        assert_no_n_plus_one(lambda size: async_to_sync(client.get)(url, {'page_size': size}))
+
+    def test_lookup(self, api_client, query_budget, users_with_relationships):
+        """Test a batch lookup is one IN query plus one prefetch, whatever the number of ids."""
+        url = reverse('appuser-lookup')
+        ids = [user.id for user in users_with_relationships]
+        query_budget('appuser-lookup', api_client.post, url, {'ids': ids}, format='json')
+        assert_no_n_plus_one(lambda size: api_client.post(url, {'ids': ids[:size]}, format='json'))
+
+    def test_changes(self, api_client, query_budget, feed_settings, users_with_relationships):
+        """Test a change feed page does not query per event."""
+        url = reverse('appuser-changes')
+        query_budget('appuser-changes', api_client.get, url, {'limit': 20})
+        assert_no_n_plus_one(lambda size: api_client.get(url, {'limit': size}))
+
+    def test_analytics(self, api_client, query_budget, users_with_relationships):
+        """Test live grouped counts are one aggregate query."""
+        query_budget('appuser-analytics', api_client.get, reverse('appuser-analytics'),
+                     {'group_by': 'country', 'country': 'a'})
+
+    def test_autocomplete(self, api_client, query_budget, users_with_relationships):
+        """Test a suggestion is one query for prefix matches and one for typos, once the index is built."""
+        url = reverse('appuser-autocomplete')
+        autocomplete.index.refresh(wait=True)
+        query_budget('appuser-autocomplete', api_client.get, url, {'q': 'anna meier'})
+
+    def test_segment(self, api_client, query_budget, users_with_relationships):
+        """Test sizing a segment from the database is a count and one page of ids."""
+        query_budget('appuser-segment', api_client.get, reverse('appuser-segment'), {'gender': 'Other'})
@@ -0,0 +1,135 @@
+import difflib
+import json
+import os
+from io import StringIO
+from pathlib import Path
+
+import pytest
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from core import query_plans
+from core.tests.seeding import rolled_back
+
+postgresql_only = pytest.mark.skipif(
+    not query_plans.is_available(), reason='Query plans are checked on PostgreSQL only'
+)
+
+SEED_USERS = 20000
+BASELINES_DIR = Path(__file__).parent / 'query_plans'
+# Set to re-record the baselines after an intended plan change
+UPDATE_BASELINES = os.getenv('UPDATE_PLAN_BASELINES') == '1'
+
+# Each table is analyzed before the next is inserted: the foreign keys are
+# checked as rows go in (see core/tests/seeding.py), by plans that would
+# otherwise assume the referenced table is still empty
+SEED_SQL = """
+INSERT INTO core_address (street, street_number, city_code, city, country, identity_hash)
+SELECT 'Street ' || (g % 500), (g % 200)::text, lpad((g % 1000)::text, 5, '0'), 'City ' || (g % 300),
+       (ARRAY['Germany', 'France', 'Spain', 'Italy', 'Poland'])[1 + g % 5], 'plan' || lpad(g::text, 60, '0')
+FROM generate_series(1, {addresses}) AS g;
+ANALYZE core_address;
+
+INSERT INTO core_appuser (first_name, last_name, gender, customer_id, phone_number, created, address_id,
+                          birthday, last_updated)
+SELECT 'First' || (g % 700), 'Last' || (g % 900),
+       (ARRAY['Male', 'Female', 'Other', 'Prefer not to say'])[1 + g % 4], 'PLAN' || lpad(g::text, 8, '0'),
+       '+49' || g, now() - (g % 730) * interval '1 day' - g * interval '1 second',
+       (SELECT min(id) FROM core_address WHERE identity_hash LIKE 'plan%') + g % {addresses},
+       date '1950-01-01' + (g * 7) % 20000, now() - (g % 1000) * interval '1 hour'
+FROM generate_series(1, {users}) AS g;
+ANALYZE core_appuser;
+
+INSERT INTO core_customerrelationship (appuser_id, points, created, last_activity)
+SELECT u.id, (u.id * 37 + k * 11) % 1000, u.created + k * interval '1 hour', u.created + k * interval '1 day'
+FROM core_appuser u CROSS JOIN generate_series(1, 2) AS k
+WHERE u.customer_id LIKE 'PLAN%';
+ANALYZE core_customerrelationship;
+"""
+
+
+@pytest.fixture(scope='module')
+def plan_dataset(django_db_setup, django_db_blocker):
+    """A medium dataset with fresh statistics, shared by the module and rolled back afterwards."""
+    # ANALYZE is transactional too: the statistics are rolled back with the rows
+    with rolled_back(django_db_blocker, seed_plan_dataset):
+        yield
+
+
+def seed_plan_dataset():
+    with connection.cursor() as cursor:
+        cursor.execute(SEED_SQL.format(users=SEED_USERS, addresses=SEED_USERS // 2))
+
+
+@pytest.fixture(scope='module')
+def baselines():
+    """
+    Stored plan summaries of this PostgreSQL major version. They are only
+    written back with UPDATE_PLAN_BASELINES=1 (run without -n, the workers
+    would race on the file).
+    """
+    path = BASELINES_DIR / f'postgresql-{connection.pg_version // 10000}.json'
+    stored = json.loads(path.read_text()) if path.exists() else {}
+    recorded = dict(stored)
+    yield recorded
+    if UPDATE_BASELINES and recorded != stored:
+        BASELINES_DIR.mkdir(exist_ok=True)
+        path.write_text(json.dumps(recorded, indent=2, sort_keys=True) + '\n')
+
+
+@postgresql_only
+@pytest.mark.django_db
+class TestQueryPlans:
+    """Test cases for the plans of the list endpoint's page queries."""
+
+    @pytest.mark.parametrize('case', query_plans.CATALOGUE, ids=lambda case: case.name)
+    def test_plan(self, case, plan_dataset, baselines):
+        """Test the plan uses the expected index, estimates rows sensibly and matches its baseline."""
+        plan, problems = query_plans.check(case)
+        summary = query_plans.summarize(plan)
+
+        assert not problems, '\n'.join([*problems, *summary])
+        if UPDATE_BASELINES:
+            baselines[case.name] = summary
+            return
+        assert case.name in baselines, f'No plan baseline for {case.name} (UPDATE_PLAN_BASELINES=1 to record it)'
+        diff = '\n'.join(difflib.unified_diff(baselines[case.name], summary, 'baseline', 'current', lineterm=''))
+        assert not diff, f'Plan of {case.name} changed (UPDATE_PLAN_BASELINES=1 to accept):\n{diff}'
+
+
+class TestSummary:
+    """Test cases for plan summaries."""
+
+    def test_partitions_are_normalized_and_collapsed(self):
+        """Test partitions under an Append summarize to one line, whatever the month."""
+        plan = {'Node Type': 'Append', 'Plans': [
+            {'Node Type': 'Index Scan', 'Relation Name': f'core_customerrelationship_{suffix}',
+             'Index Name': f'core_customerrelationship_{suffix}_points_idx'}
+            for suffix in ('p202609', 'p202610', 'default')
+        ]}
+
+        assert query_plans.summarize(plan) == [
+            'Append',
+            '  Index Scan on core_customerrelationship_<partition> using core_customerrelationship_<partition>_points_idx',
+        ]
+
+
+@postgresql_only
+@pytest.mark.django_db
+class TestExplainQueriesCommand:
+    """Test cases for the explain_queries command."""
+
+    def test_prints_plans_and_timings(self, plan_dataset):
+        """Test the selected cases are explained and analyzed."""
+        out = StringIO()
+        call_command('explain_queries', '--case', 'default', '--analyze', stdout=out)
+
+        output = out.getvalue()
+        assert 'Index Scan on core_appuser' in output
+        assert 'execution' in output
+        assert '1 of 1 plans as expected' in output
+
+    def test_unknown_case(self, plan_dataset):
+        """Test unknown case names are rejected."""
+        with pytest.raises(CommandError):
+            call_command('explain_queries', '--case', 'nope')
@@ -0,0 +1,51 @@
+import pytest
+from django.urls import reverse
+from core.models import Address, AppUser, CustomerRelationship
+from core.tests import seeding
+
+
+@pytest.mark.django_db
+class TestSeeding:
+    """Test cases for the bulk seeded, class shared test data."""
+
+    def test_seeded_rows(self, seeded_users):
+        """Test every table is seeded with the requested volume and deterministic values."""
+        assert AppUser.objects.count() == len(seeded_users) == 1000
+        assert Address.objects.count() == 1000
+        assert CustomerRelationship.objects.count() == 2000
+        assert seeded_users[0].customer_id == 'SEED00000000'
+        assert seeded_users[0].address.identity_hash == seeded_users[0].address.compute_identity_hash()
+
+    def test_writes_are_undone_between_tests(self, seeded_users):
+        """Test a test's writes are rolled back while the seeded rows stay."""
+        AppUser.objects.filter(gender='Male').delete()
+        assert AppUser.objects.count() == 750
+
+    def test_rows_are_shared(self, seeded_users):
+        """Test the next test of the class sees the seeded rows unchanged."""
+        assert AppUser.objects.count() == 1000
+
+    def test_list_endpoint_pages(self, api_client, seeded_users):
+        """Test the list endpoint pages through the seeded volume."""
+        data = api_client.get(reverse('appuser-list'), {'page': 3, 'ordering': 'id'}).json()
+
+        assert data['count'] == 1000
+        assert data['results'][0]['id'] == seeded_users[2 * len(data['results'])].id
+
+
+@pytest.mark.django_db
+class TestRolledBack:
+    """Test cases for data seeded outside the tests of a class."""
+
+    def test_seeded_rows_are_gone(self):
+        """Test rows seeded for another class were rolled back."""
+        assert not AppUser.objects.filter(customer_id__startswith='SEED').exists()
+
+    def test_same_values_every_run(self, django_db_blocker):
+        """Test seeding twice produces the same rows."""
+        values = []
+        for _ in range(2):
+            with seeding.rolled_back(django_db_blocker, seeding.seed, 5, random_seed=7) as users:
+                values.append([(user.first_name, user.birthday, user.phone_number) for user in users])
+
+        assert values[0] == values[1]
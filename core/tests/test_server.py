@@ -0,0 +1,41 @@
+import pytest
+from config.server import autotune_threads, autotune_workers, resolve_worker_class
+
+
+class TestServerAutotune:
+    """Test cases for the production server sizing helpers."""
+
+    def test_sync_workers(self):
+        """Test sync workers follow 2 * cpus + 1."""
+        assert autotune_workers('sync', cpus=4) == 9
+
+    def test_gthread_workers_and_threads(self):
+        """Test gthread uses fewer processes with several threads each."""
+        assert autotune_workers('gthread', cpus=4) == 5
+        assert autotune_threads('gthread') == 4
+        assert autotune_threads('gthread', configured=8) == 8
+
+    def test_uvicorn_workers(self):
+        """Test uvicorn runs one event loop per CPU."""
+        assert autotune_workers('uvicorn', cpus=4) == 4
+        assert autotune_threads('uvicorn', configured=8) == 1
+
+    def test_configured_workers_win(self):
+        """Test an explicit worker count overrides autotuning."""
+        assert autotune_workers('sync', cpus=4, configured=3) == 3
+
+    def test_workers_are_capped(self):
+        """Test the cap bounds the worker count."""
+        assert autotune_workers('sync', cpus=32, cap=16) == 16
+
+    def test_worker_class_entry_points(self):
+        """Test each worker class serves the matching application."""
+        assert resolve_worker_class('sync') == ('sync', 'config.wsgi:application')
+        assert resolve_worker_class('uvicorn') == (
+            'uvicorn_worker.UvicornWorker', 'config.asgi:application'
+        )
+
+    def test_unknown_worker_class(self):
+        """Test unknown worker classes are rejected."""
+        with pytest.raises(ValueError):
+            autotune_workers('eventlet', cpus=4)
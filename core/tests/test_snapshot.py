@@ -0,0 +1,105 @@
+import pytest
+from datetime import date, timedelta
+from django.urls import reverse
+from django.utils import timezone
+from core.filters import build_appuser_filters
+from core.models import AppUser
+from core.snapshot import build_snapshot, current_snapshot, segment
+from core.tests.conftest import AddressFactory, AppUserFactory, CustomerRelationshipFactory
+
+np = pytest.importorskip('numpy')
+
+
+@pytest.fixture
+def snapshot_dir(settings, tmp_path):
+    settings.SNAPSHOT_DIR = str(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def segment_users():
+    """Users spread over countries, genders, birthdays and points."""
+    germany = AddressFactory(country='Germany', city='Berlin')
+    france = AddressFactory(country='France', city='Paris')
+    now = timezone.now()
+    users = [
+        AppUserFactory(first_name='Anna', gender='Female', address=germany, birthday=date(1990, 5, 15)),
+        AppUserFactory(first_name='Hannah', gender='Female', address=france, birthday=None),
+        AppUserFactory(first_name='Bob', gender='Male', address=germany, birthday=date(1985, 1, 1)),
+    ]
+    CustomerRelationshipFactory(appuser=users[0], points=6000, last_activity=now - timedelta(days=3))
+    CustomerRelationshipFactory(appuser=users[0], points=100, last_activity=now - timedelta(days=90))
+    CustomerRelationshipFactory(appuser=users[1], points=7000, last_activity=None)
+    CustomerRelationshipFactory(appuser=users[2], points=200, last_activity=now - timedelta(days=1))
+    return users
+
+
+def database_ids(params):
+    return sorted(AppUser.objects.filter(build_appuser_filters(params)).distinct().values_list('id', flat=True))
+
+
+@pytest.mark.django_db
+class TestSnapshot:
+    """Test cases for the columnar snapshot engine."""
+
+    @pytest.mark.parametrize('params', [
+        {},
+        {'country': 'germ'},
+        {'first_name': 'ANN'},
+        {'gender': 'Female'},
+        {'gender': 'female'},
+        {'birthday': '1990-05-15'},
+        {'points_min': '5000'},
+        {'points_min': '5000', 'last_activity_after': (date.today() - timedelta(days=30)).isoformat()},
+        {'points_max': '500', 'city': 'Berlin'},
+        {'points_min': 'not-a-number'},
+    ])
+    def test_matches_database(self, snapshot_dir, segment_users, params):
+        """Test snapshot masks select the same users as the ORM filters."""
+        build_snapshot()
+        count, ids = current_snapshot().query(params, limit=100)
+        assert ids == database_ids(params)
+        assert count == len(ids)
+
+    def test_unsupported_filters_fall_back(self, snapshot_dir, segment_users):
+        """Test filters the snapshot cannot answer are sent to the database."""
+        build_snapshot()
+        user = segment_users[0]
+
+        assert current_snapshot().query({'customer_id': user.customer_id}, limit=10) is None
+        result = segment({'customer_id': user.customer_id}, limit=10)
+        assert result['source'] == 'database'
+        assert result['ids'] == [user.id]
+        assert current_snapshot().query({'gender': 'Male', 'age_max': '40'}, limit=10) is None
+        assert current_snapshot().query({'anniversary_from': '12-28'}, limit=10) is None
+
+    def test_stale_snapshot_falls_back(self, settings, snapshot_dir, segment_users):
+        """Test a snapshot older than SNAPSHOT_MAX_AGE is not used."""
+        build_snapshot()
+        assert segment({}, limit=10)['source'] == 'snapshot'
+
+        settings.SNAPSHOT_MAX_AGE = -1
+        assert segment({}, limit=10)['source'] == 'database'
+
+    def test_new_snapshot_is_picked_up(self, snapshot_dir, segment_users):
+        """Test readers switch to a newly published snapshot."""
+        build_snapshot()
+        first = current_snapshot()
+        AppUserFactory()
+        build_snapshot()
+
+        assert current_snapshot() is not first
+        assert current_snapshot().query({}, limit=10)[0] == 4
+
+    def test_segment_endpoint(self, api_client, snapshot_dir, segment_users):
+        """Test the endpoint reports count, ids and the source used."""
+        url = reverse('appuser-segment')
+        data = api_client.get(url, {'country': 'germany'}).json()
+        assert data['meta']['source'] == 'database'
+        assert data['count'] == 2
+
+        build_snapshot()
+        data = api_client.get(url, {'country': 'germany', 'limit': 1}).json()
+        assert data['meta']['source'] == 'snapshot'
+        assert data['count'] == 2
+        assert data['ids'] == [segment_users[0].id]
@@ -0,0 +1,92 @@
+import os
+import sys
+from io import StringIO
+
+import pytest
+from django.core.management import call_command
+from common.imports import lazy_import
+from core import startup
+
+# Import times are wall-clock: only meaningful on a quiet machine, not under pytest -n
+CHECK_BUDGETS = os.getenv('CHECK_IMPORT_BUDGETS') == '1'
+
+REPORT = """\
+import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:       300 |        420 | site
+import time:        50 |         50 |     numpy.core
+import time:       900 |        950 |   numpy
+import time:       200 |       1150 | core.snapshot
+"""
+
+
+class TestReport:
+    """Test cases for parsing -X importtime reports."""
+
+    def test_parse(self):
+        """Test modules, their times and the total of the top level imports."""
+        report = startup.parse(REPORT)
+
+        assert report.modules['numpy'] == (900, 950)
+        assert report.total == 420 + 1150
+        assert report.imported('numpy') and not report.imported('num')
+        assert report.slowest(2) == [('numpy', 900), ('site', 300)]
+
+    def test_check(self):
+        """Test heavy modules and totals over the budget are reported."""
+        report = startup.parse(REPORT)
+        report.total = (startup.IMPORT_BUDGETS['web'] + 1) * 1000
+
+        assert startup.check(report, 'web') == [
+            'imports numpy at startup',
+            f"imports take {startup.IMPORT_BUDGETS['web'] + 1} ms, budget {startup.IMPORT_BUDGETS['web']} ms",
+        ]
+        assert startup.check(report, 'web', timed=False) == ['imports numpy at startup']
+
+
+class TestLazyImport:
+    """Test cases for lazily imported optional dependencies."""
+
+    def test_missing_module(self):
+        """Test a module that is not installed is None, like a failed optional import."""
+        assert lazy_import('not_an_installed_module') is None
+
+    def test_loaded_on_first_use(self, monkeypatch):
+        """Test the module body only runs on first attribute access."""
+        monkeypatch.delitem(sys.modules, 'colorsys', raising=False)
+        module = lazy_import('colorsys')
+
+        # Plain attribute access would load it
+        assert 'rgb_to_hsv' not in object.__getattribute__(module, '__dict__')
+        assert module.rgb_to_hsv(1, 0, 0) == (0, 1, 1)
+
+
+class TestStartup:
+    """Test cases for the import time budgets of starting processes."""
+
+    @pytest.mark.parametrize('target', startup.TARGETS)
+    def test_no_heavy_modules(self, target):
+        """Test each kind of process starts without importing the heavy modules."""
+        report = startup.measure(target)
+
+        assert not startup.check(report, target, timed=False)
+
+    @pytest.mark.skipif(not CHECK_BUDGETS, reason='CHECK_IMPORT_BUDGETS=1 checks the import time budgets')
+    @pytest.mark.parametrize('target', startup.TARGETS)
+    def test_within_budget(self, target):
+        """Test each kind of process starts within its import budget."""
+        # Noise only adds time: the fastest of two starts is the steadiest measure
+        report = min((startup.measure(target) for _ in range(2)), key=lambda report: report.total)
+
+        assert not startup.check(report, target), '\n'.join(
+            f'{own / 1000:.1f} ms {name}' for name, own in report.slowest(15)
+        )
+
+    def test_benchmark_command(self):
+        """Test the command reports every requested target."""
+        out = StringIO()
+        call_command('benchmark_startup', '--target', 'command', '--repeat', '1', '--top', '3', stdout=out)
+
+        output = out.getvalue()
+        assert output.startswith('command:')
+        assert 'of 1 targets within budget' in output
@@ -0,0 +1,186 @@
+from io import StringIO
+
+import pytest
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.http import QueryDict
+from django.test import AsyncClient
+from django.urls import reverse
+from core import throttling
+
+
+@pytest.fixture
+def tight_throttle(settings):
+    """A bucket of 10 tokens that practically does not refill."""
+    settings.THROTTLE_ENABLED = True
+    settings.THROTTLE_BURST = 10
+    settings.THROTTLE_RATE = 0.01
+    settings.THROTTLE_CACHE_HIT_COST = 1
+    return settings
+
+
+class TestRequestCost:
+    """Test cases for the estimated cost of list requests."""
+
+    @pytest.mark.parametrize('query, cost', [
+        ('', 1),
+        ('page_size=1000', 10),
+        ('page_size=5000', 10),  # capped at the maximum page size
+        ('page_size=100&page=501', 6),  # OFFSET 50,000
+        ('first_name=an&city=ber', 5),
+        ('points_min=100', 6),
+        ('page=x&page_size=-3', 1),
+    ])
+    def test_list_request_cost(self, query, cost):
+        """Test wide pages, deep pages and expensive filters cost more."""
+        assert throttling.list_request_cost(QueryDict(query)) == cost
+
+
+@pytest.mark.django_db
+class TestThrottle:
+    """Test cases for the cost-weighted throttle of the list endpoint."""
+
+    def test_expensive_requests_exhaust_the_bucket(self, api_client, tight_throttle, multiple_users):
+        """Test uncached requests are rejected with Retry-After once their cost exceeds the bucket."""
+        url = reverse('appuser-list')
+
+        assert api_client.get(url, {'page_size': 500, 'ordering': 'id'}).status_code == 200
+        assert api_client.get(url, {'page_size': 500, 'ordering': '-id'}).status_code == 200
+        response = api_client.get(url, {'page_size': 500, 'ordering': 'created'})
+
+        assert response.status_code == 429
+        assert int(response['Retry-After']) >= 1
+
+    def test_cache_hits_are_cheap(self, api_client, tight_throttle, multiple_users):
+        """Test a cached page is charged the cache hit cost instead of its full cost."""
+        url = reverse('appuser-list')
+        assert api_client.get(url, {'page_size': 500}).status_code == 200  # 5 tokens
+
+        statuses = [api_client.get(url, {'page_size': 500}).status_code for _ in range(5)]
+
+        assert statuses == [200] * 5
+        assert api_client.get(url, {'page_size': 500, 'ordering': 'id'}).status_code == 429
+
+    def test_clients_have_separate_buckets(self, api_client, tight_throttle, multiple_users):
+        """Test one client's usage does not limit another."""
+        url = reverse('appuser-list')
+        api_client.get(url, {'page_size': 1000})
+
+        assert api_client.get(url, {'ordering': 'id'}).status_code == 429
+        assert api_client.get(url, {'ordering': 'id'}, REMOTE_ADDR='10.0.0.2').status_code == 200
+
+    def test_async_list_is_throttled(self, api_client, tight_throttle, multiple_users):
+        """Test the async list endpoint takes tokens from the same bucket as the sync one."""
+        get = async_to_sync(AsyncClient().get)
+        url = reverse('appuser-list-async')
+
+        assert get(url, {'page_size': 500, 'ordering': 'id'}).status_code == 200
+        assert get(url, {'page_size': 500, 'ordering': '-id'}).status_code == 200
+        response = get(url, {'page_size': 500, 'ordering': 'created'})
+
+        assert response.status_code == 429
+        assert int(response['Retry-After']) >= 1
+        assert 'throttled' in response.json()['detail']
+        assert api_client.get(reverse('appuser-list'), {'ordering': 'id'}).status_code == 429
+
+    def test_forwarded_for_needs_trusted_proxies(self, api_client, tight_throttle, multiple_users):
+        """Test X-Forwarded-For only tells clients apart when NUM_PROXIES trusts the proxy adding it."""
+        url = reverse('appuser-list')
+        api_client.get(url, {'page_size': 1000}, HTTP_X_FORWARDED_FOR='10.0.0.2')
+
+        assert api_client.get(url, {'ordering': 'id'}, HTTP_X_FORWARDED_FOR='10.0.0.3').status_code == 429
+
+        tight_throttle.REST_FRAMEWORK = {**tight_throttle.REST_FRAMEWORK, 'NUM_PROXIES': 1}
+        assert api_client.get(url, {'ordering': 'id'}, HTTP_X_FORWARDED_FOR='10.0.0.3').status_code == 200
+        # The proxy appends the address it saw; what the client sent before it is not trusted
+        response = api_client.get(url, {'page_size': 1000, 'ordering': 'created'}, HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.3')
+        assert response.status_code == 429
+
+    def test_disabled(self, api_client, tight_throttle, multiple_users):
+        """Test nothing is limited with THROTTLE_ENABLED off."""
+        tight_throttle.THROTTLE_ENABLED = False
+        url = reverse('appuser-list')
+
+        statuses = {api_client.get(url, {'page_size': 1000, 'ordering': order}).status_code
+                    for order in ('id', '-id', 'created')}
+
+        assert statuses == {200}
+
+
+@pytest.mark.django_db
+class TestConcurrencyCap:
+    """Test cases for the per-client limit on requests in flight."""
+
+    @pytest.fixture(autouse=True)
+    def enabled(self, settings):
+        settings.THROTTLE_ENABLED = True
+
+    def test_rejects_beyond_the_cap(self, api_client, settings, multiple_users):
+        """Test a client holding all its slots gets a 429 until one is released."""
+        settings.THROTTLE_MAX_CONCURRENT = 2
+        held = [throttling.acquire_slot('127.0.0.1') for _ in range(2)]
+        url = reverse('appuser-list')
+
+        response = api_client.get(url)
+        assert response.status_code == 429
+        assert response['Retry-After'] == '1'
+
+        throttling.release_slot('127.0.0.1', held[0])
+        assert api_client.get(url).status_code == 200
+
+    def test_slots_are_released_with_the_response(self, api_client, settings, multiple_users):
+        """Test sequential requests never accumulate slots, errors included."""
+        settings.THROTTLE_MAX_CONCURRENT = 1
+        url = reverse('appuser-list')
+
+        statuses = [api_client.get(url, {'page': page}).status_code for page in (1, 99, 1)]
+
+        assert statuses == [200, 404, 200]
+
+    def test_async_slots(self, settings, multiple_users):
+        """Test the async list endpoint honours the cap and releases its slot, errors included."""
+        settings.THROTTLE_MAX_CONCURRENT = 1
+        get = async_to_sync(AsyncClient().get)
+        url = reverse('appuser-list-async')
+
+        assert [get(url, {'page': page}).status_code for page in (1, 99, 1)] == [200, 404, 200]
+
+        held = throttling.acquire_slot('127.0.0.1')
+        response = get(url, {'ordering': 'id'})
+        assert response.status_code == 429
+        assert response['Retry-After'] == '1'
+        throttling.release_slot('127.0.0.1', held)
+
+    def test_stale_slots_expire(self, settings):
+        """Test slots older than THROTTLE_SLOT_TTL no longer count."""
+        settings.THROTTLE_MAX_CONCURRENT = 1
+        settings.THROTTLE_SLOT_TTL = 0
+
+        assert throttling.acquire_slot('client') is not None
+        assert throttling.acquire_slot('client') is not None
+
+
+@pytest.mark.django_db(transaction=True)
+class TestLoadtest:
+    """Test cases for how the loadtest command reports rate limited requests."""
+
+    def test_fails_when_rate_limited(self, live_server, tight_throttle):
+        """Test 429s are counted apart from errors and fail the run."""
+        url = f"{live_server.url}{reverse('appuser-list')}?page_size=1000"
+        out = StringIO()
+
+        with pytest.raises(CommandError, match='THROTTLE_ENABLED=0'):
+            call_command('loadtest', '--url', url, '--requests', '3', '--concurrency', '1', stdout=out)
+
+        assert 'errors 0, rate limited 2' in out.getvalue()
+
+    def test_passes_without_limits(self, live_server, tight_throttle):
+        """Test a run that was never limited succeeds."""
+        tight_throttle.THROTTLE_ENABLED = False
+        url = f"{live_server.url}{reverse('appuser-list')}?page_size=1000"
+        out = StringIO()
+
+        call_command('loadtest', '--url', url, '--requests', '3', '--concurrency', '1', stdout=out)
+
+        assert 'errors 0, rate limited 0' in out.getvalue()
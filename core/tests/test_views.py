@@ -0,0 +1,193 @@
+import pytest
+from asgiref.sync import async_to_sync
+from django.test import AsyncClient
+from django.urls import reverse
+from core.cache import clear_local
+from core.tests.conftest import clear_redis
+
+
+@pytest.mark.django_db
+class TestAppUserAsyncListView:
+    """Test cases for the async AppUser list endpoint."""
+
+    def get(self, url, **params):
+        return async_to_sync(AsyncClient().get)(url, params)
+
+    def test_matches_sync_view(self, api_client, shared_users):
+        """Test the async endpoint returns the same page as the sync one."""
+        sync_data = api_client.get(reverse('appuser-list'), {'page_size': 3}).json()
+        async_data = self.get(reverse('appuser-list-async'), page_size=3).json()
+
+        assert async_data['count'] == sync_data['count'] == 5
+        assert async_data['pages'] == sync_data['pages'] == 2
+        assert async_data['results'] == sync_data['results']
+        assert len(async_data['results'][0]['relationships']) == 1
+
+    def test_filters_and_ordering(self, shared_users):
+        """Test filters and ordering are applied like the sync view."""
+        user = shared_users[0]
+        data = self.get(reverse('appuser-list-async'), customer_id=user.customer_id).json()
+        assert [row['id'] for row in data['results']] == [user.id]
+
+        data = self.get(reverse('appuser-list-async'), ordering='id').json()
+        ids = [row['id'] for row in data['results']]
+        assert ids == sorted(ids)
+
+    def test_cache_hit(self, shared_users):
+        """Test the second identical request is served from the cache."""
+        first = self.get(reverse('appuser-list-async')).json()
+        second = self.get(reverse('appuser-list-async')).json()
+
+        assert first['meta']['cache_hit'] is False
+        assert second['meta']['cache_hit'] is True
+        assert second['results'] == first['results']
+
+    def test_invalid_page(self, shared_users):
+        """Test out-of-range and malformed pages return 404."""
+        assert self.get(reverse('appuser-list-async'), page=99).status_code == 404
+        assert self.get(reverse('appuser-list-async'), page='abc').status_code == 404
+        assert self.get(reverse('appuser-list-async'), page='last').status_code == 200
+
+
+@pytest.mark.django_db
+class TestAppUserLookupView:
+    """Test cases for the batch lookup endpoint."""
+
+    def post(self, api_client, payload):
+        return api_client.post(reverse('appuser-lookup'), payload, format='json')
+
+    def test_lookup_by_customer_ids(self, api_client, shared_users):
+        """Test users are returned keyed by customer_id, unknown ones listed as missing."""
+        wanted = [shared_users[0].customer_id, shared_users[3].customer_id, 'UNKNOWN']
+        response = self.post(api_client, {'customer_ids': wanted})
+
+        assert response.status_code == 200
+        data = response.json()
+        assert set(data['results']) == set(wanted[:2])
+        assert data['results'][wanted[0]]['id'] == shared_users[0].id
+        assert len(data['results'][wanted[0]]['relationships']) == 1
+        assert data['missing'] == ['UNKNOWN']
+        assert data['meta']['requested'] == 3
+        assert data['meta']['found'] == 2
+
+    def test_lookup_by_ids(self, api_client, shared_users):
+        """Test users are returned keyed by id, duplicates collapsed."""
+        user = shared_users[1]
+        data = self.post(api_client, {'ids': [user.id, user.id, 999999]}).json()
+
+        assert list(data['results']) == [str(user.id)]
+        assert data['results'][str(user.id)]['customer_id'] == user.customer_id
+        assert data['missing'] == [999999]
+        assert data['meta']['requested'] == 2
+
+    def test_single_round_trip(self, api_client, shared_users, django_assert_num_queries):
+        """Test users and relationships are fetched in two queries regardless of batch size."""
+        with django_assert_num_queries(2):
+            self.post(api_client, {'customer_ids': [user.customer_id for user in shared_users]})
+
+    def test_requires_exactly_one_identifier_list(self, api_client, shared_users):
+        """Test requests with neither or both identifier lists are rejected."""
+        assert self.post(api_client, {}).status_code == 400
+        assert self.post(api_client, {'ids': [1], 'customer_ids': ['A']}).status_code == 400
+        assert self.post(api_client, {'ids': []}).status_code == 400
+
+    def test_batch_size_limit(self, api_client, settings):
+        """Test batches above LOOKUP_MAX_IDS are rejected."""
+        response = self.post(api_client, {'ids': list(range(1, settings.LOOKUP_MAX_IDS + 2))})
+        assert response.status_code == 400
+
+
+@pytest.mark.django_db
+class TestConditionalListRequests:
+    """Test cases for ETag / If-None-Match on the list endpoints."""
+
+    def test_not_modified_from_cache(self, api_client, shared_users):
+        """Test a matching If-None-Match gets an empty 304 with the same ETag."""
+        url = reverse('appuser-list')
+        first = api_client.get(url)
+        etag = first['ETag']
+        assert etag.startswith('W/"') and first.json()['meta']['etag'] == etag
+
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 304
+        assert response.content == b''
+        assert response['ETag'] == etag
+
+    def test_etag_survives_cache_expiry(self, api_client, shared_users):
+        """Test re-rendering an unchanged page gives the same ETag, and a 304."""
+        url = reverse('appuser-list')
+        etag = api_client.get(url)['ETag']
+        clear_redis()
+        clear_local()
+
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=f'"other", {etag}')
+
+        assert response.status_code == 304
+
+    def test_changed_page_gets_new_etag(self, api_client, shared_users):
+        """Test an edit of a listed user changes the ETag of a re-rendered page."""
+        url = reverse('appuser-list')
+        etag = api_client.get(url)['ETag']
+        user = shared_users[0]
+        user.first_name = 'Changed'
+        user.save()
+        clear_redis()
+        clear_local()
+
+        response = api_client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+
+    def test_etag_differs_per_query(self, api_client, shared_users):
+        """Test pages of different queries do not share ETags."""
+        url = reverse('appuser-list')
+        etag = api_client.get(url)['ETag']
+
+        response = api_client.get(url, {'ordering': 'id'}, HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 200
+
+    @pytest.mark.parametrize('cached', [True, False])
+    def test_etag_differs_per_format(self, api_client, shared_users, cached):
+        """Test a JSON ETag does not revalidate the same page asked for in another format."""
+        url = reverse('appuser-list')
+        etag = api_client.get(url)['ETag']
+        if not cached:
+            clear_redis()
+            clear_local()
+
+        response = api_client.get(url, HTTP_ACCEPT='application/vnd.crm.columnar+json', HTTP_IF_NONE_MATCH=etag)
+
+        assert response.status_code == 200
+        assert response['ETag'] != etag
+        assert response.json()['meta']['etag'] == response['ETag']
+        assert api_client.get(url, HTTP_IF_NONE_MATCH=etag).status_code == 304
+
+    def test_cache_headers(self, api_client, settings, shared_users):
+        """Test responses are private by default, must be revalidated and vary on Accept."""
+        settings.LIST_HTTP_MAX_AGE = 30
+        response = api_client.get(reverse('appuser-list'))
+
+        assert set(response['Cache-Control'].split(', ')) == {'private', 'max-age=30', 'must-revalidate'}
+        assert 'Accept' in response['Vary']
+
+    def test_public_cache_scope_is_opt_in(self, api_client, settings, shared_users):
+        """Test shared caches are only allowed to store pages when configured."""
+        settings.LIST_HTTP_CACHE_SCOPE = 'public'
+        response = api_client.get(reverse('appuser-list'))
+
+        assert 'public' in response['Cache-Control'].split(', ')
+        assert 'private' not in response['Cache-Control']
+
+    def test_async_view(self, shared_users):
+        """Test the async endpoint honours If-None-Match as well."""
+        client = AsyncClient()
+        url = reverse('appuser-list-async')
+        etag = async_to_sync(client.get)(url)['ETag']
+
+        response = async_to_sync(client.get)(url, headers={'If-None-Match': etag})
+
+        assert response.status_code == 304
+        assert response['ETag'] == etag
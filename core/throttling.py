@@ -0,0 +1,225 @@
+"""
+Cost-weighted rate limiting and per-client concurrency caps.
+
+Every client (the user for authenticated requests, else the client IP as
+DRF determines it) has a token bucket in Redis holding up to
+``THROTTLE_BURST`` tokens and refilled at ``THROTTLE_RATE`` tokens per
+second. A request takes tokens according to its cost, which views give
+with ``get_throttle_cost``: for the list endpoint a page already in the
+cache costs ``THROTTLE_CACHE_HIT_COST``, any other its estimated database
+cost (``list_request_cost``), where wide and deep pages, partial-match and
+relationship filters cost more. Polling cached pages is barely limited
+while uncached scans are.
+
+On top of that, at most ``THROTTLE_MAX_CONCURRENT`` requests of a client are
+in flight at once. Slots are released when the response is finalized
+(``ThrottledViewMixin``); a slot left behind by a crashed worker expires
+after ``THROTTLE_SLOT_TTL`` seconds.
+
+Rejected requests get a 429 with ``Retry-After``. Both checks run as Lua
+scripts against Redis time, so all processes share one budget per client.
+DRF views take ``ThrottledViewMixin``; plain (async) views call ``admit``
+and ``release_slot`` themselves.
+Without the django_redis backend, or with ``THROTTLE_ENABLED`` off, nothing
+is limited; requests of the cache warmer are never limited.
+"""
+
+import math
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from rest_framework.exceptions import Throttled
+from rest_framework.throttling import BaseThrottle
+
+from core.cache import is_django_redis, is_refresh_request, redis_connection, redis_script
+
+BUCKET_KEY_PREFIX = "throttle:bucket:"
+SLOTS_KEY_PREFIX = "throttle:slots:"
+
+# Estimated cost of a list request, in tokens (see list_request_cost)
+ROWS_PER_TOKEN = 100
+OFFSET_ROWS_PER_TOKEN = 10000
+PARTIAL_MATCH_FILTER_COST = 2
+RELATIONSHIP_FILTER_COST = 5
+PARTIAL_MATCH_FILTERS = {"first_name", "last_name", "phone_number", "city", "street", "country"}
+RELATIONSHIP_FILTERS = {"points_min", "points_max", "last_activity_after"}
+
+# Refill, then take ARGV[3] tokens if there are enough. Returns {taken, seconds to wait}
+TAKE_SCRIPT = """
+local rate, capacity, cost = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'at')
+local tokens = tonumber(state[1]) or capacity
+tokens = math.min(capacity, tokens + math.max(0, now - (tonumber(state[2]) or now)) * rate)
+local taken, wait = 0, 0
+if tokens >= cost then
+    tokens = tokens - cost
+    taken = 1
+else
+    wait = (cost - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+return {taken, tostring(wait)}
+"""
+
+# Give back ARGV[1] tokens, never beyond the capacity
+REFUND_SCRIPT = """
+local tokens = tonumber(redis.call('HGET', KEYS[1], 'tokens'))
+if tokens then
+    redis.call('HSET', KEYS[1], 'tokens', tostring(math.min(tonumber(ARGV[2]), tokens + tonumber(ARGV[1]))))
+end
+return 1
+"""
+
+# Take one of ARGV[1] concurrency slots, dropping slots older than ARGV[2] seconds
+ACQUIRE_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now - tonumber(ARGV[2]))
+if redis.call('ZCARD', KEYS[1]) >= tonumber(ARGV[1]) then
+    return 0
+end
+redis.call('ZADD', KEYS[1], now, ARGV[3])
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+
+def _positive_int(value, default):
+    try:
+        return max(1, int(value))
+    except (TypeError, ValueError):
+        return default
+
+
+def list_request_cost(params, page_size=10, max_page_size=1000):
+    """Estimated cost in tokens of a list request with the query ``params``."""
+    page_size = min(_positive_int(params.get("page_size"), page_size), max_page_size)
+    page = _positive_int(params.get("page"), 1)
+    filters = {name for name in PARTIAL_MATCH_FILTERS | RELATIONSHIP_FILTERS if (params.get(name) or "").strip()}
+    return (
+        math.ceil(page_size / ROWS_PER_TOKEN)
+        + (page - 1) * page_size // OFFSET_ROWS_PER_TOKEN
+        + PARTIAL_MATCH_FILTER_COST * len(filters & PARTIAL_MATCH_FILTERS)
+        + RELATIONSHIP_FILTER_COST * len(filters & RELATIONSHIP_FILTERS)
+    )
+
+
+def _key(prefix, ident):
+    return cache.make_key(f"{prefix}{ident}")
+
+
+
+def take_tokens(ident, cost):
+    """Take ``cost`` tokens from the client's bucket. Returns ``(taken, seconds to wait)``."""
+    cost = min(cost, settings.THROTTLE_BURST)
+    taken, wait = redis_script(TAKE_SCRIPT)(
+        keys=[_key(BUCKET_KEY_PREFIX, ident)],
+        args=[settings.THROTTLE_RATE, settings.THROTTLE_BURST, cost],
+    )
+    return bool(taken), float(wait)
+
+
+def refund_tokens(ident, tokens):
+    if tokens > 0:
+        redis_script(REFUND_SCRIPT)(keys=[_key(BUCKET_KEY_PREFIX, ident)], args=[tokens, settings.THROTTLE_BURST])
+
+
+def acquire_slot(ident):
+    """Take a concurrency slot for the client; returns its id, ``None`` when all are taken."""
+    slot = uuid.uuid4().hex
+    acquired = redis_script(ACQUIRE_SCRIPT)(
+        keys=[_key(SLOTS_KEY_PREFIX, ident)],
+        args=[settings.THROTTLE_MAX_CONCURRENT, settings.THROTTLE_SLOT_TTL, slot],
+    )
+    return slot if acquired else None
+
+
+def release_slot(ident, slot):
+    redis_connection().zrem(_key(SLOTS_KEY_PREFIX, ident), slot)
+
+
+def is_active(request):
+    """Whether ``request`` is limited at all."""
+    return settings.THROTTLE_ENABLED and not is_refresh_request(request) and is_django_redis()
+
+
+def client_ident(request, user=None):
+    """
+    ``user:<pk>`` for an authenticated ``user``, else the client address as
+    DRF determines it: ``REMOTE_ADDR``, or the ``X-Forwarded-For`` entry
+    added by the last of ``NUM_PROXIES`` trusted proxies.
+    """
+    if user is not None and user.is_authenticated:
+        return f"user:{user.pk}"
+    return BaseThrottle().get_ident(request)
+
+
+def admit(ident, cost):
+    """
+    Take ``cost`` tokens and a concurrency slot for the client ``ident``.
+    Returns ``(state, None)`` with the ``{"ident", "slot"}`` to release, or
+    ``(None, seconds to retry after)`` when the request is rejected.
+    """
+    taken, wait = take_tokens(ident, cost)
+    if not taken:
+        return None, wait
+
+    slot = None
+    if settings.THROTTLE_MAX_CONCURRENT > 0:
+        slot = acquire_slot(ident)
+        if slot is None:
+            refund_tokens(ident, cost)
+            return None, 1
+    return {"ident": ident, "slot": slot}, None
+
+
+def retry_after_seconds(wait):
+    return max(1, math.ceil(wait))
+
+
+def throttled_response(wait):
+    """The 429 of a rejected request, for views outside DRF, with the body DRF sends."""
+    seconds = retry_after_seconds(wait)
+    response = JsonResponse({"detail": str(Throttled(seconds).detail)}, status=429)
+    response["Retry-After"] = str(seconds)
+    return response
+
+
+class CostThrottle(BaseThrottle):
+    """
+    DRF throttle taking ``view.get_throttle_cost(request)`` tokens (1 without
+    that method) and a concurrency slot, which is kept on the request for
+    ``ThrottledViewMixin`` to release.
+    """
+
+    def allow_request(self, request, view):
+        self.retry_after = None
+        if not is_active(request):
+            return True
+
+        cost = view.get_throttle_cost(request) if hasattr(view, "get_throttle_cost") else 1
+        state, self.retry_after = admit(client_ident(request, request.user), cost)
+        if state is None:
+            return False
+        request.throttle_state = state
+        return True
+
+    def wait(self):
+        return None if self.retry_after is None else retry_after_seconds(self.retry_after)
+
+
+class ThrottledViewMixin:
+    """Apply ``CostThrottle`` to a DRF view and release the concurrency slot with the response."""
+    throttle_classes = [CostThrottle]
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        state = getattr(request, "throttle_state", None)
+        if state is not None and state["slot"] is not None:
+            release_slot(state["ident"], state["slot"])
+            state["slot"] = None
+        return super().finalize_response(request, response, *args, **kwargs)
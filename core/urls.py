@@ -1,6 +1,36 @@
 from django.urls import path
-from core.views import AppUserListView
+from core.views import (
+    AppUserAnalyticsView,
+    AppUserAsyncListView,
+    AppUserAutocompleteView,
+    AppUserChangesView,
+    AppUserIngestView,
+    AppUserListView,
+    AppUserLookupView,
+    AppUserSegmentView,
+    CacheClearView,
+    CacheStatsView,
+    JobCancelView,
+    JobDetailView,
+    JobListView,
+    ProfileDownloadView,
+    ProfileListView,
+)
 
 urlpatterns = [
     path('appusers/', AppUserListView.as_view(), name='appuser-list'),
+    path('appusers/async/', AppUserAsyncListView.as_view(), name='appuser-list-async'),
+    path('appusers/lookup/', AppUserLookupView.as_view(), name='appuser-lookup'),
+    path('appusers/analytics/', AppUserAnalyticsView.as_view(), name='appuser-analytics'),
+    path('appusers/segment/', AppUserSegmentView.as_view(), name='appuser-segment'),
+    path('appusers/autocomplete/', AppUserAutocompleteView.as_view(), name='appuser-autocomplete'),
+    path('appusers/ingest/', AppUserIngestView.as_view(), name='appuser-ingest'),
+    path('appusers/changes/', AppUserChangesView.as_view(), name='appuser-changes'),
+    path('appusers/cache-stats/', CacheStatsView.as_view(), name='appuser-cache-stats'),
+    path('appusers/cache-clear/', CacheClearView.as_view(), name='appuser-cache-clear'),
+    path('jobs/', JobListView.as_view(), name='job-list'),
+    path('jobs/<str:job_id>/', JobDetailView.as_view(), name='job-detail'),
+    path('jobs/<str:job_id>/cancel/', JobCancelView.as_view(), name='job-cancel'),
+    path('profiles/', ProfileListView.as_view(), name='profile-list'),
+    path('profiles/<str:profile_id>/', ProfileDownloadView.as_view(), name='profile-download'),
 ]
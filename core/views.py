@@ -1,40 +1,80 @@
+import math
 import time
-from django.core.cache import cache
+from datetime import timedelta
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.forms import ValidationError
-from rest_framework.generics import ListAPIView
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import NotFound, ValidationError as DRFValidationError
+from rest_framework.generics import GenericAPIView, ListAPIView
+from rest_framework.permissions import IsAdminUser
+from rest_framework.views import APIView
+from rest_framework.request import Request
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from common.pagination import DefaultPagination
-from core.filters import build_appuser_filters
+from common.parsers import NDJSONParser
+from common.renderers import ORJSONRenderer, compact_renderer_classes
+from core import cache as list_cache
+from core.cache import get_page, is_refresh_request, list_cache_key, record_request, set_page, tier_stats
+from core import analytics, autocomplete, bitmaps, changes, compression, ingest, jobs, profiling, throttling
+from core.filters import active_filter_params, build_appuser_filters
 from core.models import AppUser, CustomerRelationship
-from core.serializers import AppUserSerializer
+from core.serializers import AppUserLookupSerializer, AppUserSerializer, CacheClearSerializer, JobCreateSerializer
+from core.snapshot import segment
 from rest_framework.filters import OrderingFilter
-from django.db.models import Prefetch
+from django.db.models import Prefetch, aprefetch_related_objects
 
-class AppUserListView(ListAPIView):
+class AppUserQueryMixin:
+    """Queryset building shared by the views that serialize full AppUser rows."""
+
+    def get_relationship_prefetch(self):
+        queryset = CustomerRelationship.objects.select_related().order_by('-created')
+        if settings.RELATIONSHIP_PREFETCH_WINDOW_DAYS:
+            # A bound on created lets PostgreSQL skip the older partitions
+            since = timezone.now() - timedelta(days=settings.RELATIONSHIP_PREFETCH_WINDOW_DAYS)
+            queryset = queryset.filter(created__gte=since)
+        return Prefetch('relationships', queryset=queryset)
+
+    def get_base_queryset(self, prefetch=True):
+        base_qs = AppUser.objects.select_related("address")
+        if prefetch:
+            base_qs = base_qs.prefetch_related(self.get_relationship_prefetch())
+        return base_qs.only(
+            "id", "first_name", "last_name", "gender", "customer_id", 
+            "phone_number", "created", "birthday", "last_updated",
+            "address__street", "address__street_number", "address__city", 
+            "address__country", "address__city_code"
+        )
+
+
+class AppUserListView(throttling.ThrottledViewMixin, AppUserQueryMixin, ListAPIView):
     serializer_class = AppUserSerializer
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *compact_renderer_classes()]
     pagination_class = DefaultPagination
     filter_backends = [OrderingFilter]
     ordering_fields = "__all__"
     ordering = ["-created"]
 
-    def get_queryset(self):
+    cached_page = None
 
-        relationship_prefetch = Prefetch(
-            'relationships',
-            queryset=CustomerRelationship.objects.select_related().order_by('-created')
+    def get_throttle_cost(self, request):
+        # Look the page up here so that cache hits are charged as such; list() reuses the result
+        self.cached_page = self.get_cached_page(request)
+        if self.cached_page[0] is not None:
+            return settings.THROTTLE_CACHE_HIT_COST
+        return throttling.list_request_cost(
+            request.query_params, self.pagination_class.page_size, self.pagination_class.max_page_size
         )
 
-        base_qs = AppUser.objects.select_related("address") \
-            .prefetch_related(relationship_prefetch)
-        
-        filtered_qs = self.apply_filters(base_qs)
+    def get_cached_page(self, request):
+        """``(cached data, tier)``, ``(None, None)`` on a miss or for the cache warmer."""
+        return (None, None) if is_refresh_request(request) else get_page(list_cache_key(request))
 
-        return filtered_qs.only(
-            "id", "first_name", "last_name", "gender", "customer_id", 
-            "phone_number", "created", "birthday", "last_updated",
-            "address__street", "address__street_number", "address__city", 
-            "address__country", "address__city_code"
-        )
+    def get_queryset(self, prefetch=True):
+        return self.apply_filters(self.get_base_queryset(prefetch=prefetch))
     
     def apply_filters(self, queryset):
         try:
@@ -45,29 +85,506 @@ class AppUserListView(ListAPIView):
             return queryset
         except ValueError as e:
             raise ValidationError({'error': 'Invalid filter parameters', 'details': str(e)})
+
+    def paginate_queryset(self, queryset):
+        # Counts (and pages ordered by id) come from the bitmap index when it covers the filters
+        indexed = bitmaps.indexed_results(queryset, self.request.query_params)
+        return super().paginate_queryset(queryset if indexed is None else indexed)
     
     def list(self, request, *args, **kwargs):
         total_start = time.time()
-        cache_key = f"appusers::{request.get_full_path()}"
-        cached_response = cache.get(cache_key)
+        cache_key = list_cache_key(request)
+        record_request(request)
+        cached_response, cache_tier = self.cached_page or self.get_cached_page(request)
         if cached_response is not None:
-            response = Response(cached_response)
-            response.data['meta'] = {
+            etag = list_cache.format_etag(cached_response['meta'].get('etag'), request.accepted_renderer.format)
+            if list_cache.etag_matches(request, etag):
+                return list_cache.patch_list_cache_headers(Response(status=304), etag)
+            meta = {
                 'query_time': 0,  # No DB query
                 'response_time': time.time() - total_start,
-                'cache_hit': True
+                'cache_hit': True,
+                'cache_tier': cache_tier,
+                'etag': etag,
             }
-            return response
+            response = self.encoded_response(request, cache_key, meta)
+            if response is None:
+                # A copy: the cached page keeps the page's own ETag in its meta
+                response = Response({**cached_response, 'meta': meta})
+            return list_cache.patch_list_cache_headers(response, etag)
         
         start_time = time.time()
         response = super().list(request, *args, **kwargs)
         query_time = time.time() - start_time
 
-        response.data['meta'] = {
+        page_etag = list_cache.page_etag(cache_key, response.data)
+        # Compressed before caching, so that hits are sent as they are
+        bodies = compression.encode_prefix(ORJSONRenderer().render(response.data))
+        meta = {
             'query_time': query_time,
             'response_time': time.time() - total_start,
-            'cache_hit': False
+            'cache_hit': False,
+            'cache_tier': None,
+            'etag': page_etag,
         }
+        set_page(cache_key, {**response.data, 'meta': meta}, timeout=settings.LIST_CACHE_TIMEOUT)
+        list_cache.set_page_bodies(cache_key, bodies, timeout=settings.LIST_CACHE_TIMEOUT)
 
-        cache.set(cache_key, response.data, timeout=60 * 10)
+        etag = list_cache.format_etag(page_etag, request.accepted_renderer.format)
+        response.data['meta'] = {**meta, 'etag': etag}
+        if list_cache.etag_matches(request, etag):
+            return list_cache.patch_list_cache_headers(Response(status=304), etag)
+        encoded = self.encoded_response(request, cache_key, response.data['meta'], bodies)
+        return list_cache.patch_list_cache_headers(encoded or response, etag)
+
+    def encoded_response(self, request, cache_key, meta, bodies=None):
+        """
+        The page as its pre-compressed body followed by ``meta``, or ``None``
+        when the client wants another format or no gzip/zstd, or the body is
+        not stored (pages under ``COMPRESSION_MIN_BYTES``).
+        """
+        renderer = request.accepted_renderer
+        if not settings.COMPRESSION_ENABLED or renderer.format != 'json':
+            return None
+        if renderer.get_indent(request.accepted_media_type, {}):
+            return None
+        encoding = compression.choose_encoding(request.headers.get('Accept-Encoding'), compression.CONCATENABLE)
+        if encoding is None:
+            return None
+        body = bodies.get(encoding) if bodies is not None else list_cache.get_page_body(cache_key, encoding)
+        if body is None:
+            return None
+
+        body += compression.encode_suffix(ORJSONRenderer().render(meta), encoding)
+        response = HttpResponse(body, content_type=renderer.media_type)
+        response['Content-Encoding'] = encoding
         return response
+
+
+class AppUserAsyncListView(View):
+    """
+    Async variant of AppUserListView for ASGI deployments.
+
+    Filtering, ordering, page size limits and the response shape are the
+    same as the sync view (its queryset and ordering logic are reused), but
+    the cache round trips, the COUNT, the page query and the relationship
+    prefetch are all awaited, so a waiting request holds a socket rather
+    than a worker thread. Requests are throttled like the sync view's (see
+    core/throttling.py), the concurrency slot released once answered.
+    """
+
+    # The only format self.render produces
+    format = 'json'
+
+    async def get(self, request, *args, **kwargs):
+        total_start = time.time()
+        cache_key = list_cache_key(request, await list_cache.acurrent_generation())
+        await list_cache.arecord_request(request)
+        cached_response, cache_tier = (
+            (None, None) if is_refresh_request(request) else await list_cache.aget_page(cache_key)
+        )
+        throttle_state = None
+        if throttling.is_active(request):
+            cost = settings.THROTTLE_CACHE_HIT_COST if cached_response is not None else throttling.list_request_cost(
+                request.GET, DefaultPagination.page_size, DefaultPagination.max_page_size
+            )
+            ident = throttling.client_ident(request, await request.auser())
+            throttle_state, wait = await sync_to_async(throttling.admit)(ident, cost)
+            if throttle_state is None:
+                return throttling.throttled_response(wait)
+        try:
+            return await self.respond(request, total_start, cache_key, cached_response, cache_tier)
+        finally:
+            if throttle_state is not None and throttle_state['slot'] is not None:
+                await sync_to_async(throttling.release_slot)(throttle_state['ident'], throttle_state['slot'])
+
+    async def respond(self, request, total_start, cache_key, cached_response, cache_tier):
+        if cached_response is not None:
+            etag = list_cache.format_etag(cached_response['meta'].get('etag'), self.format)
+            if list_cache.etag_matches(request, etag):
+                return list_cache.patch_list_cache_headers(HttpResponse(status=304), etag)
+            meta = {
+                'query_time': 0,  # No DB query
+                'response_time': time.time() - total_start,
+                'cache_hit': True,
+                'cache_tier': cache_tier,
+                'etag': etag,
+            }
+            return list_cache.patch_list_cache_headers(self.render({**cached_response, 'meta': meta}), etag)
+
+        start_time = time.time()
+        list_view = self.get_list_view(request)
+        queryset = list_view.filter_queryset(list_view.get_queryset(prefetch=False))
+        paginator = list_view.paginator
+        page_size = paginator.get_page_size(list_view.request)
+
+        indexed = await sync_to_async(bitmaps.indexed_results)(queryset, request.GET)
+        if indexed is not None:
+            queryset = indexed
+            count = indexed.count()
+        else:
+            count = await queryset.acount()
+        num_pages = max(math.ceil(count / page_size), 1)
+        page_number = self.get_page_number(list_view.request, paginator, num_pages)
+        if page_number is None:
+            return JsonResponse({'detail': 'Invalid page.'}, status=404)
+
+        offset = (page_number - 1) * page_size
+        users = [user async for user in queryset[offset:offset + page_size]]
+        await aprefetch_related_objects(users, list_view.get_relationship_prefetch())
+
+        serializer = AppUserSerializer(users, many=True, context={'request': list_view.request})
+        data = {
+            'count': count,
+            'page': page_number,
+            'pages': num_pages,
+            'results': serializer.data
+        }
+        query_time = time.time() - start_time
+
+        page_etag = list_cache.page_etag(cache_key, data)
+        meta = {
+            'query_time': query_time,
+            'response_time': time.time() - total_start,
+            'cache_hit': False,
+            'cache_tier': None,
+            'etag': page_etag,
+        }
+        await list_cache.aset_page(cache_key, {**data, 'meta': meta}, timeout=settings.LIST_CACHE_TIMEOUT)
+
+        etag = list_cache.format_etag(page_etag, self.format)
+        data['meta'] = {**meta, 'etag': etag}
+        if list_cache.etag_matches(request, etag):
+            return list_cache.patch_list_cache_headers(HttpResponse(status=304), etag)
+        return list_cache.patch_list_cache_headers(self.render(data), etag)
+
+    def get_list_view(self, request):
+        """A sync list view bound to this request, used for its queryset and ordering logic"""
+        list_view = AppUserListView()
+        list_view.setup(request)
+        list_view.request = Request(request)
+        list_view.format_kwarg = None
+        return list_view
+
+    def get_page_number(self, request, paginator, num_pages):
+        page_number = request.query_params.get(paginator.page_query_param) or 1
+        if page_number in paginator.last_page_strings:
+            return num_pages
+        try:
+            page_number = int(page_number)
+        except (TypeError, ValueError):
+            return None
+        if not 1 <= page_number <= num_pages:
+            return None
+        return page_number
+
+    def render(self, data):
+        return HttpResponse(ORJSONRenderer().render(data), content_type='application/json')
+
+
+class AppUserLookupView(AppUserQueryMixin, GenericAPIView):
+    """
+    Resolve many AppUsers at once by ``customer_ids`` or ``ids``.
+
+    All rows are fetched with one indexed ``IN`` query (Postgres turns the
+    list into ``= ANY(array)``) with the address joined in, plus one batched
+    query for their relationships, instead of one list request per id.
+    Results are keyed by the identifier that was asked for; identifiers
+    without a match are listed under ``missing``.
+    """
+    serializer_class = AppUserLookupSerializer
+    renderer_classes = [*api_settings.DEFAULT_RENDERER_CLASSES, *compact_renderer_classes()]
+
+    def post(self, request, *args, **kwargs):
+        start_time = time.time()
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        field, values = serializer.lookup
+
+        users = self.get_base_queryset().filter(**{f'{field}__in': values})
+        rows = AppUserSerializer(users, many=True, context=self.get_serializer_context()).data
+        results = {str(row[field]): row for row in rows}
+
+        return Response({
+            'results': results,
+            'missing': [value for value in values if str(value) not in results],
+            'meta': {
+                'query_time': time.time() - start_time,
+                'requested': len(values),
+                'found': len(results),
+            }
+        })
+
+
+class AppUserAnalyticsView(APIView):
+    """
+    Grouped counts over AppUsers: ``?group_by=country|gender|signup_month|points_bucket``
+    plus any of the list endpoint's filters.
+
+    Unfiltered requests are answered from the rollup table when it has been
+    built (see ``refresh_rollups``); filtered ones are aggregated live and
+    cached like list pages.
+    """
+
+    def get(self, request, *args, **kwargs):
+        start_time = time.time()
+        dimension = request.query_params.get('group_by')
+        if dimension not in analytics.DIMENSIONS:
+            raise DRFValidationError({'group_by': f"Expected one of: {', '.join(analytics.DIMENSIONS)}"})
+
+        if not active_filter_params(request.query_params):
+            results, refreshed_at = analytics.rollup_counts(dimension)
+            if results is not None:
+                return Response(self.build_data(dimension, results, 'rollup', start_time, refreshed_at))
+
+        cache_key = list_cache_key(request)
+        cached_data, cache_tier = get_page(cache_key)
+        if cached_data is not None:
+            cached_data['meta'] = {**cached_data['meta'], 'cache_hit': True, 'cache_tier': cache_tier}
+            return Response(cached_data)
+
+        results = analytics.live_counts(dimension, request.query_params)
+        data = self.build_data(dimension, results, 'live', start_time)
+        set_page(cache_key, data, timeout=settings.LIST_CACHE_TIMEOUT)
+        return Response(data)
+
+    def build_data(self, dimension, results, source, start_time, refreshed_at=None):
+        return {
+            'group_by': dimension,
+            'total': sum(row['count'] for row in results),
+            'results': results,
+            'meta': {
+                'source': source,
+                'refreshed_at': refreshed_at,
+                'query_time': time.time() - start_time,
+                'cache_hit': False,
+                'cache_tier': None,
+            }
+        }
+
+
+class AppUserSegmentView(APIView):
+    """
+    Size a segment: the number of AppUsers matching the list filters and
+    the first ``limit`` of their ids, answered from the columnar snapshot
+    when it is fresh and supports the filters, from the database otherwise.
+    """
+
+    def get(self, request, *args, **kwargs):
+        start_time = time.time()
+        try:
+            limit = min(int(request.query_params.get('limit', 1000)), settings.LOOKUP_MAX_IDS)
+        except ValueError:
+            raise DRFValidationError({'limit': 'Expected an integer.'})
+
+        result = segment(request.query_params, max(limit, 0))
+        return Response({
+            'count': result['count'],
+            'ids': result['ids'],
+            'meta': {
+                'source': result['source'],
+                'snapshot_built_at': result['snapshot_built_at'],
+                'query_time': time.time() - start_time,
+            }
+        })
+
+
+class AppUserAutocompleteView(APIView):
+    """
+    Type-ahead search for customer support: ``?q=<text>&limit=<n>`` returns
+    the users whose first name, last name, city or customer id start with
+    every word of ``q``, tolerating a typo per word (see core/autocomplete.py).
+    """
+
+    def get(self, request, *args, **kwargs):
+        start_time = time.time()
+        try:
+            limit = min(int(request.query_params.get('limit', 10)), settings.AUTOCOMPLETE_MAX_LIMIT)
+        except ValueError:
+            raise DRFValidationError({'limit': 'Expected an integer.'})
+
+        results = autocomplete.suggest(request.query_params.get('q', ''), max(limit, 0))
+        return Response({
+            'results': results,
+            'meta': {
+                'query_time': time.time() - start_time,
+                'terms': len(autocomplete.index),
+            }
+        })
+
+
+class AppUserIngestView(APIView):
+    """
+    Bulk upsert of customers from an ``application/x-ndjson`` body, one
+    customer per line (see core/ingest.py for the format). Responds with
+    the counts and the errors of the rejected lines; valid lines are
+    written either way.
+    """
+    parser_classes = [NDJSONParser]
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, *args, **kwargs):
+        start_time = time.time()
+        result = ingest.ingest(
+            request.data,
+            batch_size=settings.INGEST_BATCH_SIZE,
+            max_rows=settings.INGEST_MAX_ROWS,
+        )
+        return Response({**result.as_dict(), 'meta': {'query_time': time.time() - start_time}})
+
+
+class AppUserChangesView(AppUserQueryMixin, APIView):
+    """
+    Incremental sync: ``?token=<token from the previous response>&limit=<n>``.
+
+    Returns the AppUsers changed (``upsert`` with the full row, as in the
+    list endpoint) or deleted (``delete``) since the token, oldest first.
+    Without a token the feed starts with every current user. Keep calling
+    with ``next_token`` until ``has_more`` is false, then poll with it.
+    """
+
+    def get(self, request, *args, **kwargs):
+        start_time = time.time()
+        try:
+            limit = int(request.query_params.get('limit', settings.CHANGES_PAGE_SIZE))
+        except ValueError:
+            raise DRFValidationError({'limit': 'Expected an integer.'})
+        limit = min(max(limit, 1), settings.CHANGES_MAX_PAGE_SIZE)
+
+        try:
+            events, next_token, has_more = changes.changes_since(request.query_params.get('token'), limit)
+        except changes.ExpiredToken as e:
+            return Response({'detail': str(e)}, status=410)
+        except changes.InvalidToken as e:
+            raise DRFValidationError({'token': str(e)})
+
+        upserted = [user_id for op, _, user_id, _ in events if op == 'upsert']
+        users = self.get_base_queryset().filter(id__in=upserted).order_by()
+        rows = {row['id']: row for row in AppUserSerializer(users, many=True).data}
+
+        results = []
+        for op, changed_at, user_id, customer_id in events:
+            # A user deleted since it was read is reported by its tombstone
+            if op == 'upsert' and user_id not in rows:
+                continue
+            results.append({
+                'op': op,
+                'id': user_id,
+                'customer_id': customer_id,
+                'changed_at': changed_at,
+                'data': rows.get(user_id) if op == 'upsert' else None,
+            })
+
+        return Response({
+            'results': results,
+            'next_token': next_token,
+            'has_more': has_more,
+            'meta': {'query_time': time.time() - start_time},
+        })
+
+
+class JobListView(GenericAPIView):
+    """
+    Background jobs (see core/jobs.py). ``GET`` lists the most recent jobs
+    (``?limit=<n>``), ``POST {"task": ..., "params": {...}}`` queues one for
+    the ``run_jobs`` workers and responds 202 with the job.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = JobCreateSerializer
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+        except ValueError:
+            raise DRFValidationError({'limit': 'Expected an integer.'})
+        return Response({
+            'results': [job.as_dict() for job in jobs.recent_jobs(limit)],
+            'tasks': sorted(jobs.TASKS),
+        })
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = jobs.enqueue(serializer.validated_data['task'], **serializer.validated_data['params'])
+        return Response(job.as_dict(), status=202)
+
+
+class JobDetailView(APIView):
+    """Status, progress and result of one job."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, job_id, *args, **kwargs):
+        job = jobs.get_job(job_id)
+        if job is None:
+            raise NotFound('Unknown job.')
+        return Response(job.as_dict())
+
+
+class JobCancelView(APIView):
+    """Cancel a queued job, or ask a running one to stop at its next progress report."""
+    permission_classes = [IsAdminUser]
+
+    def post(self, request, job_id, *args, **kwargs):
+        job = jobs.cancel(job_id)
+        if job is None:
+            raise NotFound('Unknown job.')
+        return Response(job.as_dict(), status=202 if job.status == jobs.RUNNING else 200)
+
+
+class CacheClearView(GenericAPIView):
+    """
+    Delete the cache keys matching ``pattern`` (e.g. ``appusers::*country=Germany*``).
+    ``dry_run`` counts them right away; otherwise the deletion is queued as a
+    ``clear_cache`` job (202 with the job), since it is rate limited and can
+    take a while on a large cache.
+    """
+    permission_classes = [IsAdminUser]
+    serializer_class = CacheClearSerializer
+
+    def post(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        params = serializer.validated_data
+        if not list_cache.is_django_redis():
+            raise DRFValidationError({'pattern': 'Pattern deletion requires the django_redis cache backend.'})
+
+        if params['dry_run']:
+            start_time = time.time()
+            matched = list_cache.delete_matching(params['pattern'], batch_size=params['batch_size'], dry_run=True)
+            return Response({'pattern': params['pattern'], 'matched': matched,
+                             'meta': {'query_time': time.time() - start_time}})
+
+        job = jobs.enqueue('clear_cache', **params)
+        return Response(job.as_dict(), status=202)
+
+
+class ProfileListView(APIView):
+    """Recent request profiles (see core/profiling.py), newest first: ``?limit=<n>``."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, *args, **kwargs):
+        try:
+            limit = min(max(int(request.query_params.get('limit', 50)), 1), 500)
+        except ValueError:
+            raise DRFValidationError({'limit': 'Expected an integer.'})
+        return Response({'results': profiling.get_storage().recent(limit)})
+
+
+class ProfileDownloadView(APIView):
+    """One profile as a speedscope file, to open at https://www.speedscope.app."""
+    permission_classes = [IsAdminUser]
+
+    def get(self, request, profile_id, *args, **kwargs):
+        document = profiling.get_storage().load(profile_id)
+        if document is None:
+            raise NotFound('Unknown profile.')
+        response = HttpResponse(document, content_type='application/json')
+        response['Content-Disposition'] = f'attachment; filename="{profile_id}.speedscope.json"'
+        return response
+
+
+class CacheStatsView(APIView):
+    """Hit ratios of the local and Redis cache tiers in the process serving the request."""
+
+    def get(self, request, *args, **kwargs):
+        return Response(tier_stats.as_dict())
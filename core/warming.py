@@ -0,0 +1,176 @@
+"""
+Cache warmer for the AppUser list endpoints.
+
+Takes the most requested signatures recorded by ``core.cache.record_request``
+and re-renders the ones whose cache entry is missing or about to expire, by
+running the real view on a synthetic request. Rendering happens in a small
+thread pool so that warming never occupies more than ``concurrency`` DB
+connections at a time.
+
+Only one warmer runs at a time: a pass holds ``WARM_LOCK_KEY`` under a token
+of its own, pushes its expiry back after every page and releases it only if
+the token still matches. A pass that finds its lock expired and taken by
+another warmer stops rendering, and never releases the other warmer's lock.
+"""
+
+import inspect
+import io
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from urllib.parse import urlsplit
+
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.core.handlers.wsgi import WSGIRequest
+from django.db import connections
+from django.urls import Resolver404, resolve
+
+from core.cache import (
+    is_django_redis,
+    popular_signatures,
+    redis_connection,
+    redis_script,
+    signature_cache_key,
+)
+
+WARM_LOCK_KEY = "appusers:warm-lock"
+WARM_LOCK_TIMEOUT = 300
+
+# Reset the expiry to ARGV[2] seconds if KEYS[1] still holds the token ARGV[1]
+RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+# Delete KEYS[1] if it still holds the token ARGV[1]
+RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+
+class WarmLock:
+    """The warmer lock, held under a token of this run so that it never releases another run's lock."""
+
+    def __init__(self, timeout=WARM_LOCK_TIMEOUT):
+        self.token = uuid.uuid4().hex
+        self.timeout = timeout
+
+    def acquire(self):
+        if is_django_redis():
+            return bool(redis_connection().set(cache.make_key(WARM_LOCK_KEY), self.token, nx=True, ex=self.timeout))
+        return cache.add(WARM_LOCK_KEY, self.token, timeout=self.timeout)
+
+    def renew(self):
+        """Push the expiry back to ``timeout`` seconds. False when the lock is no longer ours."""
+        if is_django_redis():
+            return bool(redis_script(RENEW_SCRIPT)(keys=[cache.make_key(WARM_LOCK_KEY)], args=[self.token, self.timeout]))
+        return cache.get(WARM_LOCK_KEY) == self.token and cache.touch(WARM_LOCK_KEY, self.timeout)
+
+    def release(self):
+        if is_django_redis():
+            redis_script(RELEASE_SCRIPT)(keys=[cache.make_key(WARM_LOCK_KEY)], args=[self.token])
+        elif cache.get(WARM_LOCK_KEY) == self.token:
+            cache.delete(WARM_LOCK_KEY)
+
+
+@dataclass
+class WarmResult:
+    signature: str
+    status: str  # "warmed", "fresh" or "failed"
+    detail: str = ""
+
+
+def needs_refresh(signature, refresh_before):
+    """True when the entry is missing or expires within ``refresh_before`` seconds."""
+    key = signature_cache_key(signature)
+    if is_django_redis():
+        ttl = cache.ttl(key)
+        return ttl is not None and ttl < refresh_before
+    return key not in cache
+
+
+def warm_request(signature):
+    """A bodiless GET of ``signature`` marked as a cache refresh, as the WSGI handler would build it."""
+    url = urlsplit(signature)
+    request = WSGIRequest({
+        "REQUEST_METHOD": "GET",
+        "SCRIPT_NAME": "",
+        "PATH_INFO": url.path,
+        "QUERY_STRING": url.query,
+        "SERVER_NAME": "localhost",
+        "SERVER_PORT": "80",
+        "SERVER_PROTOCOL": "HTTP/1.1",
+        "wsgi.url_scheme": "http",
+        "wsgi.input": io.BytesIO(),
+    })
+    request.cache_refresh = True
+    return request
+
+
+def render_signature(signature):
+    """Run the view for ``signature`` with a cache-refreshing request."""
+    try:
+        match = resolve(urlsplit(signature).path)
+    except Resolver404:
+        return WarmResult(signature, "failed", "no matching URL")
+
+    try:
+        response = match.func(warm_request(signature), *match.args, **match.kwargs)
+        if inspect.isawaitable(response):
+            response = async_to_sync(_await)(response)
+        if hasattr(response, "render"):
+            response.render()
+    except Exception as exc:
+        # One broken page must not abort the rest of the pass
+        return WarmResult(signature, "failed", f"{type(exc).__name__}: {exc}")
+    finally:
+        connections.close_all()
+
+    if response.status_code != 200:
+        return WarmResult(signature, "failed", f"status {response.status_code}")
+    return WarmResult(signature, "warmed")
+
+
+async def _await(awaitable):
+    return await awaitable
+
+
+def warm_popular(top, concurrency, refresh_before, force=False):
+    """
+    Re-render the ``top`` most popular signatures that need it.
+
+    Only one warmer runs at a time across processes; a second concurrent
+    call returns ``None`` without doing anything. Pages not yet started when
+    the lock turns out to be lost are reported as failed.
+    """
+    lock = WarmLock()
+    if not lock.acquire():
+        return None
+
+    try:
+        results = []
+        pending = []
+        for signature in popular_signatures(top):
+            if force or needs_refresh(signature, refresh_before):
+                pending.append(signature)
+            else:
+                results.append(WarmResult(signature, "fresh"))
+
+        with ThreadPoolExecutor(max_workers=max(concurrency, 1)) as pool:
+            futures = [pool.submit(render_signature, signature) for signature in pending]
+            held = True
+            for signature, future in zip(pending, futures):
+                if not held and future.cancel():
+                    results.append(WarmResult(signature, "failed", "warm lock lost"))
+                    continue
+                results.append(future.result())
+                held = held and lock.renew()
+        return results
+    finally:
+        lock.release()